@@ -1,10 +1,40 @@
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from pydantic import BaseModel, ConfigDict, Field, FiniteFloat
+from typing import Annotated, List, Optional, Dict, Any, Callable, Union
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import asyncio
+import bisect
+import csv
+import functools
+import gc
+import glob
+import hashlib
+import hmac
+import inspect
+import io
+import itertools
+import json
+import math
+import mmap
+import multiprocessing
 import os
+import random
+import re
+import secrets
+import shutil
+import struct
+import sys
+import threading
+import time
+import tracemalloc
 import uuid
-from datetime import datetime, timedelta
+import zlib
+from datetime import date, datetime, timedelta
+import numpy as np
 import uvicorn
 
 # Stripe integration imports
@@ -13,32 +43,138 @@ from emergentintegrations.payments.stripe.checkout import StripeCheckout, Checko
 # Environment variables
 CORS_ORIGINS = os.environ.get("CORS_ORIGINS", "*").split(",")
 STRIPE_API_KEY = os.environ.get("STRIPE_API_KEY")
+STRIPE_WEBHOOK_SECRET = os.environ.get("STRIPE_WEBHOOK_SECRET")
+ADMIN_API_KEY = os.environ.get("ADMIN_API_KEY")
+# Local development only: opens admin endpoints when no ADMIN_API_KEY is set
+ALLOW_UNAUTHENTICATED_ADMIN = os.environ.get("ALLOW_UNAUTHENTICATED_ADMIN", "false").lower() == "true"
+
+# Admission control (requests per second and burst size per client)
+ADMISSION_READ_RATE = float(os.environ.get("ADMISSION_READ_RATE", "20"))
+ADMISSION_READ_BURST = float(os.environ.get("ADMISSION_READ_BURST", "40"))
+ADMISSION_WRITE_RATE = float(os.environ.get("ADMISSION_WRITE_RATE", "2"))
+ADMISSION_WRITE_BURST = float(os.environ.get("ADMISSION_WRITE_BURST", "10"))
+ADMISSION_MAX_CLIENTS = int(os.environ.get("ADMISSION_MAX_CLIENTS", "100000"))
+MAX_CONCURRENT_REQUESTS = int(os.environ.get("MAX_CONCURRENT_REQUESTS", "256"))
+# Reverse proxies whose X-Forwarded-For is trusted (comma-separated peer addresses)
+TRUSTED_PROXIES = set(filter(None, (addr.strip() for addr in os.environ.get("TRUSTED_PROXIES", "").split(","))))
+
+# Stripe client (timeouts in seconds)
+STRIPE_TIMEOUT_SECONDS = float(os.environ.get("STRIPE_TIMEOUT_SECONDS", "10"))
+STRIPE_MAX_WORKERS = int(os.environ.get("STRIPE_MAX_WORKERS", "8"))
+STRIPE_BREAKER_FAILURES = int(os.environ.get("STRIPE_BREAKER_FAILURES", "5"))
+STRIPE_BREAKER_RESET_SECONDS = float(os.environ.get("STRIPE_BREAKER_RESET_SECONDS", "30"))
+
+# Sampling profiler (off unless PROFILER_SAMPLE_RATE > 0)
+PROFILER_SAMPLE_RATE = float(os.environ.get("PROFILER_SAMPLE_RATE", "0"))
+PROFILER_ROUTE_PATTERN = os.environ.get("PROFILER_ROUTE_PATTERN")
+PROFILER_INTERVAL_MS = float(os.environ.get("PROFILER_INTERVAL_MS", "5"))
+PROFILER_MAX_STACKS = int(os.environ.get("PROFILER_MAX_STACKS", "20000"))
+PROFILER_DUMP_DIR = os.environ.get("PROFILER_DUMP_DIR", os.path.join(os.environ.get("DATA_DIR", os.path.expanduser("~/.nurseprep")), "profiles"))
+
+# Premium gating
+PREMIUM_GATING_ENABLED = os.environ.get("PREMIUM_GATING_ENABLED", "false").lower() == "true"
+FREE_STUDY_AREAS = set(os.environ.get("FREE_STUDY_AREAS", "fundamentals,pharmacology").split(","))
+ENTITLEMENT_TTL_SECONDS = float(os.environ.get("ENTITLEMENT_TTL_SECONDS", "300"))
+ENTITLEMENT_CACHE_SIZE = int(os.environ.get("ENTITLEMENT_CACHE_SIZE", "100000"))
+
+# Local data directory for durable queues and logs
+DATA_DIR = os.environ.get("DATA_DIR", os.path.expanduser("~/.nurseprep"))
+WEBHOOK_QUEUE_PATH = os.environ.get("WEBHOOK_QUEUE_PATH", os.path.join(DATA_DIR, "stripe_webhooks.jsonl"))
+WEBHOOK_BATCH_SIZE = int(os.environ.get("WEBHOOK_BATCH_SIZE", "100"))
+# Applied event IDs are remembered this long to drop redeliveries (Stripe retries for up to 3 days)
+WEBHOOK_DEDUP_SECONDS = float(os.environ.get("WEBHOOK_DEDUP_SECONDS", str(7 * 86400)))
+WEBHOOK_RETRY_MAX_SECONDS = float(os.environ.get("WEBHOOK_RETRY_MAX_SECONDS", "3600"))
+
+# Event log and snapshots
+EVENT_LOG_ENABLED = os.environ.get("EVENT_LOG_ENABLED", "true").lower() == "true"
+EVENT_LOG_DIR = os.environ.get("EVENT_LOG_DIR", os.path.join(DATA_DIR, "events"))
+EVENT_LOG_SEGMENT_BYTES = int(os.environ.get("EVENT_LOG_SEGMENT_BYTES", str(64 * 1024 * 1024)))
+EVENT_LOG_FSYNC_SECONDS = float(os.environ.get("EVENT_LOG_FSYNC_SECONDS", "1"))
+SNAPSHOT_INTERVAL_SECONDS = float(os.environ.get("SNAPSHOT_INTERVAL_SECONDS", "300"))
+REPLAY_BATCH_EVENTS = int(os.environ.get("REPLAY_BATCH_EVENTS", "262144"))
+
+# Cohort analytics
+COHORT_WORKERS = int(os.environ.get("COHORT_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+COHORT_PARTITION_USERS = int(os.environ.get("COHORT_PARTITION_USERS", "5000"))
+COHORT_REFRESH_SECONDS = float(os.environ.get("COHORT_REFRESH_SECONDS", "300"))
+AT_RISK_ACCURACY = float(os.environ.get("AT_RISK_ACCURACY", "0.65"))
+AT_RISK_MIN_ATTEMPTED = int(os.environ.get("AT_RISK_MIN_ATTEMPTED", "10"))
+
+# Study recommendations
+RECOMMENDER_REFRESH_SECONDS = float(os.environ.get("RECOMMENDER_REFRESH_SECONDS", "30"))
+RECOMMENDER_NEIGHBORS = int(os.environ.get("RECOMMENDER_NEIGHBORS", "25"))
+RECOMMENDER_CANDIDATES = int(os.environ.get("RECOMMENDER_CANDIDATES", "5000"))
+RECOMMENDER_MAX_BATCH = int(os.environ.get("RECOMMENDER_MAX_BATCH", "20000"))
+
+# NCLEX readiness (abilities in logits; the NCLEX-RN passing standard is 0.00)
+READINESS_PASS_STANDARD = float(os.environ.get("READINESS_PASS_STANDARD", "0.0"))
+READINESS_SLOPE = float(os.environ.get("READINESS_SLOPE", "1.7"))
+READINESS_MIN_ANSWERS = int(os.environ.get("READINESS_MIN_ANSWERS", "30"))
+
+# Exports
+EXPORT_DIR = os.environ.get("EXPORT_DIR", os.path.join(DATA_DIR, "exports"))
+EXPORT_CHUNK_ROWS = int(os.environ.get("EXPORT_CHUNK_ROWS", "5000"))
+
+# Content hot-reload
+CONTENT_DIR = os.environ.get("CONTENT_DIR", os.path.join(DATA_DIR, "content"))
+CONTENT_POLL_SECONDS = float(os.environ.get("CONTENT_POLL_SECONDS", "5"))
+# Near-duplicate questions: "flag" (report only), "merge" (keep the first copy) or "off"
+CONTENT_DEDUP_MODE = os.environ.get("CONTENT_DEDUP_MODE", "flag").lower()
+DEDUP_THRESHOLD = float(os.environ.get("DEDUP_THRESHOLD", "0.8"))
+
+# Timed exams
+TIMER_TICK_SECONDS = float(os.environ.get("TIMER_TICK_SECONDS", "1"))
+EXAM_GRACE_SECONDS = float(os.environ.get("EXAM_GRACE_SECONDS", "5"))
+EXAM_RESULT_TTL_SECONDS = float(os.environ.get("EXAM_RESULT_TTL_SECONDS", "3600"))
+DEFAULT_QUESTION_SECONDS = int(os.environ.get("DEFAULT_QUESTION_SECONDS", "90"))
+MAX_EXAM_MINUTES = float(os.environ.get("MAX_EXAM_MINUTES", "360"))
+
+# Memory accounting; soft limits like "user_progress_db=512M,process=2G" only warn
+MEMORY_SOFT_LIMITS = os.environ.get("MEMORY_SOFT_LIMITS", "")
+MEMORY_SAMPLE_SECONDS = float(os.environ.get("MEMORY_SAMPLE_SECONDS", "60"))
+MEMORY_HISTORY_SIZE = int(os.environ.get("MEMORY_HISTORY_SIZE", "1440"))
+MEMORY_SAMPLE_ENTRIES = int(os.environ.get("MEMORY_SAMPLE_ENTRIES", "200"))
+
+# Request coalescing for aggregate endpoints (0 disables the micro-cache, not the single-flight)
+COALESCE_TTL_SECONDS = float(os.environ.get("COALESCE_TTL_SECONDS", "1"))
+COALESCE_MAX_ENTRIES = int(os.environ.get("COALESCE_MAX_ENTRIES", "1000"))
+
+# Live classrooms
+LIVE_SEND_QUEUE = int(os.environ.get("LIVE_SEND_QUEUE", "32"))
+LIVE_HISTOGRAM_INTERVAL_SECONDS = float(os.environ.get("LIVE_HISTOGRAM_INTERVAL_SECONDS", "0.25"))
+LIVE_ROOM_TTL_SECONDS = float(os.environ.get("LIVE_ROOM_TTL_SECONDS", str(6 * 3600)))
+LIVE_ROOM_IDLE_SECONDS = float(os.environ.get("LIVE_ROOM_IDLE_SECONDS", "120"))
+LIVE_MAX_ROOMS = int(os.environ.get("LIVE_MAX_ROOMS", "200"))
+LIVE_MAX_ROOMS_PER_INSTRUCTOR = int(os.environ.get("LIVE_MAX_ROOMS_PER_INSTRUCTOR", "3"))
+LIVE_MAX_ROOM_MEMBERS = int(os.environ.get("LIVE_MAX_ROOM_MEMBERS", "500"))
+# User IDs allowed to open rooms without the admin key
+LIVE_INSTRUCTORS = set(filter(None, (user_id.strip() for user_id in os.environ.get("LIVE_INSTRUCTORS", "").split(","))))
 
 if not STRIPE_API_KEY:
     print("Warning: STRIPE_API_KEY not found in environment variables")
 
-app = FastAPI(title="NursePrep API", version="1.0.0")
+if not ADMIN_API_KEY:
+    if ALLOW_UNAUTHENTICATED_ADMIN:
+        print("Warning: ADMIN_API_KEY not set and ALLOW_UNAUTHENTICATED_ADMIN=true - admin endpoints are unprotected")
+    else:
+        print("Warning: ADMIN_API_KEY not set - admin endpoints are disabled")
 
-# CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=CORS_ORIGINS,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+if not STRIPE_WEBHOOK_SECRET:
+    print("Warning: STRIPE_WEBHOOK_SECRET not set - Stripe webhooks will be refused")
+
+app = FastAPI(title="NursePrep API", version="1.0.0")
 
 # ===== IN-MEMORY DATA STORAGE =====
 # This replaces the database - you can replace this with your own database later
 
 # In-memory storage dictionaries
 users_db = {}
-study_areas_db = {}
-questions_db = {}
-flashcards_db = {}
-user_progress_db = {}
-flashcard_progress_db = {}
+# Study areas, questions and flashcards live in the swappable content catalog
+# (see CONTENT CATALOG below)
+user_progress_db = None  # ProgressIndex, created below the models
+flashcard_progress_db = None  # FlashcardProgressStore, created below the models
 subscriptions_db = {}
+cohorts_db = {}
 
 # ===== PYDANTIC MODELS =====
 class QuestionOption(BaseModel):
@@ -56,6 +192,10 @@ class Question(BaseModel):
     explanation: Optional[str] = None
     difficulty_level: int = 2
     nclex_category: Optional[str] = None
+    study_area_id: Optional[str] = None
+    # "dichotomous", "plus_minus" (SATA) or "position" (ordered); None = the item type's default
+    scoring: Optional[str] = None
+    time_limit: Optional[int] = None  # seconds
 
 class StudyArea(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -96,19 +236,71 @@ class FlashcardProgress(BaseModel):
     flashcard_id: str
     ease_factor: float = 2.5
     repetitions: int = 0
-    interval_days: int = 1
+    interval_days: float = 1
     next_review_date: datetime = Field(default_factory=datetime.now)
     status: str = "new"
 
+class ExamBlueprint(BaseModel):
+    total_questions: int = 75
+    # NCLEX-RN client needs weights over nclex_category
+    category_weights: Dict[str, float] = Field(default_factory=lambda: {
+        "Safe and Effective Care Environment": 0.28,
+        "Health Promotion and Maintenance": 0.09,
+        "Psychosocial Integrity": 0.09,
+        "Physiological Integrity": 0.54,
+    })
+    # difficulty_level -> share of each category's questions
+    difficulty_mix: Dict[int, float] = Field(default_factory=dict)
+    study_area_id: Optional[str] = None
+    seed: Optional[int] = None
+
+# Requested exam time limits, in minutes as the web client sends them
+ExamMinutes = Annotated[float, Field(gt=0, le=MAX_EXAM_MINUTES)]
+
+class AdvancedQuizSettings(BaseModel):
+    model_config = ConfigDict(extra="allow")  # other client settings are echoed back as sent
+    blueprint: Optional[ExamBlueprint] = None
+    time_limit: Optional[ExamMinutes] = None
+
+class AdvancedQuizRequest(BaseModel):
+    study_area: Optional[str] = None
+    quiz_type: str = "practice"
+    time_limit: Optional[ExamMinutes] = None
+    settings: AdvancedQuizSettings = Field(default_factory=AdvancedQuizSettings)
+
+class QuizAnswer(BaseModel):
+    question_id: str
+    # The web client sends selected_option_id(s); selected_answer is an option ID or an ordered list
+    selected_answer: Optional[Union[str, List[str]]] = None
+    selected_option_id: Optional[str] = None
+    selected_option_ids: Optional[List[str]] = None
+    time_spent: Any = None  # seconds; anything but a finite non-negative number is ignored
+
+    def payload(self) -> Dict[str, Any]:
+        """The answer as the graders take it"""
+        return self.model_dump(exclude_none=True)
+
 class QuizSubmission(BaseModel):
     study_area_id: str
-    answers: List[Dict[str, Any]]
+    answers: List[QuizAnswer]
     time_spent: Optional[int] = None
 
+class AdvancedQuizSubmission(BaseModel):
+    answers: List[QuizAnswer] = Field(default_factory=list)
+    time_spent: Any = None
+
+class ExamAnswerBatch(BaseModel):
+    answers: List[QuizAnswer]
+
 class FlashcardReview(BaseModel):
     flashcard_id: str
     difficulty: str  # "easy", "good", "hard"
 
+class Cohort(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    name: str
+    user_ids: List[str] = Field(default_factory=list)
+
 # ===== STRIPE MODELS =====
 class SubscriptionPlan(BaseModel):
     id: str
@@ -127,6 +319,397 @@ class Subscription(BaseModel):
     current_period_end: Optional[datetime] = None
     cancel_at_period_end: bool = False
 
+# ===== QUIZ PROGRESS INDEX =====
+# Quiz progress partitioned user -> study area, with a secondary
+# study area -> user index over the same objects. Per-user reads and deletes
+# cost only that user's records; per-area cohort queries skip other areas.
+
+class ProgressIndex:
+    def __init__(self):
+        self.by_user: Dict[str, Dict[str, UserProgress]] = {}
+        self.by_area: Dict[str, Dict[str, UserProgress]] = {}
+        self.count = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def clear(self):
+        self.__init__()
+
+    def update(self, other):
+        """Load records from another index (snapshot restore) or a legacy flat dict"""
+        for progress in other.values():
+            self.put(progress)
+
+    def put(self, progress: UserProgress):
+        areas = self.by_user.setdefault(progress.user_id, {})
+        if progress.study_area_id not in areas:
+            self.count += 1
+        areas[progress.study_area_id] = progress
+        self.by_area.setdefault(progress.study_area_id, {})[progress.user_id] = progress
+
+    def get(self, user_id: str, study_area_id: str) -> Optional[UserProgress]:
+        return self.by_user.get(user_id, {}).get(study_area_id)
+
+    def get_or_create(self, user_id: str, study_area_id: str) -> UserProgress:
+        progress = self.get(user_id, study_area_id)
+        if progress is None:
+            progress = UserProgress(user_id=user_id, study_area_id=study_area_id)
+            self.put(progress)
+        return progress
+
+    def for_user(self, user_id: str) -> Dict[str, UserProgress]:
+        return self.by_user.get(user_id, {})
+
+    def for_area(self, study_area_id: str) -> Dict[str, UserProgress]:
+        return self.by_area.get(study_area_id, {})
+
+    def user_ids(self):
+        return self.by_user.keys()
+
+    def delete_user(self, user_id: str) -> int:
+        areas = self.by_user.pop(user_id, {})
+        for study_area_id in areas:
+            area_users = self.by_area.get(study_area_id)
+            if area_users is not None:
+                area_users.pop(user_id, None)
+                if not area_users:
+                    del self.by_area[study_area_id]
+        self.count -= len(areas)
+        return len(areas)
+
+    def values(self):
+        for areas in self.by_user.values():
+            yield from areas.values()
+
+user_progress_db = ProgressIndex()
+
+MAX_REVIEW_INTERVAL_DAYS = 3650
+
+# ===== FLASHCARD PROGRESS STORE =====
+# Flashcard progress is kept column-wise: user and card IDs are interned to
+# integers and each field lives in a NumPy array, about 30 bytes per
+# (user, card) row. Rows are indexed per user by a sorted array of card
+# indices, so lookups, "due before T" queries and deletes only touch that
+# user's rows. FlashcardProgress models are created only when a row is read.
+
+FLASHCARD_STATUSES = ("new", "reviewed")
+# Difficulty codes for review_many(); anything else is treated as "hard", as in review()
+REVIEW_DIFFICULTY_CODES = {"easy": 0, "good": 1, "hard": 2}
+
+class FlashcardProgressStore:
+    COLUMNS = {
+        "user": np.int32,
+        "card": np.int32,
+        "ease": np.float32,
+        "interval": np.float32,
+        "repetitions": np.int32,
+        "due": np.int64,  # epoch seconds
+        "status": np.int8,
+    }
+
+    def __init__(self, capacity: int = 1024):
+        self.user_index: Dict[str, int] = {}
+        self.user_names: List[str] = []
+        self.card_index: Dict[str, int] = {}
+        self.card_names: List[str] = []
+        # Per user index: sorted card indices and the matching row numbers
+        self.user_cards: List[np.ndarray] = []
+        self.user_rows: List[np.ndarray] = []
+        # review_many() looks rows up in one sorted array of user << 32 | card keys
+        # and leaves the per-user index stale until something else needs it
+        self.key_index: Optional[tuple] = None
+        self.index_stale = False
+        self.size = 0
+        # Rows released by deleted users, reused before the arrays grow
+        self.free_rows: List[int] = []
+        self.columns = {name: np.zeros(capacity, dtype=dtype) for name, dtype in self.COLUMNS.items()}
+
+    def __len__(self) -> int:
+        return self.size - len(self.free_rows)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["columns"] = {name: column[:self.size].copy() for name, column in self.columns.items()}
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._grow(16)  # an empty store pickles with zero-length columns
+
+    def clear(self):
+        self.__init__()
+
+    def update(self, other):
+        """Load rows from another store (snapshot restore) or a legacy dict of FlashcardProgress"""
+        if isinstance(other, FlashcardProgressStore):
+            self.__setstate__(other.__dict__.copy())
+            return
+        for progress in other.values():
+            row = self._row(progress.user_id, progress.flashcard_id, create=True)
+            self._write(row, progress.ease_factor, progress.interval_days, progress.repetitions,
+                        progress.next_review_date.timestamp(), FLASHCARD_STATUSES.index(progress.status))
+
+    def bulk_load(self, user_names: List[str], card_names: List[str], columns: Dict[str, np.ndarray]):
+        """Replace the contents with pre-built columns whose rows are sorted by user, then card"""
+        self.__init__()
+        self.user_names = list(user_names)
+        self.user_index = {name: index for index, name in enumerate(self.user_names)}
+        self.card_names = list(card_names)
+        self.card_index = {name: index for index, name in enumerate(self.card_names)}
+        self._grow(len(columns["user"]))
+        self.size = len(columns["user"])
+        for name, column in self.columns.items():
+            column[:self.size] = columns[name]
+        users = self.columns["user"][:self.size]
+        bounds = np.searchsorted(users, np.arange(1, len(self.user_names)))
+        self.user_cards = [cards.copy() for cards in np.split(self.columns["card"][:self.size], bounds)]
+        self.user_rows = np.split(np.arange(self.size, dtype=np.int32), bounds)
+
+    def _intern_user(self, user_id: str) -> int:
+        index = self.user_index.get(user_id)
+        if index is None:
+            index = self.user_index[user_id] = len(self.user_names)
+            self.user_names.append(user_id)
+            self.user_cards.append(np.empty(0, dtype=np.int32))
+            self.user_rows.append(np.empty(0, dtype=np.int32))
+        return index
+
+    def _intern_card(self, card_id: str) -> int:
+        index = self.card_index.get(card_id)
+        if index is None:
+            index = self.card_index[card_id] = len(self.card_names)
+            self.card_names.append(card_id)
+        return index
+
+    def _grow(self, needed: int):
+        capacity = len(self.columns["user"])
+        if needed <= capacity:
+            return
+        capacity = max(capacity, 16)  # doubling zero-length columns would never finish
+        while capacity < needed:
+            capacity *= 2
+        for name, column in self.columns.items():
+            grown = np.zeros(capacity, dtype=column.dtype)
+            grown[:self.size] = column[:self.size]
+            self.columns[name] = grown
+
+    def _row(self, user_id: str, card_id: str, create: bool = False) -> Optional[int]:
+        if self.index_stale:
+            self._reindex()
+        user = self.user_index.get(user_id) if not create else self._intern_user(user_id)
+        card = self.card_index.get(card_id) if not create else self._intern_card(card_id)
+        if user is None or card is None:
+            return None
+        cards = self.user_cards[user]
+        position = int(np.searchsorted(cards, card))
+        if position < len(cards) and cards[position] == card:
+            return int(self.user_rows[user][position])
+        if not create:
+            return None
+
+        if self.free_rows:
+            row = self.free_rows.pop()
+        else:
+            row = self.size
+            self._grow(row + 1)
+            self.size += 1
+        columns = self.columns
+        columns["user"][row] = user
+        columns["card"][row] = card
+        columns["ease"][row] = 2.5
+        columns["interval"][row] = 1
+        columns["repetitions"][row] = 0
+        columns["due"][row] = int(time.time())
+        columns["status"][row] = 0
+        self.user_cards[user] = np.insert(cards, position, card)
+        self.user_rows[user] = np.insert(self.user_rows[user], position, row)
+        self.key_index = None
+        return row
+
+    def _write(self, row: int, ease: float, interval: float, repetitions: int, due: float, status: int):
+        columns = self.columns
+        columns["ease"][row] = ease
+        columns["interval"][row] = interval
+        columns["repetitions"][row] = repetitions
+        columns["due"][row] = int(due)
+        columns["status"][row] = status
+
+    def _view(self, row: int) -> FlashcardProgress:
+        columns = self.columns
+        user_id = self.user_names[columns["user"][row]]
+        card_id = self.card_names[columns["card"][row]]
+        return FlashcardProgress(
+            id=f"{user_id}_{card_id}",
+            user_id=user_id,
+            flashcard_id=card_id,
+            ease_factor=round(float(columns["ease"][row]), 4),
+            repetitions=int(columns["repetitions"][row]),
+            interval_days=float(columns["interval"][row]),
+            next_review_date=datetime.fromtimestamp(int(columns["due"][row])),
+            status=FLASHCARD_STATUSES[columns["status"][row]],
+        )
+
+    def get(self, user_id: str, card_id: str) -> Optional[FlashcardProgress]:
+        row = self._row(user_id, card_id)
+        return self._view(row) if row is not None else None
+
+    def review(self, user_id: str, card_id: str, difficulty: str, ts: float) -> float:
+        """Apply one review (simplified SM-2); returns the new interval in days"""
+        row = self._row(user_id, card_id, create=True)
+        columns = self.columns
+        ease = float(columns["ease"][row])
+        interval = float(columns["interval"][row])
+
+        if difficulty == "easy":
+            ease = min(ease + 0.15, 3.0)
+            interval = min(max(interval * 2, 6), MAX_REVIEW_INTERVAL_DAYS)
+        elif difficulty == "good":
+            interval = min(max(interval * ease, 1), MAX_REVIEW_INTERVAL_DAYS)
+        else:  # hard
+            ease = max(ease - 0.15, 1.3)
+            interval = 1
+
+        self._write(row, ease, interval, int(columns["repetitions"][row]) + 1,
+                    ts + interval * 86400, FLASHCARD_STATUSES.index("reviewed"))
+        return float(columns["interval"][row])
+
+    def review_many(self, user_ids: List[str], card_ids: List[str], difficulties: List[str], timestamps: np.ndarray):
+        """review() for a batch, in order. Each round updates every row once with
+        NumPy, so a card reviewed k times in the batch takes k rounds"""
+        n = len(user_ids)
+        if not n:
+            return
+        # Intern each distinct name once; the per-event lookups stay in C
+        user_index = {user_id: self._intern_user(user_id) for user_id in dict.fromkeys(user_ids)}
+        card_index = {card_id: self._intern_card(card_id) for card_id in dict.fromkeys(card_ids)}
+        users = np.fromiter(map(user_index.__getitem__, user_ids), np.int64, n)
+        cards = np.fromiter(map(card_index.__getitem__, card_ids), np.int64, n)
+        rows = self._rows_for(users, cards)
+        codes = np.fromiter(map(REVIEW_DIFFICULTY_CODES.get, difficulties, itertools.repeat(2)), np.int8, n)
+
+        # Rank of each event among the events for its row, then events grouped by rank
+        order = np.argsort(rows, kind="stable")
+        sorted_rows = rows[order]
+        starts = np.flatnonzero(np.r_[True, sorted_rows[1:] != sorted_rows[:-1]])
+        rank = np.empty(n, dtype=np.int64)
+        rank[order] = np.arange(n) - np.repeat(starts, np.diff(np.r_[starts, n]))
+        by_round = np.argsort(rank, kind="stable")
+        columns = self.columns
+        start = 0
+        for end in np.cumsum(np.bincount(rank)).tolist():
+            batch = by_round[start:end]
+            start = end
+            row, code = rows[batch], codes[batch]
+            ease = columns["ease"][row].astype(np.float64)
+            interval = columns["interval"][row].astype(np.float64)
+            easy, good = code == 0, code == 1
+            interval = np.where(easy, np.minimum(np.maximum(interval * 2, 6), MAX_REVIEW_INTERVAL_DAYS),
+                                np.where(good, np.minimum(np.maximum(interval * ease, 1), MAX_REVIEW_INTERVAL_DAYS), 1.0))
+            ease = np.where(easy, np.minimum(ease + 0.15, 3.0), np.where(good, ease, np.maximum(ease - 0.15, 1.3)))
+            columns["ease"][row] = ease
+            columns["interval"][row] = interval
+            columns["repetitions"][row] += 1
+            columns["due"][row] = (timestamps[batch] + interval * 86400).astype(np.int64)
+            columns["status"][row] = FLASHCARD_STATUSES.index("reviewed")
+
+    def _rows_for(self, users: np.ndarray, cards: np.ndarray) -> np.ndarray:
+        """Row of each (user index, card index) pair, creating missing rows in bulk"""
+        keys, inverse = np.unique(users << 32 | cards, return_inverse=True)
+        index_keys, index_rows = self._key_index()
+        position = np.searchsorted(index_keys, keys)
+        found = position < len(index_keys)
+        found[found] = index_keys[position[found]] == keys[found]
+        key_rows = np.empty(len(keys), dtype=np.int64)
+        key_rows[found] = index_rows[position[found]]
+
+        missing = ~found
+        if missing.any():
+            new_keys = keys[missing]
+            reused = min(len(new_keys), len(self.free_rows))
+            new_rows = np.array(self.free_rows[len(self.free_rows) - reused:], dtype=np.int64)
+            del self.free_rows[len(self.free_rows) - reused:]
+            appended = len(new_keys) - reused
+            self._grow(self.size + appended)
+            new_rows = np.concatenate([new_rows, np.arange(self.size, self.size + appended, dtype=np.int64)])
+            self.size += appended
+            columns = self.columns
+            columns["user"][new_rows] = new_keys >> 32
+            columns["card"][new_rows] = new_keys & 0xFFFFFFFF
+            columns["ease"][new_rows] = 2.5
+            columns["interval"][new_rows] = 1
+            columns["repetitions"][new_rows] = 0
+            columns["due"][new_rows] = int(time.time())
+            columns["status"][new_rows] = 0
+            key_rows[missing] = new_rows
+            self.key_index = (np.insert(index_keys, position[missing], new_keys),
+                              np.insert(index_rows, position[missing], new_rows))
+            self.index_stale = True
+        return key_rows[inverse]
+
+    def _key_index(self) -> tuple:
+        """(sorted user << 32 | card keys, their rows) over live rows, built on demand"""
+        if self.key_index is None:
+            users = self.columns["user"][:self.size].astype(np.int64)
+            live = np.flatnonzero(users >= 0)
+            keys = users[live] << 32 | self.columns["card"][live].astype(np.int64)
+            order = np.argsort(keys)
+            self.key_index = (keys[order], live[order])
+        return self.key_index
+
+    def _reindex(self):
+        """Rebuild the per-user index from the key index after review_many() added rows"""
+        keys, rows = self.key_index
+        bounds = np.searchsorted(keys >> 32, np.arange(len(self.user_names) + 1)).tolist()
+        cards, rows = (keys & 0xFFFFFFFF).astype(np.int32), rows.astype(np.int32)
+        self.user_cards = [cards[start:end].copy() for start, end in zip(bounds, bounds[1:])]
+        self.user_rows = [rows[start:end].copy() for start, end in zip(bounds, bounds[1:])]
+        self.index_stale = False
+
+    def user_rows_of(self, user_id: str) -> np.ndarray:
+        if self.index_stale:
+            self._reindex()
+        user = self.user_index.get(user_id)
+        return self.user_rows[user] if user is not None else np.empty(0, dtype=np.int32)
+
+    def due_before(self, user_id: str, before: datetime) -> List[str]:
+        """IDs of the user's cards due before a time (vectorized over the user's rows)"""
+        rows = self.user_rows_of(user_id)
+        due_rows = rows[self.columns["due"][rows] < before.timestamp()]
+        card_names = self.card_names
+        return [card_names[card] for card in self.columns["card"][due_rows]]
+
+    def for_user(self, user_id: str) -> List[FlashcardProgress]:
+        return [self._view(int(row)) for row in self.user_rows_of(user_id)]
+
+    def delete_user(self, user_id: str) -> int:
+        user = self.user_index.get(user_id)
+        if user is None:
+            return 0
+        if self.index_stale:
+            self._reindex()
+        self.key_index = None
+        rows = self.user_rows[user]
+        self.columns["user"][rows] = -1
+        self.free_rows.extend(int(row) for row in rows)
+        self.user_cards[user] = np.empty(0, dtype=np.int32)
+        self.user_rows[user] = np.empty(0, dtype=np.int32)
+        return len(rows)
+
+    def values(self):
+        users = self.columns["user"]
+        for row in range(self.size):
+            if users[row] >= 0:
+                yield self._view(row)
+
+    def nbytes(self) -> int:
+        if self.index_stale:
+            self._reindex()
+        return sum(column.nbytes for column in self.columns.values()) + \
+            sum(cards.nbytes + rows.nbytes for cards, rows in zip(self.user_cards, self.user_rows))
+
+flashcard_progress_db = FlashcardProgressStore()
+
 # ===== SAMPLE DATA INITIALIZATION =====
 def initialize_sample_data():
     """Initialize the app with comprehensive nursing content"""
@@ -247,6 +830,7 @@ def initialize_sample_data():
         }
     ]
     
+    study_areas_db = {}
     for area_data in study_areas:
         study_areas_db[area_data["id"]] = StudyArea(**area_data)
     
@@ -409,6 +993,7 @@ def initialize_sample_data():
         }
     ]
     
+    questions_db = {}
     for q_data in sample_questions:
         questions_db[q_data["id"]] = Question(**q_data)
     
@@ -519,254 +1104,4315 @@ def initialize_sample_data():
         }
     ]
     
+    flashcards_db = {}
     for f_data in sample_flashcards:
         flashcards_db[f_data["id"]] = Flashcard(**f_data)
 
-# ===== API ENDPOINTS =====
+    global builtin_content
+    builtin_content = {"study_areas": study_areas_db, "questions": questions_db, "flashcards": flashcards_db}
+    install_catalog(ContentCatalog(study_areas_db, questions_db, flashcards_db, source="built-in"))
 
-@app.get("/")
-async def root():
-    return {"message": "NursePrep Pro API - Database Free Version", "status": "running"}
+# ===== REQUEST HELPERS =====
+def require_admin(request: Request):
+    """Reject the request unless it carries the admin key. Without a configured key admin
+    endpoints are closed, unless ALLOW_UNAUTHENTICATED_ADMIN opens them for local development"""
+    if not ADMIN_API_KEY:
+        if ALLOW_UNAUTHENTICATED_ADMIN:
+            return
+        raise HTTPException(status_code=403, detail="Admin access is disabled (ADMIN_API_KEY is not configured)")
+    if request.headers.get("X-Admin-Key") != ADMIN_API_KEY:
+        raise HTTPException(status_code=403, detail="Admin access required")
 
-# Study Areas Endpoints
-@app.get("/api/study-areas")
-async def get_study_areas():
-    return {"study_areas": list(study_areas_db.values())}
+def get_current_user_id(request: Request) -> str:
+    """Current user ID (In real app, this would come from auth)"""
+    return request.headers.get("X-User-Id") or "demo_user"
 
-@app.get("/api/study-areas/{area_id}/questions", response_model=List[Question])
-async def get_questions_by_area(area_id: str):
-    """Get questions for a specific study area"""
-    area_questions = []
-    for question in questions_db.values():
-        if hasattr(question, 'study_area_id') and question.study_area_id == area_id:
-            area_questions.append(question)
-    return area_questions
+# ===== SAMPLING PROFILER =====
+# Opt-in statistical profiler. A fraction of requests (optionally only those
+# whose path matches a pattern) are marked as sampled; while any sampled
+# request is in flight, a daemon thread snapshots the event loop thread's
+# stack every PROFILER_INTERVAL_MS. Stacks are aggregated in memory in
+# collapsed ("folded") format for flamegraph.pl / speedscope, labelled with
+# the route whose handler is on the stack. Nothing runs while the sample rate
+# is zero, and overhead is bounded by the sampling interval otherwise.
 
-# Flashcards Endpoints
-@app.get("/api/flashcards", response_model=List[Flashcard])
-async def get_flashcards():
-    return list(flashcards_db.values())
+class SamplingProfiler:
+    def __init__(self):
+        self.sample_rate = PROFILER_SAMPLE_RATE
+        self.route_pattern = re.compile(PROFILER_ROUTE_PATTERN) if PROFILER_ROUTE_PATTERN else None
+        self.interval = PROFILER_INTERVAL_MS / 1000
+        self.stacks: Dict[str, int] = {}
+        self.samples = 0
+        self.dropped_samples = 0
+        self.sampled_requests = 0
+        self.sampled_in_flight = 0
+        self.loop_thread_id: Optional[int] = None
+        self.handler_routes: Dict[Any, str] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._wakeup = threading.Event()
 
-@app.get("/api/flashcard-sets")
-async def get_flashcard_sets():
-    """Get flashcard sets (frontend expects this endpoint)"""
-    sets = {}
-    for flashcard in flashcards_db.values():
-        if flashcard.set_name not in sets:
-            sets[flashcard.set_name] = []
-        sets[flashcard.set_name].append(flashcard.dict())
-    
-    # Convert to array format that frontend expects
-    formatted_sets = []
-    for set_name, cards in sets.items():
-        formatted_sets.append({
-            "id": set_name.lower().replace(" ", "_"),
-            "name": set_name,
-            "description": f"Master essential {set_name.lower()} terms and definitions",
-            "card_count": len(cards),
-            "color": "#3b82f6",  # Blue color for all sets
-            "spaced_repetition_enabled": True,
-            "cards": cards
-        })
-    
-    return {"flashcard_sets": formatted_sets}
+    def configure(self, sample_rate: Optional[float] = None, route_pattern: Optional[str] = None,
+                  interval_ms: Optional[float] = None):
+        if sample_rate is not None:
+            self.sample_rate = min(1.0, max(0.0, sample_rate))
+        if route_pattern is not None:
+            self.route_pattern = re.compile(route_pattern) if route_pattern else None
+        if interval_ms is not None:
+            self.interval = max(1.0, interval_ms) / 1000
 
-@app.get("/api/flashcards/sets") 
-async def get_flashcard_sets_alt():
-    """Alternative endpoint for flashcard sets"""
-    return await get_flashcard_sets()
+    def should_sample(self, path: str) -> bool:
+        if self.sample_rate <= 0:
+            return False
+        if self.route_pattern is not None and not self.route_pattern.search(path):
+            return False
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
 
-# User and Progress Endpoints (Simplified for demo)
-@app.post("/api/submit-quiz")
-async def submit_quiz(submission: QuizSubmission):
-    """Submit quiz results (stored in memory)"""
-    user_id = "demo_user"  # In real app, this would come from auth
-    
-    # Calculate score
-    correct_answers = 0
-    total_questions = len(submission.answers)
-    
-    for answer in submission.answers:
-        question_id = answer.get("question_id")
-        selected_answer = answer.get("selected_answer")
-        
-        if question_id in questions_db:
-            question = questions_db[question_id]
-            if selected_answer == question.correct_answer_id:
-                correct_answers += 1
-    
-    score_percentage = (correct_answers / total_questions) * 100 if total_questions > 0 else 0
-    
-    # Store progress in memory
-    progress_key = f"{user_id}_{submission.study_area_id}"
-    if progress_key not in user_progress_db:
-        user_progress_db[progress_key] = UserProgress(
-            user_id=user_id,
-            study_area_id=submission.study_area_id
-        )
-    
-    progress = user_progress_db[progress_key]
-    progress.questions_attempted += total_questions
-    progress.questions_correct += correct_answers
-    progress.last_activity = datetime.now()
-    
-    # Add session to history
-    session_data = {
-        "date": datetime.now().isoformat(),
-        "score": score_percentage,
-        "questions_attempted": total_questions,
-        "questions_correct": correct_answers,
-        "time_spent": submission.time_spent
-    }
-    progress.quiz_sessions.append(session_data)
-    
-    return {
-        "score": score_percentage,
-        "correct_answers": correct_answers,
-        "total_questions": total_questions,
-        "message": f"Great job! You scored {score_percentage:.1f}%"
-    }
+    def begin(self):
+        if self.loop_thread_id is None:
+            self.loop_thread_id = threading.get_ident()
+            self.handler_routes = {
+                route.endpoint.__code__: route.path for route in app.routes if hasattr(route, "endpoint")
+            }
+        self.sampled_requests += 1
+        self.sampled_in_flight += 1
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+        self._wakeup.set()
 
-@app.post("/api/review-flashcard")
-async def review_flashcard(review: FlashcardReview):
-    """Submit flashcard review (simplified spaced repetition)"""
-    user_id = "demo_user"
-    
-    progress_key = f"{user_id}_{review.flashcard_id}"
-    if progress_key not in flashcard_progress_db:
-        flashcard_progress_db[progress_key] = FlashcardProgress(
-            user_id=user_id,
-            flashcard_id=review.flashcard_id
-        )
-    
-    progress = flashcard_progress_db[progress_key]
-    
-    # Simplified SM-2 algorithm
-    if review.difficulty == "easy":
-        progress.ease_factor = min(progress.ease_factor + 0.15, 3.0)
-        progress.interval_days = max(progress.interval_days * 2, 6)
-    elif review.difficulty == "good":
-        progress.interval_days = max(progress.interval_days * progress.ease_factor, 1)
-    else:  # hard
-        progress.ease_factor = max(progress.ease_factor - 0.15, 1.3)
-        progress.interval_days = 1
-    
-    progress.repetitions += 1
-    progress.next_review_date = datetime.now() + timedelta(days=progress.interval_days)
-    progress.status = "reviewed"
-    
-    return {"message": "Flashcard reviewed", "next_review_in_days": progress.interval_days}
+    def end(self):
+        self.sampled_in_flight -= 1
 
-# Analytics Endpoints
-@app.get("/api/analytics")
-async def get_analytics():
-    """Get user analytics (demo data)"""
-    return {
-        "total_quizzes": 15,
-        "quiz_average": 78.3,
-        "cards_studied": 16,
-        "card_mastery": 75.0,
-        "recent_sessions": [
-            {"date": "2025-01-20", "score": 85.0, "questions": 8},
-            {"date": "2025-01-19", "score": 72.0, "questions": 6},
-            {"date": "2025-01-18", "score": 78.0, "questions": 10},
-            {"date": "2025-01-17", "score": 81.0, "questions": 7},
-            {"date": "2025-01-16", "score": 74.0, "questions": 9}
-        ]
-    }
+    def _run(self):
+        while True:
+            if self.sampled_in_flight <= 0:
+                self._wakeup.clear()
+                self._wakeup.wait()
+            time.sleep(self.interval)
+            frame = sys._current_frames().get(self.loop_thread_id)
+            if frame is not None and self.sampled_in_flight > 0:
+                self._record(frame)
 
-@app.get("/api/stats")
-async def get_stats():
-    """Get user stats (demo data)"""
-    return {
-        "total_quizzes": 15,
-        "average_score": 78.3,
-        "total_questions": 45,
-        "correct_answers": 35,
-        "study_streak": 7,
-        "last_activity": datetime.now().isoformat()
-    }
+    def _record(self, frame):
+        names = []
+        route = None
+        while frame is not None:
+            code = frame.f_code
+            if route is None:
+                route = self.handler_routes.get(code)
+            names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+            frame = frame.f_back
+        names.append(route or "[outside handler]")
+        key = ";".join(reversed(names))
+        self.samples += 1
+        if key in self.stacks or len(self.stacks) < PROFILER_MAX_STACKS:
+            self.stacks[key] = self.stacks.get(key, 0) + 1
+        else:
+            self.dropped_samples += 1
 
-@app.get("/api/flashcards/stats") 
-async def get_flashcard_stats():
-    """Get flashcard statistics (demo data)"""
-    return {
-        "cards_studied": 16,
-        "cards_mastered": 12,
-        "cards_learning": 3,
-        "cards_new": 1,
-        "study_streak": 5,
-        "total_reviews": 28,
-        "mastery_percentage": 75.0
-    }
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self.stacks.items()))
 
-@app.get("/api/subscription/status")
-async def get_detailed_subscription_status():
-    """Get detailed subscription status (demo)"""
-    return {
-        "tier": "free",
-        "status": "active", 
-        "trial_days_remaining": None,
-        "can_upgrade": True,
-        "features": ["Basic quizzes", "Limited flashcards"],
-        "billing_cycle": None,
-        "next_billing_date": None
-    }
+    def reset(self):
+        self.stacks = {}
+        self.samples = 0
+        self.dropped_samples = 0
+        self.sampled_requests = 0
 
-@app.get("/api/packages")
-async def get_packages():
-    """Get available packages/plans"""
-    packages = [
-        {
-            "id": "monthly",
-            "name": "Monthly Premium", 
-            "price": 9.99,
-            "interval": "month",
-            "features": ["All study areas", "Unlimited quizzes", "Advanced analytics"]
-        },
-        {
-            "id": "annual",
-            "name": "Annual Premium",
-            "price": 79.99, 
-            "interval": "year",
-            "features": ["All study areas", "Unlimited quizzes", "Advanced analytics", "Save 33%"]
+    def dump(self) -> str:
+        os.makedirs(PROFILER_DUMP_DIR, exist_ok=True)
+        path = os.path.join(PROFILER_DUMP_DIR, f"profile-{datetime.now().strftime('%Y%m%d-%H%M%S')}.folded")
+        with open(path, "w") as f:
+            f.write(self.collapsed())
+        return path
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sample_rate": self.sample_rate,
+            "route_pattern": self.route_pattern.pattern if self.route_pattern else None,
+            "interval_ms": self.interval * 1000,
+            "sampled_requests": self.sampled_requests,
+            "sampled_in_flight": self.sampled_in_flight,
+            "samples": self.samples,
+            "dropped_samples": self.dropped_samples,
+            "distinct_stacks": len(self.stacks),
         }
-    ]
-    return {"packages": packages}
 
-# Subscription/Payment Endpoints
-@app.get("/api/subscription-plans", response_model=List[SubscriptionPlan])
-async def get_subscription_plans():
-    """Get available subscription plans"""
-    plans = [
-        {
-            "id": "trial",
-            "name": "7-Day Free Trial",
-            "description": "Full access for 7 days",
-            "price": 0.00,
-            "interval": "trial",
-            "features": ["All study areas", "Unlimited quizzes", "Flashcards", "Progress tracking"]
-        },
-        {
-            "id": "monthly", 
-            "name": "Monthly Plan",
-            "description": "Month-to-month flexibility",
-            "price": 9.99,
-            "interval": "month",
-            "features": ["All study areas", "Unlimited quizzes", "Flashcards", "Progress tracking", "Advanced analytics"]
-        },
-        {
-            "id": "annual",
-            "name": "Annual Plan", 
-            "description": "Best value - save 33%",
-            "price": 79.99,
-            "interval": "year",
-            "features": ["All study areas", "Unlimited quizzes", "Flashcards", "Progress tracking", "Advanced analytics", "Priority support"]
-        },
-        {
-            "id": "lifetime",
-            "name": "Lifetime Access",
-            "description": "One-time payment, lifetime access",
+profiler = SamplingProfiler()
+
+@app.middleware("http")
+async def profiler_middleware(request: Request, call_next):
+    if not profiler.should_sample(request.url.path):
+        return await call_next(request)
+    profiler.begin()
+    try:
+        return await call_next(request)
+    finally:
+        profiler.end()
+
+class ProfilerConfig(BaseModel):
+    sample_rate: Optional[float] = None
+    route_pattern: Optional[str] = None
+    interval_ms: Optional[float] = None
+
+# ===== ENTITLEMENTS =====
+# Per-user entitlements are built once from users_db / subscriptions_db and
+# cached until their TTL runs out or a subscription change invalidates them,
+# so "may this user use X" is a dict lookup plus a set membership test.
+
+ALL_FEATURES = frozenset({
+    "basic_quizzes", "flashcards", "advanced_quizzes", "spaced_repetition", "advanced_analytics",
+})
+
+TIER_FEATURES = {
+    "free": frozenset({"basic_quizzes", "flashcards"}),
+    "premium": ALL_FEATURES,
+    "lifetime": ALL_FEATURES,
+}
+
+TIER_FEATURE_DESCRIPTIONS = {
+    "free": ["Basic quizzes", "Limited flashcards"],
+    "premium": ["All study areas", "Unlimited quizzes", "Flashcards", "Progress tracking", "Advanced analytics"],
+}
+
+ACTIVE_SUBSCRIPTION_STATUSES = {"active", "trialing", "past_due"}
+
+# user_id -> subscriptions_db key of the user's current subscription
+user_subscription_index: Dict[str, str] = {}
+
+class Entitlement:
+    __slots__ = ("user_id", "tier", "status", "features", "all_areas", "areas",
+                 "trial_end_date", "period_end", "expires_at")
+
+    def __init__(self, user_id: str, tier: str, status: str, trial_end_date: Optional[datetime],
+                 period_end: Optional[datetime], expires_at: float):
+        self.user_id = user_id
+        self.tier = tier
+        self.status = status
+        self.features = TIER_FEATURES.get(tier, TIER_FEATURES["free"])
+        self.all_areas = tier != "free"
+        self.areas = frozenset(FREE_STUDY_AREAS)
+        self.trial_end_date = trial_end_date
+        self.period_end = period_end
+        self.expires_at = expires_at
+
+    def allows(self, feature: Optional[str] = None, study_area_id: Optional[str] = None) -> bool:
+        if feature is not None and feature not in self.features:
+            return False
+        if study_area_id is not None and not self.all_areas and study_area_id not in self.areas:
+            return False
+        return True
+
+class EntitlementCache:
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # user -> entitlement, least recently used first; bounded because the
+        # key comes from a client-supplied header
+        self.entries: "OrderedDict[str, Entitlement]" = OrderedDict()
+        self.evictions = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.denied = 0
+        self.would_deny = 0
+
+    def _build(self, user_id: str, now: float) -> Entitlement:
+        user = users_db.get(user_id)
+        subscription = subscriptions_db.get(user_subscription_index.get(user_id, ""))
+        tier = user.subscription_tier if user else "free"
+        status = user.subscription_status if user else "inactive"
+        trial_end = user.trial_end_date if user else None
+        period_end = subscription.current_period_end if subscription else None
+        if subscription is not None and subscription.status not in ACTIVE_SUBSCRIPTION_STATUSES:
+            tier, status = "free", subscription.status
+        if tier == "free" and trial_end and trial_end > datetime.now():
+            tier, status = "premium", "trialing"
+
+        expires_at = now + self.ttl
+        # Never serve an entitlement past the end of the paid period or trial
+        for boundary in (period_end, trial_end):
+            if boundary is not None:
+                expires_at = min(expires_at, now + max(0.0, (boundary - datetime.now()).total_seconds()))
+        return Entitlement(user_id, tier, status, trial_end, period_end, expires_at)
+
+    def get(self, user_id: str) -> Entitlement:
+        now = time.monotonic()
+        entitlement = self.entries.get(user_id)
+        if entitlement is not None and entitlement.expires_at > now:
+            self.hits += 1
+            self.entries.move_to_end(user_id)
+            return entitlement
+        self.misses += 1
+        entitlement = self._build(user_id, now)
+        self.entries[user_id] = entitlement
+        self.entries.move_to_end(user_id)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+        return entitlement
+
+    def invalidate(self, user_ids):
+        for user_id in user_ids:
+            if self.entries.pop(user_id, None) is not None:
+                self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enforced": PREMIUM_GATING_ENABLED,
+            "cached_users": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "evictions": self.evictions,
+            "denied": self.denied,
+            "would_deny": self.would_deny,
+        }
+
+entitlement_cache = EntitlementCache(ENTITLEMENT_TTL_SECONDS, ENTITLEMENT_CACHE_SIZE)
+
+def check_entitlement(user_id: str, feature: Optional[str] = None, study_area_id: Optional[str] = None):
+    """Raise 403 if the user may not use a feature or study area (counted only while gating is off)"""
+    if entitlement_cache.get(user_id).allows(feature, study_area_id):
+        return
+    if not PREMIUM_GATING_ENABLED:
+        entitlement_cache.would_deny += 1
+        return
+    entitlement_cache.denied += 1
+    raise HTTPException(status_code=403, detail="Upgrade required to access this content")
+
+# Every handler serving a gated feature calls check_entitlement itself (rather
+# than matching URL patterns), so a route that reuses another's logic or a new
+# alias can't skip the gate.
+
+# ===== ADMISSION CONTROL =====
+# Per-client token buckets (separate read and write budgets) plus a global
+# in-flight cap. Rejections are answered before the route handler runs, so a
+# client looping on quiz submission cannot starve the event loop for others.
+
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+ADMISSION_EXEMPT_PATHS = {"/", "/docs", "/openapi.json", "/api/webhooks/stripe"}
+
+class TokenBucket:
+    """Lazily refilled token bucket"""
+    __slots__ = ("rate", "capacity", "tokens", "updated_at")
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = now
+
+    def try_acquire(self, now: float) -> float:
+        """Take one token. Returns 0 on success, otherwise seconds until one is available"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+class AdmissionController:
+    def __init__(self):
+        # client key -> (read bucket, write bucket), least recently seen first
+        self.buckets: "OrderedDict[str, tuple]" = OrderedDict()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.admitted = 0
+        self.rejected_read = 0
+        self.rejected_write = 0
+        self.rejected_overload = 0
+
+    def _buckets_for(self, client_key: str, now: float) -> tuple:
+        buckets = self.buckets.get(client_key)
+        if buckets is None:
+            buckets = (
+                TokenBucket(ADMISSION_READ_RATE, ADMISSION_READ_BURST, now),
+                TokenBucket(ADMISSION_WRITE_RATE, ADMISSION_WRITE_BURST, now),
+            )
+            self.buckets[client_key] = buckets
+            if len(self.buckets) > ADMISSION_MAX_CLIENTS:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(client_key)
+        return buckets
+
+    def check(self, client_key: str, is_write: bool) -> Optional[JSONResponse]:
+        """Return a rejection response, or None if the request may proceed"""
+        if self.in_flight >= MAX_CONCURRENT_REQUESTS:
+            self.rejected_overload += 1
+            return JSONResponse(
+                status_code=503,
+                content={"detail": "Server is busy, please retry shortly"},
+                headers={"Retry-After": "1"},
+            )
+
+        now = time.monotonic()
+        read_bucket, write_bucket = self._buckets_for(client_key, now)
+        wait = (write_bucket if is_write else read_bucket).try_acquire(now)
+        if wait > 0:
+            if is_write:
+                self.rejected_write += 1
+            else:
+                self.rejected_read += 1
+            return JSONResponse(
+                status_code=429,
+                content={"detail": "Too many requests"},
+                headers={"Retry-After": str(max(1, math.ceil(wait)))},
+            )
+
+        self.admitted += 1
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "admitted": self.admitted,
+            "rejected_read": self.rejected_read,
+            "rejected_write": self.rejected_write,
+            "rejected_overload": self.rejected_overload,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "tracked_clients": len(self.buckets),
+            "limits": {
+                "read_rate": ADMISSION_READ_RATE,
+                "read_burst": ADMISSION_READ_BURST,
+                "write_rate": ADMISSION_WRITE_RATE,
+                "write_burst": ADMISSION_WRITE_BURST,
+                "max_concurrent_requests": MAX_CONCURRENT_REQUESTS,
+            },
+        }
+
+admission_controller = AdmissionController()
+
+def get_client_key(request: Request) -> str:
+    """Identify the caller by network address. X-User-Id is not authenticated, so it can't
+    key a budget; X-Forwarded-For counts only when the peer is a trusted proxy"""
+    host = request.client.host if request.client else "unknown"
+    if host in TRUSTED_PROXIES:
+        forwarded = [addr.strip() for addr in request.headers.get("X-Forwarded-For", "").split(",")]
+        # The rightmost address our own proxies didn't add is the one the client can't forge
+        for addr in reversed(forwarded):
+            if addr and addr not in TRUSTED_PROXIES:
+                return f"ip:{addr}"
+    return f"ip:{host}"
+
+@app.middleware("http")
+async def admission_control_middleware(request: Request, call_next):
+    if request.method == "OPTIONS" or request.url.path in ADMISSION_EXEMPT_PATHS:
+        return await call_next(request)
+
+    rejection = admission_controller.check(get_client_key(request), request.method in WRITE_METHODS)
+    if rejection is not None:
+        return rejection
+
+    admission_controller.in_flight += 1
+    if admission_controller.in_flight > admission_controller.peak_in_flight:
+        admission_controller.peak_in_flight = admission_controller.in_flight
+    try:
+        return await call_next(request)
+    finally:
+        admission_controller.in_flight -= 1
+
+# ===== STRIPE CLIENT =====
+# One shared StripeCheckout client whose blocking calls run on a small
+# dedicated thread pool, bounded by a timeout and a circuit breaker so a slow
+# or failing Stripe never ties up the event loop. Only outages (timeouts,
+# connection errors, 5xx) count against the breaker: a 4xx such as an invalid
+# price ID is Stripe answering, and must not lock every buyer out.
+
+class CircuitBreaker:
+    """Opens after consecutive failures, then lets one trial call through after a cool-down"""
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_in_progress = False
+        self.total_failures = 0
+        self.total_rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.trial_in_progress:
+            self.trial_in_progress = True
+            return True
+        self.total_rejected += 1
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_progress = False
+
+    def release_trial(self):
+        """Free the half-open trial slot without judging Stripe (the call was cancelled)"""
+        self.trial_in_progress = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.total_failures += 1
+        self.trial_in_progress = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "total_failures": self.total_failures,
+            "total_rejected": self.total_rejected,
+        }
+
+stripe_breaker = CircuitBreaker(STRIPE_BREAKER_FAILURES, STRIPE_BREAKER_RESET_SECONDS)
+stripe_executor = ThreadPoolExecutor(max_workers=STRIPE_MAX_WORKERS, thread_name_prefix="stripe")
+_stripe_client: Optional[StripeCheckout] = None
+
+# Exception classes (matched by name through the MRO, so neither stripe nor
+# requests has to be importable) that mean Stripe could not be reached
+STRIPE_OUTAGE_ERRORS = {"APIConnectionError", "ConnectionError", "Timeout", "TimeoutError"}
+
+def is_stripe_outage(error: Exception) -> bool:
+    """A timeout, a dropped connection or a 5xx: Stripe could not serve the call"""
+    if any(cls.__name__ in STRIPE_OUTAGE_ERRORS for cls in type(error).__mro__):
+        return True
+    status = getattr(error, "http_status", None) or getattr(error, "status_code", None)
+    return isinstance(status, int) and status >= 500
+
+def stripe_answered(error: Exception) -> bool:
+    """A 4xx: Stripe is up and rejected the request"""
+    status = getattr(error, "http_status", None) or getattr(error, "status_code", None)
+    return isinstance(status, int) and 400 <= status < 500
+
+def get_stripe_client() -> StripeCheckout:
+    """Return the shared Stripe client, creating it once"""
+    global _stripe_client
+    if _stripe_client is None:
+        _stripe_client = StripeCheckout(api_key=STRIPE_API_KEY)
+    return _stripe_client
+
+async def call_stripe(method_name: str, *args):
+    """Call a StripeCheckout method off the event loop, with timeout and circuit breaker"""
+    if not stripe_breaker.allow():
+        raise HTTPException(status_code=503, detail="Payment provider temporarily unavailable")
+
+    try:
+        method = getattr(get_stripe_client(), method_name)
+        if inspect.iscoroutinefunction(method):
+            call = method(*args)
+        else:
+            loop = asyncio.get_running_loop()
+            call = loop.run_in_executor(stripe_executor, functools.partial(method, *args))
+        result = await asyncio.wait_for(call, timeout=STRIPE_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        stripe_breaker.record_failure()
+        raise HTTPException(status_code=504, detail="Payment provider timed out")
+    except Exception as e:
+        if is_stripe_outage(e):
+            stripe_breaker.record_failure()
+        elif stripe_answered(e):
+            stripe_breaker.record_success()
+        else:
+            stripe_breaker.release_trial()  # our own bug, not evidence either way
+        raise
+    except BaseException:
+        # Cancelled (e.g. the client disconnected): not a Stripe failure, but a
+        # half-open trial must not stay claimed or the breaker never closes again
+        stripe_breaker.release_trial()
+        raise
+
+    stripe_breaker.record_success()
+    return result
+
+# ===== STRIPE WEBHOOK QUEUE =====
+# Webhooks are acknowledged as soon as they are appended (and fsynced) to a
+# local JSON-lines file. A background worker tails the file, skips event IDs
+# it has already applied and updates subscriptions_db / users_db in batches.
+# An event is written to the event log only after it applied cleanly; one that
+# raises goes to a dead-letter list and is retried with exponential backoff.
+#
+# The stores are in memory, so the file is replayed on startup. Once a
+# snapshot covers a prefix of the file, the worker rewrites it without that
+# prefix (dead letters are carried over), and applied IDs older than
+# WEBHOOK_DEDUP_SECONDS are forgotten.
+
+class WebhookQueue:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.read_offset = 0
+        # Events before this offset were queued by a previous process and are replayed on startup
+        self.replay_end_offset = os.path.getsize(path) if os.path.exists(path) else 0
+        self.appended = 0
+        self.applied = 0
+        self.duplicates = 0
+        self.failed = 0
+        self.compactions = 0
+        self.last_applied_at: Optional[float] = None
+        self.pending_received_at: "deque[float]" = deque()
+        self.processed_ids: Dict[str, float] = {}  # event ID -> received_at
+        # event ID -> [record, end offset in the file, attempts, retry at]
+        self.dead_letters: Dict[str, list] = {}
+        # Set once a snapshot covers the file up to this offset
+        self.compact_offset = 0
+        self.wakeup = asyncio.Event()
+
+    def append(self, record: Dict[str, Any]):
+        """Durably append one event (blocking, call off the event loop)"""
+        line = (json.dumps(record, separators=(",", ":")) + "\n").encode()
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "ab") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self.appended += 1
+            self.pending_received_at.append(record["received_at"])
+
+    def read_batch(self, max_events: int) -> List[tuple]:
+        """Read up to max_events complete lines after read_offset as (event, end_offset)"""
+        if not os.path.exists(self.path):
+            return []
+        batch = []
+        offset = self.read_offset
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            while len(batch) < max_events:
+                line = f.readline()
+                if not line.endswith(b"\n"):
+                    break
+                offset += len(line)
+                try:
+                    batch.append((json.loads(line), offset))
+                except ValueError:
+                    self.failed += 1
+                    batch.append((None, offset))
+        return batch
+
+    def compact(self, covered_offset: int):
+        """Rewrite the file without the lines before covered_offset, keeping dead letters (blocking)"""
+        kept = [entry for entry in self.dead_letters.values() if entry[1] <= covered_offset]
+        head = b"".join((json.dumps(entry[0], separators=(",", ":")) + "\n").encode() for entry in kept)
+        if covered_offset <= len(head):
+            return
+        with self._lock:
+            tmp = self.path + ".tmp"
+            with open(self.path, "rb") as source, open(tmp, "wb") as target:
+                target.write(head)
+                source.seek(covered_offset)
+                shutil.copyfileobj(source, target)
+                target.flush()
+                os.fsync(target.fileno())
+            os.replace(tmp, self.path)
+            shift = covered_offset - len(head)
+            self.read_offset -= shift
+            self.replay_end_offset = max(0, self.replay_end_offset - shift)
+        for entry in self.dead_letters.values():
+            entry[1] = 0 if entry[1] <= covered_offset else entry[1] - shift
+        cutoff = time.time() - WEBHOOK_DEDUP_SECONDS
+        self.processed_ids = {event_id: received_at for event_id, received_at in self.processed_ids.items()
+                              if received_at >= cutoff}
+        self.compactions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        oldest = self.pending_received_at[0] if self.pending_received_at else None
+        return {
+            "appended": self.appended,
+            "applied": self.applied,
+            "duplicates": self.duplicates,
+            "failed": self.failed,
+            "dead_letters": len(self.dead_letters),
+            "remembered_ids": len(self.processed_ids),
+            "compactions": self.compactions,
+            "backlog_events": len(self.pending_received_at),
+            "backlog_bytes": size - self.read_offset,
+            "lag_seconds": round(time.time() - oldest, 3) if oldest is not None else 0.0,
+            "last_applied_at": self.last_applied_at,
+        }
+
+webhook_queue = WebhookQueue(WEBHOOK_QUEUE_PATH)
+
+def verify_stripe_signature(payload: bytes, header: Optional[str], secret: str, tolerance: int = 300) -> bool:
+    """Check a Stripe-Signature header (t=timestamp,v1=hmac-sha256)"""
+    if not header:
+        return False
+    parts = {}
+    for item in header.split(","):
+        key, _, value = item.partition("=")
+        parts.setdefault(key.strip(), []).append(value.strip())
+    try:
+        timestamp = int(parts["t"][0])
+    except (KeyError, ValueError):
+        return False
+    if abs(time.time() - timestamp) > tolerance:
+        return False
+    expected = hmac.new(secret.encode(), f"{timestamp}.".encode() + payload, hashlib.sha256).hexdigest()
+    return any(hmac.compare_digest(expected, sig) for sig in parts.get("v1", []))
+
+# ("customer", Stripe customer ID) / ("email", address) -> user ID, so resolving
+# a webhook's user never scans users_db. Rebuilt whenever users_db is restored.
+user_lookup: Dict[tuple, str] = {}
+
+def index_user(user: User):
+    if user.stripe_customer_id:
+        user_lookup.setdefault(("customer", user.stripe_customer_id), user.id)
+    if user.email:
+        user_lookup.setdefault(("email", user.email), user.id)
+
+def rebuild_user_lookup():
+    user_lookup.clear()
+    for user in users_db.values():
+        index_user(user)
+
+def _resolve_user(user_id: Optional[str], email: Optional[str], customer_id: Optional[str]) -> Optional[User]:
+    """Find (or create) the user a Stripe object refers to"""
+    if user_id and user_id in users_db:
+        user = users_db[user_id]
+    else:
+        user = users_db.get(user_lookup.get(("customer", customer_id)) if customer_id else None) or \
+            users_db.get(user_lookup.get(("email", email)) if email else None)
+        if user is None:
+            if not (user_id or email):
+                return None
+            user = User(email=email or "", **({"id": user_id} if user_id else {}))
+            users_db[user.id] = user
+    if customer_id:
+        user.stripe_customer_id = customer_id
+    if email and not user.email:
+        user.email = email
+    index_user(user)
+    return user
+
+def _timestamp(value) -> Optional[datetime]:
+    return datetime.fromtimestamp(value) if value else None
+
+def apply_stripe_event(event: Dict[str, Any]) -> Optional[str]:
+    """Apply one Stripe event to the stores. Returns the affected user ID, if any"""
+    event_type = event.get("type", "")
+    obj = (event.get("data") or {}).get("object") or {}
+    metadata = obj.get("metadata") or {}
+
+    if event_type == "checkout.session.completed":
+        email = obj.get("customer_email") or (obj.get("customer_details") or {}).get("email")
+        user = _resolve_user(metadata.get("user_id") or obj.get("client_reference_id"), email, obj.get("customer"))
+        if user is None:
+            return None
+        subscription_id = obj.get("subscription") or f"checkout_{obj.get('id')}"
+        subscription = subscriptions_db.get(subscription_id) or Subscription(id=subscription_id, user_id=user.id)
+        subscription.stripe_subscription_id = obj.get("subscription")
+        subscription.status = "active"
+        subscription.current_period_start = subscription.current_period_start or datetime.now()
+        subscriptions_db[subscription_id] = subscription
+        user_subscription_index[user.id] = subscription_id
+        user.subscription_tier = metadata.get("tier", "premium")
+        user.subscription_status = "active"
+        return user.id
+
+    if event_type.startswith("customer.subscription."):
+        subscription = subscriptions_db.get(obj.get("id"))
+        user = users_db.get(subscription.user_id) if subscription else None
+        if user is None:
+            user = _resolve_user(metadata.get("user_id"), None, obj.get("customer"))
+        if user is None:
+            return None
+        if subscription is None:
+            subscription = Subscription(id=obj["id"], user_id=user.id)
+            subscriptions_db[subscription.id] = subscription
+        user_subscription_index[user.id] = subscription.id
+        status = "canceled" if event_type == "customer.subscription.deleted" else obj.get("status", subscription.status)
+        subscription.stripe_subscription_id = obj.get("id")
+        subscription.status = status
+        subscription.current_period_start = _timestamp(obj.get("current_period_start")) or subscription.current_period_start
+        subscription.current_period_end = _timestamp(obj.get("current_period_end")) or subscription.current_period_end
+        subscription.cancel_at_period_end = bool(obj.get("cancel_at_period_end", False))
+        user.subscription_status = status
+        user.subscription_tier = metadata.get("tier", "premium") if status in ("active", "trialing", "past_due") else "free"
+        return user.id
+
+    if event_type in ("invoice.payment_succeeded", "invoice.payment_failed"):
+        subscription = subscriptions_db.get(obj.get("subscription"))
+        if subscription is None:
+            return None
+        subscription.status = "active" if event_type == "invoice.payment_succeeded" else "past_due"
+        user = users_db.get(subscription.user_id)
+        if user is not None:
+            user.subscription_status = subscription.status
+        return subscription.user_id
+
+    return None
+
+def apply_queued_stripe_event(event: Dict[str, Any], offset: int, touched_users: set):
+    """Apply one queued event, then log it; a failure parks it in the dead-letter list"""
+    event_id = event.get("id")
+    try:
+        user_id = apply_stripe_event(event)
+    except Exception as e:
+        webhook_queue.failed += 1
+        entry = webhook_queue.dead_letters.get(event_id) or [event, offset, 0, 0.0]
+        entry[2] += 1
+        entry[3] = time.time() + min(WEBHOOK_RETRY_MAX_SECONDS, 5 * 2 ** entry[2])
+        webhook_queue.dead_letters[event_id] = entry
+        print(f"Failed to apply Stripe event {event_id} (attempt {entry[2]}): {e}")
+        return
+    webhook_queue.dead_letters.pop(event_id, None)
+    event_log.append(EVENT_STRIPE, event, time.time())
+    webhook_queue.processed_ids[event_id] = event.get("received_at") or time.time()
+    webhook_queue.applied += 1
+    if user_id:
+        touched_users.add(user_id)
+
+def apply_stripe_event_batch(batch: List[tuple]) -> set:
+    """Apply a batch read from the queue, skipping already-applied event IDs"""
+    touched_users = set()
+    for event, offset in batch:
+        webhook_queue.read_offset = offset
+        if offset > webhook_queue.replay_end_offset and webhook_queue.pending_received_at:
+            webhook_queue.pending_received_at.popleft()
+        if event is None:
+            continue
+        if event.get("id") in webhook_queue.processed_ids:
+            webhook_queue.duplicates += 1
+            continue
+        apply_queued_stripe_event(event, offset, touched_users)
+    webhook_queue.last_applied_at = time.time()
+    return touched_users
+
+def retry_dead_letters() -> set:
+    """Retry dead-lettered events whose backoff has elapsed"""
+    touched_users = set()
+    now = time.time()
+    for event, offset, _, retry_at in list(webhook_queue.dead_letters.values()):
+        if retry_at <= now:
+            apply_queued_stripe_event(event, offset, touched_users)
+    return touched_users
+
+async def webhook_worker():
+    """Drain the webhook queue in batches, waking up on new appends"""
+    loop = asyncio.get_running_loop()
+    while True:
+        if webhook_queue.compact_offset:
+            covered_offset, webhook_queue.compact_offset = webhook_queue.compact_offset, 0
+            try:
+                await loop.run_in_executor(None, webhook_queue.compact, covered_offset)
+            except OSError as e:
+                print(f"Failed to compact the webhook queue: {e}")
+        batch = await loop.run_in_executor(None, webhook_queue.read_batch, WEBHOOK_BATCH_SIZE)
+        if batch:
+            entitlement_cache.invalidate(apply_stripe_event_batch(batch))
+            continue
+        if webhook_queue.dead_letters:
+            entitlement_cache.invalidate(retry_dead_letters())
+        webhook_queue.wakeup.clear()
+        try:
+            await asyncio.wait_for(webhook_queue.wakeup.wait(), timeout=5)
+        except asyncio.TimeoutError:
+            pass
+
+# ===== SCORE RANKINGS =====
+# Per-study-area score distributions kept in Fenwick trees over 0.1% score
+# buckets: recording a score, percentile and rank lookups are all O(log buckets)
+# regardless of how many submissions have been recorded.
+
+SCORE_BUCKETS = 1001  # 0.0, 0.1, ..., 100.0
+
+class ScoreDistribution:
+    __slots__ = ("tree", "total")
+
+    def __init__(self):
+        self.tree = [0] * (SCORE_BUCKETS + 1)  # 1-based Fenwick tree
+        self.total = 0
+
+    @staticmethod
+    def bucket(score: float) -> int:
+        return min(SCORE_BUCKETS - 1, max(0, int(round(score * 10))))
+
+    def add(self, score: float, count: int = 1):
+        i = self.bucket(score) + 1
+        while i <= SCORE_BUCKETS:
+            self.tree[i] += count
+            i += i & -i
+        self.total += count
+
+    def count_at_or_below(self, bucket: int) -> int:
+        i = bucket + 1
+        count = 0
+        while i > 0:
+            count += self.tree[i]
+            i -= i & -i
+        return count
+
+    def bucket_of_rank(self, k: int) -> int:
+        """Smallest bucket whose cumulative count reaches k (1-based, ascending order)"""
+        position = 0
+        step = 1 << SCORE_BUCKETS.bit_length()
+        while step:
+            nxt = position + step
+            if nxt <= SCORE_BUCKETS and self.tree[nxt] < k:
+                position = nxt
+                k -= self.tree[nxt]
+            step >>= 1
+        return position  # 0-based bucket index
+
+    def percentile(self, score: float) -> float:
+        """Percentage of recorded scores strictly below score"""
+        if self.total == 0:
+            return 0.0
+        return self.count_at_or_below(self.bucket(score) - 1) / self.total * 100
+
+    def rank(self, score: float) -> int:
+        """1-based position of score among recorded scores, best first"""
+        return self.total - self.count_at_or_below(self.bucket(score)) + 1
+
+    def top(self, n: int) -> List[Dict[str, Any]]:
+        """Highest score buckets covering the best n submissions"""
+        results = []
+        remaining = min(n, self.total)
+        rank = self.total
+        while remaining > 0:
+            bucket = self.bucket_of_rank(rank)
+            count = self.count_at_or_below(bucket) - self.count_at_or_below(bucket - 1)
+            results.append({"score": bucket / 10, "count": count})
+            remaining -= count
+            rank -= count
+        return results
+
+score_distributions: Dict[str, ScoreDistribution] = {}
+
+def record_score(study_area_id: str, score: float) -> float:
+    """Add a quiz score to its area's distribution; returns its percentile beforehand"""
+    distribution = score_distributions.get(study_area_id)
+    if distribution is None:
+        distribution = score_distributions[study_area_id] = ScoreDistribution()
+    percentile = distribution.percentile(score)
+    distribution.add(score)
+    return percentile
+
+# ===== ITEM STATISTICS =====
+# Classical item analysis accumulated online, one O(1) update per graded
+# answer: p-value, point-biserial discrimination against the rest-of-quiz
+# score (Welford co-moments), option selection rates and answer timing.
+
+ITEM_MIN_RESPONSES = int(os.environ.get("ITEM_MIN_RESPONSES", "30"))
+TIME_HISTOGRAM_EDGES = [5, 10, 20, 30, 45, 60, 90, 120, 180, 300]  # seconds
+
+class ItemStats:
+    __slots__ = ("responses", "correct", "mean_x", "mean_y", "m2_x", "m2_y", "c_xy", "paired",
+                 "option_counts", "timed", "mean_time", "m2_time", "time_histogram")
+
+    def __init__(self):
+        self.responses = 0
+        self.correct = 0
+        # Welford state for (correct, rest score) pairs
+        self.paired = 0
+        self.mean_x = 0.0
+        self.mean_y = 0.0
+        self.m2_x = 0.0
+        self.m2_y = 0.0
+        self.c_xy = 0.0
+        self.option_counts: Dict[str, int] = {}
+        # Welford state for time-to-answer
+        self.timed = 0
+        self.mean_time = 0.0
+        self.m2_time = 0.0
+        self.time_histogram = [0] * (len(TIME_HISTOGRAM_EDGES) + 1)
+
+    def update(self, selected: Any, is_correct: bool, rest_score: Optional[float], seconds: Optional[float]):
+        x = 1.0 if is_correct else 0.0
+        self.responses += 1
+        self.correct += int(is_correct)
+
+        key = selected if isinstance(selected, str) else json.dumps(selected)
+        self.option_counts[key] = self.option_counts.get(key, 0) + 1
+
+        if rest_score is not None:
+            self.paired += 1
+            dx = x - self.mean_x
+            self.mean_x += dx / self.paired
+            dy = rest_score - self.mean_y
+            self.mean_y += dy / self.paired
+            self.m2_x += dx * (x - self.mean_x)
+            self.m2_y += dy * (rest_score - self.mean_y)
+            self.c_xy += dx * (rest_score - self.mean_y)
+
+        seconds = finite_seconds(seconds)  # logs written before validation may hold anything
+        if seconds is not None:
+            self.timed += 1
+            dt = seconds - self.mean_time
+            self.mean_time += dt / self.timed
+            self.m2_time += dt * (seconds - self.mean_time)
+            bucket = 0
+            while bucket < len(TIME_HISTOGRAM_EDGES) and seconds >= TIME_HISTOGRAM_EDGES[bucket]:
+                bucket += 1
+            self.time_histogram[bucket] += 1
+
+    @property
+    def p_value(self) -> Optional[float]:
+        return self.correct / self.responses if self.responses else None
+
+    @property
+    def discrimination(self) -> Optional[float]:
+        """Point-biserial correlation between the item and the rest of the quiz"""
+        if self.m2_x <= 0 or self.m2_y <= 0:
+            return None
+        return self.c_xy / math.sqrt(self.m2_x * self.m2_y)
+
+    def summary(self, question: Optional[Question] = None) -> Dict[str, Any]:
+        p_value = self.p_value
+        discrimination = self.discrimination
+        flags = []
+        if self.responses >= ITEM_MIN_RESPONSES:
+            if p_value < 0.2:
+                flags.append("too_hard")
+            elif p_value > 0.95:
+                flags.append("too_easy")
+            if discrimination is not None and discrimination < 0.1:
+                flags.append("low_discrimination")
+            key = question.correct_answer_id if question else None
+            if key is not None:
+                key_count = self.option_counts.get(key, 0)
+                if any(option != key and count > key_count for option, count in self.option_counts.items()):
+                    flags.append("distractor_outperforms_key")
+
+        suggested_difficulty = None
+        if p_value is not None and self.responses >= ITEM_MIN_RESPONSES:
+            suggested_difficulty = 1 + sum(p_value < cut for cut in (0.85, 0.7, 0.5, 0.3))
+
+        return {
+            "responses": self.responses,
+            "p_value": round(p_value, 4) if p_value is not None else None,
+            "discrimination": round(discrimination, 4) if discrimination is not None else None,
+            "option_rates": {option: round(count / self.responses, 4) for option, count in self.option_counts.items()},
+            "time_mean_seconds": round(self.mean_time, 2) if self.timed else None,
+            "time_stdev_seconds": round(math.sqrt(self.m2_time / (self.timed - 1)), 2) if self.timed > 1 else None,
+            "time_histogram": {
+                "edges_seconds": TIME_HISTOGRAM_EDGES,
+                "counts": self.time_histogram,
+            },
+            "difficulty_level": question.difficulty_level if question else None,
+            "suggested_difficulty_level": suggested_difficulty,
+            "flags": flags,
+        }
+
+item_stats: Dict[str, ItemStats] = {}
+
+def record_item_responses(graded: List[tuple]):
+    """Update item statistics for one submission's (question_id, selected, correct, seconds) tuples"""
+    scored = len(graded)
+    total_correct = sum(1 for _, _, is_correct, _ in graded if is_correct)
+    for question_id, selected, is_correct, seconds in graded:
+        stats = item_stats.get(question_id)
+        if stats is None:
+            stats = item_stats[question_id] = ItemStats()
+        rest_score = (total_correct - int(is_correct)) / (scored - 1) if scored > 1 else None
+        stats.update(selected, is_correct, rest_score, seconds)
+
+def finite_seconds(value: Any) -> Optional[float]:
+    """A client-reported duration as a finite, non-negative float; None if it isn't one"""
+    if isinstance(value, bool):
+        return None
+    try:
+        seconds = float(value)
+    except (TypeError, ValueError):
+        return None
+    return seconds if math.isfinite(seconds) and seconds >= 0 else None
+
+def answer_seconds(answer: Dict[str, Any], submission_seconds: Any, answer_count: int) -> Optional[float]:
+    """Per-answer time if the client sent a valid one, otherwise an even share of the quiz time"""
+    seconds = finite_seconds(answer.get("time_spent"))
+    if seconds is None:
+        submission_seconds = finite_seconds(submission_seconds)
+        if submission_seconds and answer_count:
+            seconds = submission_seconds / answer_count
+    return seconds
+
+# ===== ACTIVITY CALENDAR =====
+# One integer bitmap per user, bit k set when the user studied on day
+# (first active day + k): about 50-80 bytes per user-year. Marking a day is
+# O(1); streaks and the yearly heatmap are computed with bit operations.
+
+class ActivityCalendar:
+    def __init__(self):
+        self.base_day: Dict[str, int] = {}
+        self.bits: Dict[str, int] = {}
+
+    def clear(self):
+        self.__init__()
+
+    def update(self, other: "ActivityCalendar"):
+        self.base_day.update(other.base_day)
+        self.bits.update(other.bits)
+
+    def mark(self, user_id: str, ts: float):
+        self.mark_bits(user_id, date.fromtimestamp(ts).toordinal(), 1)
+
+    def mark_many(self, user_ids: List[str], timestamps: np.ndarray):
+        """mark() for a batch of events, building each user's bitmap with NumPy"""
+        if not len(user_ids):
+            return
+        # Local days are resolved once per 15-minute bucket: every UTC offset is
+        # a multiple of 15 minutes, so a bucket never straddles midnight
+        buckets, inverse = np.unique((timestamps // 900).astype(np.int64), return_inverse=True)
+        days = np.array([date.fromtimestamp(bucket * 900).toordinal() for bucket in buckets.tolist()],
+                        dtype=np.int64)[inverse]
+        names = list(dict.fromkeys(user_ids))
+        index = {name: position for position, name in enumerate(names)}
+        users = np.fromiter(map(index.__getitem__, user_ids), np.int64, len(user_ids))
+
+        # One byte-aligned slot per user spanning its first to last active day
+        first = np.full(len(names), np.iinfo(np.int64).max)
+        np.minimum.at(first, users, days)
+        last = np.zeros(len(names), dtype=np.int64)
+        np.maximum.at(last, users, days)
+        slot_bytes = (last - first) // 8 + 1
+        slot_start = np.concatenate([[0], np.cumsum(slot_bytes)])
+        flags = np.zeros(int(slot_start[-1]) * 8, dtype=bool)
+        flags[slot_start[users] * 8 + days - first[users]] = True
+        packed = np.packbits(flags, bitorder="little").tobytes()
+        bounds = slot_start.tolist()
+        for user, user_id in enumerate(names):
+            bits = int.from_bytes(packed[bounds[user]:bounds[user + 1]], "little")
+            self.mark_bits(user_id, int(first[user]), bits)
+
+    def mark_bits(self, user_id: str, day: int, bits: int):
+        """Set a bitmap of active days whose lowest bit is day"""
+        base = self.base_day.get(user_id)
+        if base is None:
+            self.base_day[user_id] = day
+            self.bits[user_id] = bits
+        elif day >= base:
+            self.bits[user_id] |= bits << (day - base)
+        else:
+            self.base_day[user_id] = day
+            self.bits[user_id] = (self.bits[user_id] << (base - day)) | bits
+
+    def _bits_through(self, user_id: str, today: int) -> tuple:
+        """(bitmap truncated to days up to today, index of today)"""
+        base = self.base_day.get(user_id)
+        if base is None or today < base:
+            return 0, -1
+        t = today - base
+        return self.bits[user_id] & ((1 << (t + 1)) - 1), t
+
+    def current_streak(self, user_id: str, today: Optional[date] = None) -> int:
+        """Consecutive active days ending today, or yesterday if today has no activity yet"""
+        bits, t = self._bits_through(user_id, (today or date.today()).toordinal())
+        if t < 0:
+            return 0
+        if not (bits >> t) & 1:
+            t -= 1
+            if t < 0 or not (bits >> t) & 1:
+                return 0
+        # Highest inactive day at or below t marks where the run starts
+        inactive = ~bits & ((1 << (t + 1)) - 1)
+        return t - (inactive.bit_length() - 1)
+
+    def longest_streak(self, user_id: str) -> int:
+        bits = self.bits.get(user_id, 0)
+        longest = 0
+        while bits:
+            bits &= bits >> 1
+            longest += 1
+        return longest
+
+    def heatmap(self, user_id: str, days: int = 365, today: Optional[date] = None) -> Dict[str, Any]:
+        """Activity over the last `days` days as a '0'/'1' string, oldest first"""
+        end = (today or date.today()).toordinal()
+        start = end - days + 1
+        bits, _ = self._bits_through(user_id, end)
+        base = self.base_day.get(user_id, end + 1)
+        window = (bits >> (start - base)) if start >= base else (bits << (base - start))
+        window &= (1 << days) - 1
+        return {
+            "start_date": date.fromordinal(start).isoformat(),
+            "end_date": date.fromordinal(end).isoformat(),
+            "active_days": bin(window).count("1"),
+            "days": format(window, f"0{days}b")[::-1],
+        }
+
+activity_calendar = ActivityCalendar()
+
+# ===== STUDY RECOMMENDATIONS =====
+# Mastery is tracked as a dense users x areas pair of NumPy matrices (attempts,
+# correct) plus a sparse users x questions map of each item's last outcome.
+# Every graded item updates both in O(1) and marks the user dirty. A
+# background batch then recomputes the dirty users' recommendations:
+#
+#   - user-user collaborative filtering on mean-centred area mastery (cosine
+#     similarity, top RECOMMENDER_NEIGHBORS among a fixed sample of at most
+#     RECOMMENDER_CANDIDATES users) predicts mastery of areas the user has
+#     little or no evidence for;
+#   - the user's own results are blended in, weighted by attempts;
+#   - weakest areas come first, each with questions the user missed (to
+#     retry) and unseen questions whose difficulty best matches their mastery.
+#
+# A refresh takes at most RECOMMENDER_MAX_BATCH dirty users; the rest wait for
+# the next one. The endpoint only looks up the precomputed result.
+
+MASTERY_PRIOR_WEIGHT = 5.0  # attempts' worth of weight given to the prediction
+RECOMMENDED_AREAS = 3
+RECOMMENDED_QUESTIONS = 10
+DEFAULT_ITEM_P_VALUE = 0.7
+
+class MasteryMatrix:
+    def __init__(self):
+        self.user_rows: Dict[str, int] = {}
+        self.area_cols: Dict[str, int] = {}
+        self.attempts = np.zeros((64, 16), dtype=np.float32)
+        self.correct = np.zeros((64, 16), dtype=np.float32)
+        # users x questions, sparse: user -> question -> last outcome (1 correct, 0 missed)
+        self.outcomes: Dict[str, Dict[str, int]] = {}
+        self.dirty: set = set()
+
+    def clear(self):
+        self.__init__()
+
+    def update(self, other: "MasteryMatrix"):
+        """Adopt another matrix's state (snapshot restore)"""
+        self.__dict__.update(other.__dict__)
+        self.dirty = set(self.user_rows)
+
+    def _grow(self, rows: int, cols: int):
+        shape = self.attempts.shape
+        if rows <= shape[0] and cols <= shape[1]:
+            return
+        new_shape = (max(shape[0] * 2, rows) if rows > shape[0] else shape[0],
+                     max(shape[1] * 2, cols) if cols > shape[1] else shape[1])
+        for name in ("attempts", "correct"):
+            grown = np.zeros(new_shape, dtype=np.float32)
+            grown[:shape[0], :shape[1]] = getattr(self, name)
+            setattr(self, name, grown)
+
+    def row(self, user_id: str) -> int:
+        row = self.user_rows.get(user_id)
+        if row is None:
+            row = self.user_rows[user_id] = len(self.user_rows)
+            self._grow(row + 1, len(self.area_cols))
+        return row
+
+    def col(self, area_id: str) -> int:
+        col = self.area_cols.get(area_id)
+        if col is None:
+            col = self.area_cols[area_id] = len(self.area_cols)
+            self._grow(len(self.user_rows), col + 1)
+        return col
+
+    def record(self, user_id: str, default_area_id: Optional[str], graded: List[tuple]):
+        questions = catalog.questions
+        row = self.row(user_id)
+        outcomes = self.outcomes.setdefault(user_id, {})
+        for question_id, _, is_correct, _ in graded:
+            question = questions.get(question_id)
+            area_id = question.study_area_id if question and question.study_area_id else default_area_id
+            if area_id is None:
+                continue
+            col = self.col(area_id)
+            self.attempts[row, col] += 1
+            self.correct[row, col] += bool(is_correct)
+            outcomes[question_id] = int(bool(is_correct))
+        self.dirty.add(user_id)
+
+    def delete_user(self, user_id: str):
+        row = self.user_rows.get(user_id)
+        if row is not None:
+            # The row stays allocated (all zeros) so other users' rows don't move
+            self.attempts[row] = 0
+            self.correct[row] = 0
+        self.outcomes.pop(user_id, None)
+        self.dirty.discard(user_id)
+
+mastery_matrix = MasteryMatrix()
+
+def predict_area_mastery(attempts: np.ndarray, correct: np.ndarray, target_rows: np.ndarray,
+                         neighbors: int, candidates: int) -> tuple:
+    """(estimated mastery for target rows, per-area prior) via user-user collaborative filtering.
+    Neighbours come from a seeded sample of at most `candidates` users with results, so the
+    work per target row is bounded however many users there are"""
+    totals = attempts.sum(axis=0)
+    prior = np.where(totals > 0, correct.sum(axis=0) / np.maximum(totals, 1), DEFAULT_ITEM_P_VALUE)
+    observed = attempts > 0
+    smoothed = (correct + MASTERY_PRIOR_WEIGHT * prior) / (attempts + MASTERY_PRIOR_WEIGHT)
+    counts = observed.sum(axis=1)
+    user_mean = np.where(counts > 0, (smoothed * observed).sum(axis=1) / np.maximum(counts, 1), prior.mean() if prior.size else 0)
+    deviations = np.where(observed, smoothed - user_mean[:, None], 0).astype(np.float32)
+    norms = np.linalg.norm(deviations, axis=1)
+    unit = deviations / np.where(norms > 0, norms, 1)[:, None]
+    pool = np.flatnonzero(norms > 0)
+    if len(pool) > candidates:
+        pool = np.sort(np.random.default_rng(0).choice(pool, candidates, replace=False))
+    pool_unit, pool_observed, pool_deviations = unit[pool], observed[pool], deviations[pool]
+
+    estimates = np.empty((len(target_rows), attempts.shape[1]), dtype=np.float32)
+    for start in range(0, len(target_rows), 1024):
+        rows = target_rows[start:start + 1024]
+        similarity = unit[rows] @ pool_unit.T
+        similarity[pool[None, :] == rows[:, None]] = 0  # a user is not their own neighbour
+        if similarity.shape[1] > neighbors:
+            cutoff = np.partition(similarity, -neighbors, axis=1)[:, -neighbors][:, None]
+            similarity[similarity < cutoff] = 0
+        similarity = np.maximum(similarity, 0)
+        weight = similarity @ pool_observed
+        predicted = np.where(weight > 0,
+                             user_mean[rows][:, None] + (similarity @ pool_deviations) / np.maximum(weight, 1e-9),
+                             prior)
+        predicted = np.clip(predicted, 0, 1)
+        # The user's own evidence outweighs the prediction as attempts accumulate
+        estimates[start:start + len(rows)] = (correct[rows] + MASTERY_PRIOR_WEIGHT * predicted) / \
+            (attempts[rows] + MASTERY_PRIOR_WEIGHT)
+    return estimates, prior
+
+class StudyRecommender:
+    def __init__(self, matrix: MasteryMatrix):
+        self.matrix = matrix
+        self.results: Dict[str, Dict[str, Any]] = {}
+        self.cold_start: Dict[str, Any] = {"study_areas": [], "questions": []}
+        self.refreshes = 0
+        self.last_refresh_ms: Optional[float] = None
+        self.lock = asyncio.Lock()
+
+    def lookup(self, user_id: str) -> Dict[str, Any]:
+        return self.results.get(user_id, self.cold_start)
+
+    def delete_user(self, user_id: str):
+        self.matrix.delete_user(user_id)
+        self.results.pop(user_id, None)
+
+    def _prepare(self, full: bool) -> Dict[str, Any]:
+        """Copy what the batch needs, on the event loop"""
+        matrix = self.matrix
+        content = catalog
+        for area_id in content.study_areas:
+            matrix.col(area_id)
+        if full:
+            targets = list(matrix.user_rows)
+            matrix.dirty = set()
+        else:
+            targets = []
+            while matrix.dirty and len(targets) < RECOMMENDER_MAX_BATCH:
+                user_id = matrix.dirty.pop()
+                if user_id in matrix.user_rows:
+                    targets.append(user_id)
+        n, k = len(matrix.user_rows), len(matrix.area_cols)
+        area_ids = [None] * k
+        for area_id, col in matrix.area_cols.items():
+            area_ids[col] = area_id
+        pools = {}
+        for area_id in area_ids:
+            ids = content.pools.by_area.get(area_id, ())
+            p_values = [item_stats[qid].p_value if qid in item_stats else None for qid in ids]
+            pools[area_id] = (np.array(ids, dtype=object),
+                              np.array([DEFAULT_ITEM_P_VALUE if p is None else p for p in p_values], dtype=np.float32))
+        return {
+            "attempts": matrix.attempts[:n, :k].copy(),
+            "correct": matrix.correct[:n, :k].copy(),
+            "area_ids": area_ids,
+            "targets": targets,
+            "rows": np.array([matrix.user_rows[u] for u in targets], dtype=np.int64),
+            "outcomes": {u: dict(matrix.outcomes.get(u, {})) for u in targets},
+            "pools": pools,
+        }
+
+    @staticmethod
+    def _compute(batch: Dict[str, Any]) -> tuple:
+        attempts, correct, area_ids = batch["attempts"], batch["correct"], batch["area_ids"]
+        estimates, prior = predict_area_mastery(attempts, correct, batch["rows"], RECOMMENDER_NEIGHBORS,
+                                                RECOMMENDER_CANDIDATES)
+        generated_at = datetime.now().isoformat()
+
+        def recommend(estimate: np.ndarray, row_attempts: np.ndarray, row_correct: np.ndarray,
+                      outcomes: Dict[str, int]) -> Dict[str, Any]:
+            order = np.lexsort((row_attempts, estimate))[:RECOMMENDED_AREAS]
+            areas, questions = [], []
+            for col in order:
+                area_id = area_ids[col]
+                attempted = int(row_attempts[col])
+                areas.append({
+                    "study_area_id": area_id,
+                    "estimated_mastery": round(float(estimate[col]), 3),
+                    "questions_attempted": attempted,
+                    "accuracy": round(float(row_correct[col]) / attempted, 3) if attempted else None,
+                    "reason": "low_mastery" if attempted else "not_started",
+                })
+                ids, p_values = batch["pools"][area_id]
+                if not len(ids):
+                    continue
+                quota = max(1, RECOMMENDED_QUESTIONS // len(order))
+                # Retry missed questions first, then unseen ones nearest the user's level
+                missed = [qid for qid in ids if outcomes.get(qid) == 0][:quota]
+                unseen = np.fromiter((qid not in outcomes for qid in ids), dtype=bool, count=len(ids))
+                take = quota - len(missed)
+                picked = []
+                if take > 0 and unseen.any():
+                    candidates = np.flatnonzero(unseen)
+                    distance = np.abs(p_values[candidates] - estimate[col])
+                    nearest = candidates[np.argsort(distance, kind="stable")[:take]]
+                    picked = [str(qid) for qid in ids[nearest]]
+                questions.extend({"question_id": str(qid), "study_area_id": area_id, "reason": "missed"} for qid in missed)
+                questions.extend({"question_id": qid, "study_area_id": area_id, "reason": "unseen"} for qid in picked)
+            return {"study_areas": areas, "questions": questions[:RECOMMENDED_QUESTIONS], "generated_at": generated_at}
+
+        results = {}
+        for index, user_id in enumerate(batch["targets"]):
+            row = batch["rows"][index]
+            results[user_id] = recommend(estimates[index], attempts[row], correct[row], batch["outcomes"][user_id])
+        empty = np.zeros(len(area_ids), dtype=np.float32)
+        cold_start = recommend(prior.astype(np.float32), empty, empty, {})
+        return results, cold_start
+
+    async def refresh(self, full: bool = False):
+        async with self.lock:
+            started = time.perf_counter()
+            batch = self._prepare(full)
+            results, cold_start = await asyncio.get_running_loop().run_in_executor(None, self._compute, batch)
+            for user_id, result in results.items():
+                if user_id in self.matrix.outcomes:  # skip users deleted meanwhile
+                    self.results[user_id] = result
+            self.cold_start = cold_start
+            self.refreshes += 1
+            self.last_refresh_ms = round((time.perf_counter() - started) * 1000, 1)
+            return len(results)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "users": len(self.matrix.user_rows),
+            "areas": len(self.matrix.area_cols),
+            "pending_users": len(self.matrix.dirty),
+            "cached_results": len(self.results),
+            "refreshes": self.refreshes,
+            "last_refresh_ms": self.last_refresh_ms,
+        }
+
+study_recommender = StudyRecommender(mastery_matrix)
+
+async def recommendation_refresher():
+    while True:
+        await asyncio.sleep(RECOMMENDER_REFRESH_SECONDS)
+        if mastery_matrix.dirty:
+            try:
+                await study_recommender.refresh()
+            except Exception as e:
+                print(f"Recommendation refresh failed: {e}")
+
+# ===== NCLEX READINESS =====
+# Per-user ability on each NCLEX client-needs category, on the Rasch logit
+# scale, updated Elo-style on every graded answer:
+#
+#   p = 1 / (1 + exp(b - theta)),  theta += K(n_user) * (x - p),  b -= K(n_item) * (x - p)
+#
+# K shrinks as a user's category (or an item) accumulates answers, so early
+# answers move the estimate quickly and later ones refine it. Item
+# difficulties start from difficulty_level. The pass probability is a logistic
+# function of the blueprint-weighted ability against the passing standard,
+# flattened by the estimate's standard error (information sum(p(1-p)) plus a
+# unit prior), so reads are O(categories) and a cohort is one matrix product.
+
+READINESS_K_START = 0.4
+READINESS_K_MIN = 0.05
+READINESS_K_HALF_LIFE = 20  # answers until K halves
+READINESS_PRIOR_INFORMATION = 1.0
+
+def readiness_k(answers: float) -> float:
+    return max(READINESS_K_MIN, READINESS_K_START / (1 + answers / READINESS_K_HALF_LIFE))
+
+def initial_item_difficulty(question: Question) -> float:
+    return (question.difficulty_level - 3) * 0.75
+
+class ReadinessModel:
+    def __init__(self):
+        self.user_rows: Dict[str, int] = {}
+        self.category_cols: Dict[str, int] = {category: col for col, category in enumerate(ExamBlueprint().category_weights)}
+        self.theta = np.zeros((64, 8))
+        self.answered = np.zeros((64, 8))
+        self.information = np.zeros((64, 8))
+        self.item_difficulty: Dict[str, float] = {}
+        self.item_answers: Dict[str, int] = {}
+
+    def clear(self):
+        self.__init__()
+
+    def update(self, other: "ReadinessModel"):
+        """Adopt another model's state (snapshot restore)"""
+        self.__dict__.update(other.__dict__)
+
+    def _grow(self, rows: int, cols: int):
+        shape = self.theta.shape
+        if rows <= shape[0] and cols <= shape[1]:
+            return
+        new_shape = (max(shape[0] * 2, rows) if rows > shape[0] else shape[0],
+                     max(shape[1] * 2, cols) if cols > shape[1] else shape[1])
+        for name in ("theta", "answered", "information"):
+            grown = np.zeros(new_shape)
+            grown[:shape[0], :shape[1]] = getattr(self, name)
+            setattr(self, name, grown)
+
+    def row(self, user_id: str) -> int:
+        row = self.user_rows.get(user_id)
+        if row is None:
+            row = self.user_rows[user_id] = len(self.user_rows)
+            self._grow(row + 1, len(self.category_cols))
+        return row
+
+    def col(self, category: str) -> int:
+        col = self.category_cols.get(category)
+        if col is None:
+            col = self.category_cols[category] = len(self.category_cols)
+            self._grow(len(self.user_rows), col + 1)
+        return col
+
+    def record(self, user_id: str, graded: List[tuple]):
+        """One Elo step per graded answer to a question with an NCLEX category"""
+        questions = catalog.questions
+        row = None
+        for question_id, _, is_correct, _ in graded:
+            question = questions.get(question_id)
+            if question is None or not question.nclex_category:
+                continue
+            if row is None:
+                row = self.row(user_id)
+            col = self.col(question.nclex_category)
+            difficulty = self.item_difficulty.get(question_id)
+            if difficulty is None:
+                difficulty = initial_item_difficulty(question)
+            theta = self.theta[row, col]
+            expected = 1 / (1 + math.exp(difficulty - theta))
+            surprise = float(bool(is_correct)) - expected
+            item_answers = self.item_answers.get(question_id, 0)
+            self.theta[row, col] = theta + readiness_k(self.answered[row, col]) * surprise
+            self.item_difficulty[question_id] = difficulty - readiness_k(item_answers) * surprise
+            self.item_answers[question_id] = item_answers + 1
+            self.answered[row, col] += 1
+            self.information[row, col] += expected * (1 - expected)
+
+    def load_counts(self, user_ids: List[str], categories: List[str], answered: np.ndarray,
+                    correct: np.ndarray, difficulty: np.ndarray):
+        """Replace user abilities with one-shot estimates from per-category totals
+        (bulk loads): theta = logit of the smoothed accuracy plus the mean item difficulty"""
+        self.__init__()
+        for category in categories:
+            self.col(category)
+        self._grow(len(user_ids), len(self.category_cols))
+        self.user_rows = {user_id: row for row, user_id in enumerate(user_ids)}
+        cols = [self.category_cols[category] for category in categories]
+        accuracy = (correct + 0.5) / (answered + 1)
+        mean_difficulty = difficulty / np.maximum(answered, 1)
+        self.theta[:len(user_ids), cols] = np.where(answered > 0, np.log(accuracy / (1 - accuracy)) + mean_difficulty, 0)
+        self.answered[:len(user_ids), cols] = answered
+        self.information[:len(user_ids), cols] = answered * accuracy * (1 - accuracy)
+
+    def weights(self) -> np.ndarray:
+        """Blueprint weight per column; categories outside the blueprint don't count towards passing"""
+        blueprint = ExamBlueprint().category_weights
+        weights = np.zeros(self.theta.shape[1])
+        for category, col in self.category_cols.items():
+            weights[col] = blueprint.get(category, 0.0)
+        return weights / weights.sum()
+
+    def score(self, theta: np.ndarray, information: np.ndarray) -> tuple:
+        """(ability, standard error, pass probability) for rows of category abilities"""
+        weights = self.weights()
+        ability = theta @ weights
+        variance = (1 / (information + READINESS_PRIOR_INFORMATION)) @ (weights ** 2)
+        standard_error = np.sqrt(variance)
+        # Logistic-normal approximation: uncertainty pulls the probability towards 0.5
+        scale = np.sqrt(1 + math.pi * READINESS_SLOPE ** 2 * variance / 8)
+        pass_probability = 1 / (1 + np.exp(-READINESS_SLOPE * (ability - READINESS_PASS_STANDARD) / scale))
+        return ability, standard_error, pass_probability
+
+    def readiness(self, user_id: str) -> Dict[str, Any]:
+        row = self.user_rows.get(user_id)
+        if row is None:
+            row_theta = row_answered = row_information = np.zeros(self.theta.shape[1])
+        else:
+            row_theta, row_answered, row_information = self.theta[row], self.answered[row], self.information[row]
+        ability, standard_error, pass_probability = (float(value) for value in self.score(row_theta, row_information))
+        weights = self.weights()
+        answered = int(row_answered.sum())
+        return {
+            "user_id": user_id,
+            "pass_probability": round(pass_probability, 4) if answered else None,
+            "ability": round(ability, 3),
+            "standard_error": round(standard_error, 3),
+            "passing_standard": READINESS_PASS_STANDARD,
+            "answered": answered,
+            "confidence": "low" if answered < READINESS_MIN_ANSWERS else "moderate" if answered < 4 * READINESS_MIN_ANSWERS else "high",
+            "categories": [{
+                "nclex_category": category,
+                "blueprint_weight": round(float(weights[col]), 4),
+                "ability": round(float(row_theta[col]), 3),
+                "standard_error": round(1 / math.sqrt(row_information[col] + READINESS_PRIOR_INFORMATION), 3),
+                "answered": int(row_answered[col]),
+            } for category, col in self.category_cols.items()],
+        }
+
+    def score_users(self, user_ids: List[str]) -> Dict[str, Any]:
+        """Vectorized pass probabilities for many users (cohort batch scoring)"""
+        rows = np.array([self.user_rows.get(user_id, -1) for user_id in user_ids], dtype=np.int64)
+        answered = np.where(rows >= 0, self.answered[rows].sum(axis=1), 0)
+        known = [user_id for user_id, n in zip(user_ids, answered) if n > 0]
+        rows, answered = rows[answered > 0], answered[answered > 0]
+        ability, standard_error, pass_probability = self.score(self.theta[rows], self.information[rows])
+        scored = answered >= READINESS_MIN_ANSWERS
+        bands = np.digitize(pass_probability[scored], [0.5, 0.8])
+        return {
+            "users": [{
+                "user_id": user_id,
+                "pass_probability": round(float(p), 4),
+                "ability": round(float(a), 3),
+                "standard_error": round(float(se), 3),
+                "answered": int(n),
+            } for user_id, p, a, se, n in zip(known, pass_probability, ability, standard_error, answered)],
+            "summary": {
+                "users": len(user_ids),
+                "without_answers": len(user_ids) - len(known),
+                "insufficient_evidence": int((~scored).sum()),
+                "mean_pass_probability": round(float(pass_probability[scored].mean()), 4) if scored.any() else None,
+                "at_risk": int((bands == 0).sum()),  # below 50%
+                "borderline": int((bands == 1).sum()),
+                "on_track": int((bands == 2).sum()),  # 80% and above
+            },
+        }
+
+    def delete_user(self, user_id: str):
+        row = self.user_rows.get(user_id)
+        if row is not None:
+            # The row stays allocated (reset to the prior) so other users' rows don't move
+            self.theta[row] = 0
+            self.answered[row] = 0
+            self.information[row] = 0
+
+readiness_model = ReadinessModel()
+
+# ===== EVENT LOG =====
+# Every progress mutation (quiz submission, flashcard review, subscription
+# change) is appended to a segmented binary log before it is applied, and the
+# same apply functions run during recovery. Startup loads the newest snapshot
+# and replays only the records after it, reading segments through mmap.
+#
+# Record layout: <u32 payload length><u32 crc32 of payload><u64 seq><f64 ts><u8 type>
+# followed by the JSON-encoded payload.
+
+EVENT_HEADER = struct.Struct("<IIQdB")
+EVENT_LENGTH = struct.Struct("<I")
+# The same layout as a NumPy record, for decoding many headers at once
+EVENT_HEADER_DTYPE = np.dtype([("length", "<u4"), ("crc", "<u4"), ("seq", "<u8"), ("ts", "<f8"), ("type", "u1")])
+
+EVENT_QUIZ_SUBMITTED = 1
+EVENT_ADVANCED_QUIZ_SUBMITTED = 2
+EVENT_FLASHCARD_REVIEWED = 3
+EVENT_STRIPE = 4
+EVENT_PROGRESS_DELETED = 5
+EVENT_COHORT_SAVED = 6
+
+def apply_quiz_submission(data: Dict[str, Any], ts: float) -> Optional[float]:
+    """Record a graded quiz; returns the score's percentile before it was added"""
+    user_id = data["user_id"]
+    study_area_id = data["study_area_id"]
+    graded = data["graded"]
+    total_questions = data["total_questions"]
+    correct_answers = sum(1 for entry in graded if entry[2])
+    if data.get("max_points"):
+        score_percentage = data["points"] / data["max_points"] * 100
+    else:
+        score_percentage = (correct_answers / total_questions) * 100 if total_questions > 0 else 0
+    record_item_responses(graded)
+    activity_calendar.mark(user_id, ts)
+    mastery_matrix.record(user_id, study_area_id, graded)
+    readiness_model.record(user_id, graded)
+
+    progress = user_progress_db.get_or_create(user_id, study_area_id)
+    progress.questions_attempted += total_questions
+    progress.questions_correct += correct_answers
+    progress.last_activity = datetime.fromtimestamp(ts)
+
+    # Add session to history
+    session_data = {
+        "date": datetime.fromtimestamp(ts).isoformat(),
+        "score": score_percentage,
+        "questions_attempted": total_questions,
+        "questions_correct": correct_answers,
+        "time_spent": data.get("time_spent")
+    }
+    progress.quiz_sessions.append(session_data)
+    return record_score(study_area_id, score_percentage) if total_questions > 0 else None
+
+def apply_advanced_quiz_submission(data: Dict[str, Any], ts: float):
+    record_item_responses(data["graded"])
+    if data.get("user_id"):
+        mastery_matrix.record(data["user_id"], None, data["graded"])
+        readiness_model.record(data["user_id"], data["graded"])
+
+def apply_flashcard_review(data: Dict[str, Any], ts: float) -> float:
+    """Record a flashcard review; returns the next interval in days"""
+    activity_calendar.mark(data["user_id"], ts)
+    return flashcard_progress_db.review(data["user_id"], data["flashcard_id"], data["difficulty"], ts)
+
+def apply_flashcard_reviews(records: List[Dict[str, Any]], timestamps: List[float]):
+    """apply_flashcard_review() for a run of replayed events at once"""
+    # Read every field before mutating anything, so a malformed record leaves the stores untouched
+    user_ids = [record["user_id"] for record in records]
+    card_ids = [record["flashcard_id"] for record in records]
+    difficulties = [record["difficulty"] for record in records]
+    ts = np.array(timestamps, dtype=np.float64)
+    activity_calendar.mark_many(user_ids, ts)
+    flashcard_progress_db.review_many(user_ids, card_ids, difficulties, ts)
+
+def apply_progress_deletion(data: Dict[str, Any], ts: float) -> Dict[str, int]:
+    user_id = data["user_id"]
+    study_recommender.delete_user(user_id)
+    readiness_model.delete_user(user_id)
+    return {
+        "quiz_progress_deleted": user_progress_db.delete_user(user_id),
+        "flashcard_progress_deleted": flashcard_progress_db.delete_user(user_id),
+    }
+
+def apply_cohort_saved(data: Dict[str, Any], ts: float) -> Cohort:
+    cohort = Cohort(**data)
+    cohorts_db[cohort.id] = cohort
+    return cohort
+
+def apply_logged_stripe_event(data: Dict[str, Any], ts: float):
+    if data.get("id") in webhook_queue.processed_ids:
+        return
+    user_id = apply_stripe_event(data)
+    webhook_queue.processed_ids[data.get("id")] = data.get("received_at") or ts
+    if user_id:
+        entitlement_cache.invalidate([user_id])
+
+EVENT_APPLIERS = {
+    EVENT_QUIZ_SUBMITTED: apply_quiz_submission,
+    EVENT_ADVANCED_QUIZ_SUBMITTED: apply_advanced_quiz_submission,
+    EVENT_FLASHCARD_REVIEWED: apply_flashcard_review,
+    EVENT_STRIPE: apply_logged_stripe_event,
+    EVENT_PROGRESS_DELETED: apply_progress_deletion,
+    EVENT_COHORT_SAVED: apply_cohort_saved,
+}
+
+# Replay applies runs of these event types in one call
+EVENT_BATCH_APPLIERS = {
+    EVENT_FLASHCARD_REVIEWED: apply_flashcard_reviews,
+}
+
+def snapshot_state() -> Dict[str, Any]:
+    """Everything a snapshot must capture to rebuild progress and derived statistics"""
+    return {
+        "users_db": users_db,
+        "user_progress_db": user_progress_db,
+        "flashcard_progress_db": flashcard_progress_db,
+        "subscriptions_db": subscriptions_db,
+        "cohorts_db": cohorts_db,
+        "user_subscription_index": user_subscription_index,
+        "score_distributions": score_distributions,
+        "item_stats": item_stats,
+        "activity_calendar": activity_calendar,
+        "mastery_matrix": mastery_matrix,
+        "readiness_model": readiness_model,
+        "processed_stripe_event_ids": webhook_queue.processed_ids,
+    }
+
+def restore_state(state: Dict[str, Any]):
+    current = snapshot_state()
+    for name, value in state.items():
+        if name in current:
+            current[name].clear()
+            current[name].update(value)
+    rebuild_user_lookup()
+
+# Snapshots are taken in two steps. capture_state() runs on the event loop and
+# only copies: NumPy columns, dicts and lists of immutable values, so it stays
+# in the tens of milliseconds with 100k users. Encoding and writing that copy
+# runs in a worker thread while the loop keeps serving. load_state() turns a
+# decoded copy back into store objects for restore_state().
+
+def capture_models(models: Dict[str, BaseModel]) -> Dict[str, Dict[str, Any]]:
+    return {key: dict(model.__dict__) for key, model in models.items()}
+
+def load_models(model: type, data: Dict[str, Dict[str, Any]]) -> Dict[str, BaseModel]:
+    return {key: model(**fields) for key, fields in data.items()}
+
+def capture_progress(index: ProgressIndex) -> "CapturedProgress":
+    # Sessions are append-only and never modified, so their count is enough; the
+    # worker thread slices the lists (appends made meanwhile fall outside the slice)
+    return CapturedProgress([(progress, progress.questions_attempted, progress.questions_correct,
+                              progress.last_activity, len(progress.quiz_sessions)) for progress in index.values()])
+
+class CapturedProgress(list):
+    def materialize(self) -> List[Dict[str, Any]]:
+        """Plain records (in the worker thread)"""
+        return [{"id": progress.id, "user_id": progress.user_id, "study_area_id": progress.study_area_id,
+                 "questions_attempted": attempted, "questions_correct": correct,
+                 "quiz_sessions": progress.quiz_sessions[:sessions], "last_activity": last_activity}
+                for progress, attempted, correct, last_activity, sessions in self]
+
+def load_progress(records: List[Dict[str, Any]]) -> ProgressIndex:
+    index = ProgressIndex()
+    for fields in records:
+        index.put(UserProgress(**fields))
+    return index
+
+def capture_flashcards(store: FlashcardProgressStore) -> Dict[str, Any]:
+    live = store.columns["user"][:store.size] >= 0
+    return {
+        "user_names": list(store.user_names),
+        "card_names": list(store.card_names),
+        "columns": {name: column[:store.size][live] for name, column in store.columns.items()},
+    }
+
+def load_flashcards(data: Dict[str, Any]) -> FlashcardProgressStore:
+    columns = data["columns"]
+    order = np.lexsort((columns["card"], columns["user"]))
+    store = FlashcardProgressStore()
+    store.bulk_load(data["user_names"], data["card_names"], {name: column[order] for name, column in columns.items()})
+    return store
+
+def capture_item_stats(stats: Dict[str, ItemStats]) -> Dict[str, Dict[str, Any]]:
+    captured = {}
+    for question_id, item in stats.items():
+        fields = {slot: getattr(item, slot) for slot in ItemStats.__slots__}
+        fields["option_counts"] = dict(item.option_counts)
+        fields["time_histogram"] = list(item.time_histogram)
+        captured[question_id] = fields
+    return captured
+
+def load_item_stats(data: Dict[str, Dict[str, Any]]) -> Dict[str, ItemStats]:
+    stats = {}
+    for question_id, fields in data.items():
+        item = stats[question_id] = ItemStats()
+        for slot, value in fields.items():
+            setattr(item, slot, value)
+    return stats
+
+def load_score_distributions(data: Dict[str, tuple]) -> Dict[str, ScoreDistribution]:
+    distributions = {}
+    for study_area_id, (tree, total) in data.items():
+        distribution = distributions[study_area_id] = ScoreDistribution()
+        distribution.tree, distribution.total = list(tree), total
+    return distributions
+
+def load_activity_calendar(data: Dict[str, Dict[str, int]]) -> ActivityCalendar:
+    calendar = ActivityCalendar()
+    calendar.base_day, calendar.bits = dict(data["base_day"]), dict(data["bits"])
+    return calendar
+
+def capture_mastery(matrix: MasteryMatrix) -> Dict[str, Any]:
+    rows, cols = len(matrix.user_rows), len(matrix.area_cols)
+    return {
+        "user_rows": dict(matrix.user_rows),
+        "area_cols": dict(matrix.area_cols),
+        "attempts": matrix.attempts[:rows, :cols].copy(),
+        "correct": matrix.correct[:rows, :cols].copy(),
+        "outcomes": {user_id: dict(outcomes) for user_id, outcomes in matrix.outcomes.items()},
+    }
+
+def load_mastery(data: Dict[str, Any]) -> MasteryMatrix:
+    matrix = MasteryMatrix()
+    matrix.user_rows, matrix.area_cols, matrix.outcomes = data["user_rows"], data["area_cols"], data["outcomes"]
+    matrix.attempts, matrix.correct = data["attempts"], data["correct"]
+    return matrix
+
+def capture_readiness(model: ReadinessModel) -> Dict[str, Any]:
+    rows, cols = len(model.user_rows), len(model.category_cols)
+    return {
+        "user_rows": dict(model.user_rows),
+        "category_cols": dict(model.category_cols),
+        "theta": model.theta[:rows, :cols].copy(),
+        "answered": model.answered[:rows, :cols].copy(),
+        "information": model.information[:rows, :cols].copy(),
+        "item_difficulty": dict(model.item_difficulty),
+        "item_answers": dict(model.item_answers),
+    }
+
+def load_readiness(data: Dict[str, Any]) -> ReadinessModel:
+    model = ReadinessModel()
+    for name, value in data.items():
+        setattr(model, name, value)
+    return model
+
+def load_processed_ids(data) -> Dict[str, float]:
+    # Snapshots before the dedup window stored a plain list of IDs
+    return dict.fromkeys(data, time.time()) if isinstance(data, list) else dict(data)
+
+SNAPSHOT_CODECS = {
+    "users_db": (capture_models, functools.partial(load_models, User)),
+    "user_progress_db": (capture_progress, load_progress),
+    "flashcard_progress_db": (capture_flashcards, load_flashcards),
+    "subscriptions_db": (capture_models, functools.partial(load_models, Subscription)),
+    "cohorts_db": (capture_models, functools.partial(load_models, Cohort)),
+    "user_subscription_index": (dict, dict),
+    "score_distributions": (lambda d: {key: (list(dist.tree), dist.total) for key, dist in d.items()},
+                            load_score_distributions),
+    "item_stats": (capture_item_stats, load_item_stats),
+    "activity_calendar": (lambda c: {"base_day": dict(c.base_day), "bits": dict(c.bits)}, load_activity_calendar),
+    "mastery_matrix": (capture_mastery, load_mastery),
+    "readiness_model": (capture_readiness, load_readiness),
+    "processed_stripe_event_ids": (dict, load_processed_ids),
+}
+
+def capture_state() -> Dict[str, Any]:
+    """Plain-data copy of every store (on the event loop; cheap copies only)"""
+    # The copies allocate millions of small containers; a cyclic GC pass over the
+    # whole heap in the middle would cost more than the copying itself
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return {name: SNAPSHOT_CODECS[name][0](store) for name, store in snapshot_state().items()}
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+def materialize_state(captured: Dict[str, Any]) -> Dict[str, Any]:
+    """Finish a capture in the worker thread (deferred slices)"""
+    return {name: data.materialize() if isinstance(data, CapturedProgress) else data for name, data in captured.items()}
+
+def load_state(captured: Dict[str, Any]) -> Dict[str, Any]:
+    """Store objects rebuilt from a captured copy, ready for restore_state()"""
+    return {name: SNAPSHOT_CODECS[name][1](data) for name, data in captured.items() if name in SNAPSHOT_CODECS}
+
+# On disk a snapshot is an .npz archive: NumPy columns are stored as arrays and
+# everything else as one JSON document (__meta__) referring to them by name.
+# It is read with allow_pickle=False, so loading a file runs no code from it.
+SNAPSHOT_FORMAT = 1
+
+def write_snapshot(path: str, seq: int, state: Dict[str, Any]):
+    arrays: Dict[str, np.ndarray] = {}
+
+    def encode(value: Any) -> Any:
+        if isinstance(value, np.ndarray):
+            if value.dtype.hasobject:
+                raise TypeError("object arrays cannot be snapshotted")
+            name = f"a{len(arrays)}"
+            arrays[name] = value
+            return {"__array__": name}
+        if isinstance(value, datetime):
+            return {"__datetime__": value.isoformat()}
+        if isinstance(value, np.generic):
+            return value.item()
+        if isinstance(value, (set, frozenset)):
+            return list(value)
+        raise TypeError(f"cannot snapshot {type(value).__name__}")
+
+    meta = json.dumps({"format": SNAPSHOT_FORMAT, "seq": seq, "state": state}, default=encode, separators=(",", ":"))
+    with open(path, "wb") as f:
+        np.savez(f, __meta__=np.frombuffer(meta.encode(), dtype=np.uint8), **arrays)
+        f.flush()
+        os.fsync(f.fileno())
+
+def read_snapshot(path: str) -> tuple:
+    """(seq, captured state) from a file written by write_snapshot()"""
+    with np.load(path, allow_pickle=False) as archive:
+        arrays = {name: archive[name] for name in archive.files}
+    meta = arrays.pop("__meta__").tobytes()
+
+    def decode(obj: Dict[str, Any]) -> Any:
+        if len(obj) == 1:
+            if "__array__" in obj:
+                return arrays[obj["__array__"]]
+            if "__datetime__" in obj:
+                return datetime.fromisoformat(obj["__datetime__"])
+        return obj
+
+    snapshot = json.loads(meta, object_hook=decode)
+    if snapshot.get("format") != SNAPSHOT_FORMAT:
+        raise ValueError(f"unsupported snapshot format {snapshot.get('format')!r}")
+    return snapshot["seq"], snapshot["state"]
+
+def ensure_private_dir(path: str):
+    """Create path (mode 0700) if missing; refuse one another user owns or can write to"""
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.stat(path)
+    if hasattr(os, "getuid") and info.st_uid != os.getuid():
+        raise RuntimeError(f"{path} is owned by uid {info.st_uid}, not the server's uid {os.getuid()}")
+    if info.st_mode & 0o022:
+        raise RuntimeError(f"{path} is writable by group or others; run chmod go-w {path}")
+
+class EventLog:
+    def __init__(self, directory: str, segment_bytes: int):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.seq = 0
+        self.segment_file = None
+        self.segment_size = 0
+        self.dirty = False
+        self.snapshot_seq = 0
+        self.last_snapshot_at: Optional[float] = None
+        self.replayed_events = 0
+        self.replay_errors = 0
+        self.replay_seconds = 0.0
+
+    def _segments(self) -> List[str]:
+        return sorted(glob.glob(os.path.join(self.directory, "events-*.log")))
+
+    def _snapshots(self) -> List[str]:
+        return sorted(glob.glob(os.path.join(self.directory, "snapshot-*.npz")))
+
+    @staticmethod
+    def _first_seq(path: str) -> int:
+        return int(os.path.basename(path).split("-")[1].split(".")[0])
+
+    def _open_segment(self):
+        if self.segment_file is not None:
+            self.segment_file.close()
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        path = os.path.join(self.directory, f"events-{self.seq + 1:016d}.log")
+        self.segment_file = open(path, "ab")
+        self.segment_size = self.segment_file.tell()
+
+    def append(self, event_type: int, data: Dict[str, Any], ts: float):
+        """Write one event (buffered to the OS; fsynced by the background flusher)"""
+        if not EVENT_LOG_ENABLED:
+            return
+        if self.segment_file is None or self.segment_size >= self.segment_bytes:
+            self._open_segment()
+        payload = json.dumps(data, separators=(",", ":")).encode()
+        self.seq += 1
+        record = EVENT_HEADER.pack(len(payload), zlib.crc32(payload), self.seq, ts, event_type) + payload
+        self.segment_file.write(record)
+        self.segment_file.flush()
+        self.segment_size += len(record)
+        self.dirty = True
+
+    def fsync(self):
+        if self.dirty and self.segment_file is not None:
+            self.dirty = False
+            os.fsync(self.segment_file.fileno())
+
+    def _replay_run(self, event_type: int, seqs: List[int], timestamps: List[float], payloads: List[bytes]) -> int:
+        """Apply consecutive events of one type, decoded with a single json.loads"""
+        if not payloads:
+            return 0
+        try:
+            records = json.loads(b"[" + b",".join(payloads) + b"]")
+        except ValueError:
+            records = None  # decode one by one below to find the bad record
+        batch_apply = EVENT_BATCH_APPLIERS.get(event_type)
+        if batch_apply is not None and records is not None:
+            try:
+                batch_apply(records, timestamps)
+                return len(payloads)
+            except Exception as e:
+                print(f"Event log: batch replay from event #{seqs[0]} failed ({e}); replaying one at a time")
+        applied = 0
+        for index, (seq, ts) in enumerate(zip(seqs, timestamps)):
+            try:
+                data = records[index] if records is not None else json.loads(payloads[index])
+                EVENT_APPLIERS[event_type](data, ts)
+                applied += 1
+            except Exception as e:
+                self.replay_errors += 1
+                print(f"Event log: failed to replay event #{seq}: {e}")
+        return applied
+
+    def _replay_records(self, headers: np.ndarray, payloads: List[bytes], after_seq: int) -> int:
+        """Apply intact records with seq > after_seq, one run of each event type at a time"""
+        seqs = headers["seq"]
+        if len(seqs):
+            self.seq = max(self.seq, int(seqs.max()))
+        keep = np.flatnonzero(seqs > after_seq)
+        types = headers["type"][keep]
+        applied = 0
+        for run in np.split(keep, np.flatnonzero(np.diff(types)) + 1):
+            if len(run):
+                applied += self._replay_run(int(headers["type"][run[0]]), seqs[run].tolist(),
+                                            headers["ts"][run].tolist(), [payloads[i] for i in run.tolist()])
+        return applied
+
+    def _replay_segment(self, path: str, after_seq: int) -> int:
+        """Apply records with seq > after_seq; truncates a torn tail. Returns events applied"""
+        applied = 0
+        size = os.path.getsize(path)
+        if size == 0:
+            return 0
+        header_size = EVENT_HEADER.size
+        read_length = EVENT_LENGTH.unpack_from
+        with open(path, "r+b") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # Record boundaries take one pass over the length fields; headers are
+            # then decoded together through EVENT_HEADER_DTYPE
+            starts = []
+            offset = 0
+            while offset + header_size <= size:
+                end = offset + header_size + read_length(mm, offset)[0]
+                if end > size:
+                    break
+                starts.append(offset)
+                offset = end
+            starts = np.array(starts, dtype=np.int64)
+            raw = np.frombuffer(mm, dtype=np.uint8)
+            headers = raw[starts[:, None] + np.arange(header_size)].view(EVENT_HEADER_DTYPE).ravel()
+            del raw  # the mmap can't close while NumPy holds its buffer
+
+            # Payloads are sliced, CRC-checked and applied a chunk at a time to bound memory
+            for chunk in range(0, len(starts), REPLAY_BATCH_EVENTS):
+                chunk_headers = headers[chunk:chunk + REPLAY_BATCH_EVENTS]
+                first = starts[chunk:chunk + REPLAY_BATCH_EVENTS] + header_size
+                payloads = list(map(mm.__getitem__, map(slice, first.tolist(), (first + chunk_headers["length"]).tolist())))
+                crcs = np.fromiter(map(zlib.crc32, payloads), np.uint32, len(payloads))
+                torn = np.flatnonzero(crcs != chunk_headers["crc"])
+                if len(torn):
+                    intact = int(torn[0])
+                    offset = int(starts[chunk + intact])
+                    applied += self._replay_records(chunk_headers[:intact], payloads[:intact], after_seq)
+                    break
+                applied += self._replay_records(chunk_headers, payloads, after_seq)
+        if offset < size:
+            print(f"Event log: truncating torn tail of {os.path.basename(path)} at byte {offset}")
+            os.truncate(path, offset)
+        return applied
+
+    def recover(self):
+        """Load the newest snapshot and replay the log after it"""
+        if not EVENT_LOG_ENABLED:
+            return
+        # The log decides subscriptions and progress, so it must not be writable by anyone else
+        ensure_private_dir(self.directory)
+        started = time.perf_counter()
+        for legacy in glob.glob(os.path.join(self.directory, "snapshot-*.pkl")):
+            print(f"Event log: ignoring legacy pickle snapshot {os.path.basename(legacy)}; it is never loaded")
+        snapshots = self._snapshots()
+        if snapshots:
+            seq, state = read_snapshot(snapshots[-1])
+            restore_state(load_state(state))
+            self.snapshot_seq = self.seq = seq
+        segments = self._segments()
+        for index, path in enumerate(segments):
+            # Skip segments that end before the snapshot
+            if index + 1 < len(segments) and self._first_seq(segments[index + 1]) <= self.snapshot_seq + 1:
+                continue
+            self.replayed_events += self._replay_segment(path, self.snapshot_seq)
+        self.replay_seconds = time.perf_counter() - started
+        if snapshots or self.replayed_events:
+            print(f"Event log: recovered to event #{self.seq} (snapshot #{self.snapshot_seq} + "
+                  f"{self.replayed_events} replayed events) in {self.replay_seconds:.2f}s")
+
+    def snapshot(self, force: bool = False) -> Optional[Callable[[], None]]:
+        """Capture state now; returns a blocking writer that encodes it, to run off the event loop.
+        force snapshots even with no new events (state replaced outside the log)"""
+        if not EVENT_LOG_ENABLED or (self.seq == self.snapshot_seq and not force):
+            return None
+        seq = self.seq
+        queue_offset = webhook_queue.read_offset
+        state = capture_state()
+        # Later appends go to a fresh segment so older segments can be dropped
+        self._open_segment()
+
+        def write():
+            self.fsync()
+            path = os.path.join(self.directory, f"snapshot-{seq:016d}.npz")
+            write_snapshot(path + ".tmp", seq, materialize_state(state))
+            os.replace(path + ".tmp", path)
+            for old in self._snapshots()[:-1]:
+                os.remove(old)
+            for segment in self._segments():
+                if self._first_seq(segment) <= seq and os.path.basename(segment) != os.path.basename(self.segment_file.name):
+                    os.remove(segment)
+            self.snapshot_seq = seq
+            self.last_snapshot_at = time.time()
+            # Queued webhooks before queue_offset are now in the snapshot or the log
+            webhook_queue.compact_offset = queue_offset
+
+        return write
+
+    def stats(self) -> Dict[str, Any]:
+        segments = self._segments() if EVENT_LOG_ENABLED else []
+        return {
+            "enabled": EVENT_LOG_ENABLED,
+            "seq": self.seq,
+            "segments": len(segments),
+            "log_bytes": sum(os.path.getsize(path) for path in segments),
+            "snapshot_seq": self.snapshot_seq,
+            "events_since_snapshot": self.seq - self.snapshot_seq,
+            "last_snapshot_at": self.last_snapshot_at,
+            "replayed_events": self.replayed_events,
+            "replay_errors": self.replay_errors,
+            "replay_seconds": round(self.replay_seconds, 3),
+        }
+
+event_log = EventLog(EVENT_LOG_DIR, EVENT_LOG_SEGMENT_BYTES)
+
+async def event_log_maintenance():
+    """Periodically fsync the log and take snapshots"""
+    loop = asyncio.get_running_loop()
+    last_snapshot = time.monotonic()
+    while True:
+        await asyncio.sleep(EVENT_LOG_FSYNC_SECONDS)
+        await loop.run_in_executor(None, event_log.fsync)
+        if time.monotonic() - last_snapshot >= SNAPSHOT_INTERVAL_SECONDS:
+            last_snapshot = time.monotonic()
+            writer = event_log.snapshot()
+            if writer is not None:
+                await loop.run_in_executor(None, writer)
+
+# ===== EXAM ASSEMBLY =====
+# Question IDs are pre-bucketed by (study area, nclex_category, difficulty)
+# whenever the bank changes. Assembling a form apportions the blueprint's
+# weights over those pools and samples each stratum with a seeded RNG, so a
+# form is reproducible from its seed and costs O(form length).
+
+ALL_AREAS = "*"
+
+class QuestionPools:
+    def __init__(self):
+        # (study area or ALL_AREAS, category) -> difficulty -> question IDs
+        self.strata: Dict[tuple, Dict[int, tuple]] = {}
+        self.by_area: Dict[str, tuple] = {}
+
+    def rebuild(self, questions: Dict[str, Question]):
+        strata: Dict[tuple, Dict[int, list]] = {}
+        by_area: Dict[str, list] = {}
+        for question in questions.values():
+            by_area.setdefault(question.study_area_id, []).append(question.id)
+            for area in (question.study_area_id, ALL_AREAS):
+                key = (area, question.nclex_category)
+                strata.setdefault(key, {}).setdefault(question.difficulty_level, []).append(question.id)
+        self.strata = {key: {level: tuple(ids) for level, ids in levels.items()} for key, levels in strata.items()}
+        self.by_area = {area: tuple(ids) for area, ids in by_area.items()}
+
+def apportion(total: int, weights: Dict[Any, float]) -> Dict[Any, int]:
+    """Split total across weighted keys with the largest-remainder method"""
+    weight_sum = sum(w for w in weights.values() if w > 0)
+    if total <= 0 or weight_sum <= 0:
+        return {key: 0 for key in weights}
+    exact = {key: total * max(w, 0) / weight_sum for key, w in weights.items()}
+    counts = {key: int(value) for key, value in exact.items()}
+    leftover = total - sum(counts.values())
+    for key in sorted(exact, key=lambda k: exact[k] - counts[k], reverse=True)[:leftover]:
+        counts[key] += 1
+    return counts
+
+def sample_excluding(pools: List[tuple], k: int, exclude: set, rng: random.Random) -> List[str]:
+    """Sample k IDs from several pools, skipping excluded ones, without concatenating them"""
+    total = sum(len(pool) for pool in pools)
+    if k <= 0 or total == 0:
+        return []
+    if total - len(exclude) <= 2 * k:
+        # Small remainder: materialize it
+        rest = [qid for pool in pools for qid in pool if qid not in exclude]
+        return rng.sample(rest, min(k, len(rest)))
+    # Large pools: rejection sampling touches O(k) entries
+    bounds = list(itertools.accumulate(len(pool) for pool in pools))
+    picked: List[str] = []
+    seen = set(exclude)
+    while len(picked) < k:
+        index = rng.randrange(total)
+        pool_index = bisect.bisect_right(bounds, index)
+        offset = index - (bounds[pool_index - 1] if pool_index else 0)
+        qid = pools[pool_index][offset]
+        if qid not in seen:
+            seen.add(qid)
+            picked.append(qid)
+    return picked
+
+def assemble_exam_form(blueprint: ExamBlueprint, pools: QuestionPools) -> tuple:
+    """Draw a stratified random form; returns (question IDs, seed used)"""
+    seed = blueprint.seed if blueprint.seed is not None else random.getrandbits(32)
+    rng = random.Random(seed)
+    area = blueprint.study_area_id or ALL_AREAS
+
+    available = {
+        category: pools.strata.get((area, category), {})
+        for category in blueprint.category_weights
+    }
+    weights = {
+        category: weight for category, weight in blueprint.category_weights.items()
+        if any(available[category].values())
+    }
+    selected: List[str] = []
+
+    for category, quota in apportion(blueprint.total_questions, weights).items():
+        levels = available[category]
+        mix = {level: share for level, share in blueprint.difficulty_mix.items() if levels.get(level)}
+        taken: List[str] = []
+        for level, level_quota in (apportion(quota, mix) if mix else {}).items():
+            pool = levels[level]
+            taken.extend(rng.sample(pool, min(level_quota, len(pool))))
+        # Difficulty levels that ran short are filled from the rest of the category
+        taken.extend(sample_excluding(list(levels.values()), quota - len(taken), set(taken), rng))
+        selected.extend(taken)
+
+    # Categories that ran short are backfilled from the other categories
+    shortfall = blueprint.total_questions - len(selected)
+    if shortfall > 0:
+        rest = [pool for levels in available.values() for pool in levels.values()]
+        selected.extend(sample_excluding(rest, shortfall, set(selected), rng))
+
+    rng.shuffle(selected)
+    return selected, seed
+
+# ===== QUESTION FRAGMENTS =====
+# Questions are immutable within a catalog snapshot, so each one is
+# serialized to JSON once per projection and list responses are assembled by
+# joining the cached bytes. Every catalog owns its own cache, so a content
+# reload starts from a fresh (pre-warmed) one.
+
+# Projection name -> pydantic include spec (None = every field)
+QUESTION_PROJECTIONS: Dict[str, Any] = {
+    "full": None,
+    # What students see before answering: no keys, no explanation
+    "student": {
+        **dict.fromkeys(("id", "question_text", "question_type", "difficulty_level",
+                         "nclex_category", "study_area_id", "time_limit"), True),
+        "options": {"__all__": {"id", "text"}},
+    },
+}
+
+def json_bytes(value: Any) -> bytes:
+    """Compact JSON, matching what JSONResponse renders"""
+    return json.dumps(value, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+class QuestionFragmentCache:
+    def __init__(self, questions: Dict[str, Question]):
+        self.questions = questions
+        self.fragments: Dict[str, Dict[str, bytes]] = {name: {} for name in QUESTION_PROJECTIONS}
+        self.hits = 0
+        self.misses = 0
+
+    def fragment(self, question_id: str, projection: str = "full") -> bytes:
+        cache = self.fragments[projection]
+        data = cache.get(question_id)
+        if data is None:
+            self.misses += 1
+            data = self.questions[question_id].model_dump_json(include=QUESTION_PROJECTIONS[projection]).encode("utf-8")
+            cache[question_id] = data
+        else:
+            self.hits += 1
+        return data
+
+    def warm(self, projection: str = "full"):
+        cache = self.fragments[projection]
+        include = QUESTION_PROJECTIONS[projection]
+        for question_id, question in self.questions.items():
+            cache[question_id] = question.model_dump_json(include=include).encode("utf-8")
+
+    def render_list(self, question_ids, projection: str = "full") -> bytes:
+        """JSON array of the given questions, built from cached fragments"""
+        return b"[" + b",".join(self.fragment(qid, projection) for qid in question_ids) + b"]"
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "cached_fragments": {name: len(cache) for name, cache in self.fragments.items()},
+            "cached_bytes": sum(len(data) for cache in self.fragments.values() for data in cache.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+# ===== GRADING =====
+# Each question's answer key is compiled once per catalog: options become bit
+# positions, a select-all-that-apply key becomes a bitmask and an ordered
+# response key a tuple of option indexes. Scoring a response is then a few
+# integer operations. Every item yields (points, max_points); an answer is
+# "correct" only with full marks, so partial credit never inflates accuracy.
+#
+#   dichotomous  all or nothing (default for single-answer and ordered items)
+#   plus_minus   NGN +/- rule: +1 per correct option chosen, -1 per incorrect
+#                one, floored at 0 (default for select-all-that-apply)
+#   position     ordered response, 1 point per option in the right place
+
+SINGLE_ANSWER_TYPES = {"multiple_choice", "true_false", "priority"}
+MULTIPLE_RESPONSE_TYPES = {"multiple_response", "select_all", "sata"}
+ORDERED_RESPONSE_TYPES = {"ordered_response", "drag_and_drop", "ordering"}
+DEFAULT_SCORING = {"single": "dichotomous", "multiple": "plus_minus", "ordered": "dichotomous"}
+SCORING_RULES = {"dichotomous", "plus_minus", "position"}
+
+class AnswerKey:
+    __slots__ = ("kind", "scoring", "option_bits", "key_mask", "order", "max_points")
+
+    def __init__(self, question: Question):
+        self.option_bits = {option.id: index for index, option in enumerate(question.options)}
+        if question.question_type in MULTIPLE_RESPONSE_TYPES:
+            self.kind = "multiple"
+            key_ids = question.correct_answer_ids or [o.id for o in question.options if o.is_correct]
+        elif question.question_type in ORDERED_RESPONSE_TYPES:
+            self.kind = "ordered"
+            key_ids = question.correct_answer_ids or [o.id for o in question.options]
+        else:
+            self.kind = "single"
+            key_ids = [question.correct_answer_id] if question.correct_answer_id else \
+                [o.id for o in question.options if o.is_correct][:1]
+        self.order = tuple(self.option_bits.get(option_id, -1) for option_id in key_ids)
+        self.key_mask = self.mask(key_ids)
+        self.scoring = question.scoring if question.scoring in SCORING_RULES else DEFAULT_SCORING[self.kind]
+        if self.scoring == "plus_minus" and self.kind == "multiple" and self.key_mask:
+            self.max_points = len(key_ids)
+        elif self.scoring == "position" and self.kind == "ordered" and self.key_mask:
+            self.max_points = len(self.order)
+        else:
+            # Rules that don't apply to the item type (or an unkeyed item, which
+            # must never score 0 of 0) fall back to all-or-nothing
+            self.scoring = "dichotomous"
+            self.max_points = 1
+
+    def mask(self, option_ids) -> int:
+        mask = 0
+        for option_id in option_ids:
+            bit = self.option_bits.get(option_id)
+            if bit is not None:
+                mask |= 1 << bit
+        return mask
+
+    def grade(self, response: Any) -> tuple:
+        """(points, max_points) for a response: an option ID or a list of them"""
+        if not self.key_mask:
+            return 0, self.max_points  # unkeyed item
+        if isinstance(response, str):
+            response = [response]
+        elif not isinstance(response, (list, tuple)):
+            return 0, self.max_points
+
+        if self.kind == "ordered":
+            order = tuple(self.option_bits.get(option_id, -1) for option_id in response)
+            if self.scoring == "position":
+                return sum(1 for given, expected in zip(order, self.order) if given == expected), self.max_points
+            return int(order == self.order), 1
+
+        mask = self.mask(response)
+        if len(response) != bin(mask).count("1"):
+            return 0, self.max_points  # unknown or repeated option IDs
+        if self.scoring == "plus_minus":
+            hits = bin(mask & self.key_mask).count("1")
+            misses = bin(mask & ~self.key_mask).count("1")
+            return max(0, hits - misses), self.max_points
+        return int(mask == self.key_mask), 1
+
+    def correct_response(self, question: Question) -> Any:
+        ids = [option.id for option in question.options]
+        if self.kind == "single":
+            return ids[self.order[0]] if self.order and self.order[0] >= 0 else None
+        return [ids[index] for index in self.order if index >= 0]
+
+def compile_answer_keys(questions: Dict[str, Question]) -> Dict[str, AnswerKey]:
+    return {question_id: AnswerKey(question) for question_id, question in questions.items()}
+
+def submitted_response(answer: Dict[str, Any]) -> Any:
+    """The response in an answer payload (the web client sends selected_option_id(s))"""
+    for field in ("selected_answer", "selected_option_ids", "selected_option_id"):
+        if answer.get(field) is not None:
+            return answer[field]
+    return None
+
+def grade_answers(content, answers: List[Dict[str, Any]], time_spent: Optional[float]) -> Dict[str, Any]:
+    """Score a submission against a catalog's compiled keys"""
+    graded = []
+    results = []
+    correct = points = max_points = 0
+    for answer in answers:
+        question_id = answer.get("question_id")
+        response = submitted_response(answer)
+        key = content.answer_keys.get(question_id)
+        if key is None:
+            # Unknown questions count as wrong
+            max_points += 1
+            results.append({"question_id": question_id, "correct": False, "points": 0, "max_points": 1,
+                            "selected_answer": response, "correct_answer": None})
+            continue
+        earned, possible = key.grade(response)
+        is_correct = earned == possible
+        correct += is_correct
+        points += earned
+        max_points += possible
+        graded.append((question_id, response, is_correct, answer_seconds(answer, time_spent, len(answers))))
+        results.append({"question_id": question_id, "correct": is_correct, "points": earned, "max_points": possible,
+                        "selected_answer": response,
+                        "correct_answer": key.correct_response(content.questions[question_id])})
+    return {"graded": graded, "results": results, "correct": correct, "points": points, "max_points": max_points}
+
+def grade_advanced_quiz(quiz_id: str, answers: List[Dict[str, Any]], time_spent: Optional[float],
+                        user_id: Optional[str] = None) -> Dict[str, Any]:
+    """Grade, log and build the advanced quiz result"""
+    total_questions = len(answers)
+    grading = grade_answers(catalog, answers, time_spent)
+    
+    if grading["graded"]:
+        now = time.time()
+        event = {"quiz_id": quiz_id, "user_id": user_id, "graded": grading["graded"]}
+        event_log.append(EVENT_ADVANCED_QUIZ_SUBMITTED, event, now)
+        apply_advanced_quiz_submission(event, now)
+    max_points = grading["max_points"]
+    score_percentage = (grading["points"] / max_points * 100) if max_points > 0 else 0
+    
+    return {
+        "quiz_id": quiz_id,
+        "score": score_percentage,
+        "correct_answers": grading["correct"],
+        "total_questions": total_questions,
+        "points": grading["points"],
+        "max_points": max_points,
+        "time_spent": time_spent,
+        "passed": score_percentage >= 75,
+        "detailed_results": grading["results"]
+    }
+
+# ===== NEAR-DUPLICATE DETECTION =====
+# Questions are reduced to MinHash signatures over word 3-shingles of the
+# stem plus the (sorted) option texts, so re-imports with fresh IDs and
+# reworded copies from overlapping banks land on nearly identical signatures.
+# Locality-sensitive hashing splits each signature into bands; questions that
+# share a band bucket are checked against the bucket's first member, and
+# confirmed pairs are joined with union-find. Everything is vectorized and
+# linear in the bank size apart from the (small) buckets themselves.
+
+MINHASH_PERMUTATIONS = 128
+LSH_BANDS = 16  # 16 bands x 8 rows: pairs above ~0.7 similarity almost always collide
+SHINGLE_WORDS = 3
+
+_minhash_rng = np.random.default_rng(20240601)
+MINHASH_A = _minhash_rng.integers(1, 2 ** 63, MINHASH_PERMUTATIONS, dtype=np.uint64) | np.uint64(1)
+MINHASH_B = _minhash_rng.integers(0, 2 ** 63, MINHASH_PERMUTATIONS, dtype=np.uint64)
+LSH_MIX = _minhash_rng.integers(1, 2 ** 63, MINHASH_PERMUTATIONS // LSH_BANDS, dtype=np.uint64) | np.uint64(1)
+
+def question_shingles(question: Question) -> List[int]:
+    """32-bit hashes of the word 3-grams (Python's hash is per-process, which is fine: signatures are never stored)"""
+    text = " ".join([question.question_text, *sorted(option.text for option in question.options)])
+    words = re.sub(r"[^a-z0-9]+", " ", text.lower()).split()
+    if len(words) < SHINGLE_WORDS:
+        return [hash(tuple(words)) & 0xFFFFFFFF]
+    return list({hash(gram) & 0xFFFFFFFF for gram in zip(*(words[i:] for i in range(SHINGLE_WORDS)))})
+
+def minhash_signatures(shingle_sets: List[List[int]]) -> np.ndarray:
+    """(questions x permutations) MinHash matrix using multiply-shift hashing"""
+    lengths = np.array([len(shingles) for shingles in shingle_sets], dtype=np.int64)
+    values = np.fromiter(itertools.chain.from_iterable(shingle_sets), dtype=np.uint64, count=int(lengths.sum()))
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    signatures = np.empty((len(shingle_sets), MINHASH_PERMUTATIONS), dtype=np.uint32)
+    # Work in tiles of whole questions so temporaries stay small
+    first = 0
+    while first < len(shingle_sets):
+        low = starts[first]
+        last = max(first + 1, int(np.searchsorted(starts, low + 16384, side="right")))
+        high = starts[last] if last < len(shingle_sets) else len(values)
+        tile = values[low:high, None]
+        offsets = starts[first:last] - low
+        for column in range(0, MINHASH_PERMUTATIONS, 16):
+            hashed = (tile * MINHASH_A[column:column + 16] + MINHASH_B[column:column + 16]) >> np.uint64(32)
+            signatures[first:last, column:column + 16] = np.minimum.reduceat(hashed, offsets, axis=0)
+        first = last
+    return signatures
+
+def find_near_duplicates(questions: Dict[str, Question], threshold: float = DEDUP_THRESHOLD) -> List[Dict[str, Any]]:
+    """Clusters of near-duplicate questions; the first question (in bank order) of each is the keeper"""
+    ids = list(questions)
+    if len(ids) < 2:
+        return []
+    signatures = minhash_signatures([question_shingles(questions[qid]) for qid in ids])
+    parent = np.arange(len(ids))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    rows = MINHASH_PERMUTATIONS // LSH_BANDS
+    similarity: Dict[int, float] = {}
+    for band in range(LSH_BANDS):
+        keys = signatures[:, band * rows:(band + 1) * rows].astype(np.uint64) @ LSH_MIX
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        # Pair every bucket member with the bucket's first question
+        is_head = np.concatenate(([True], sorted_keys[1:] != sorted_keys[:-1]))
+        head_position = np.maximum.accumulate(np.where(is_head, np.arange(len(order)), 0))
+        members = order[~is_head]
+        heads = order[head_position[~is_head]]
+        estimates = (signatures[members] == signatures[heads]).mean(axis=1)
+        confirmed = estimates >= threshold
+        for head, member, estimate in zip(heads[confirmed], members[confirmed], estimates[confirmed]):
+            root_a, root_b = find(head), find(member)
+            if root_a != root_b:
+                parent[max(root_a, root_b)] = min(root_a, root_b)
+            similarity[member] = max(similarity.get(member, 0.0), float(estimate))
+
+    clusters: Dict[int, List[int]] = {}
+    for index in similarity:
+        clusters.setdefault(find(index), []).append(index)
+    report = []
+    for root, members in clusters.items():
+        members = sorted(set(members) | {root})
+        keeper = members[0]
+        report.append({
+            "kept": ids[keeper],
+            "duplicates": [
+                {"question_id": ids[m], "similarity": round(float((signatures[m] == signatures[keeper]).mean()), 3)}
+                for m in members[1:]
+            ],
+        })
+    report.sort(key=lambda cluster: -len(cluster["duplicates"]))
+    return report
+
+# ===== CONTENT CATALOG =====
+# Study areas, questions and flashcards are published as one immutable
+# snapshot together with everything derived from them (exam pools, JSON
+# fragments). A reload builds the next snapshot in a worker thread and then
+# rebinds the module-level `catalog` in a single assignment; handlers read
+# `catalog` once, so in-flight requests finish against the snapshot they
+# started with and nobody ever sees a half-built bank.
+#
+# Content comes from CONTENT_DIR: study_areas.json, questions.json and
+# flashcards.json (each a JSON list of objects) replace the corresponding
+# built-in section. The directory is polled for changes, and admin uploads
+# are written there so they survive restarts.
+
+CONTENT_SECTIONS = {"study_areas": StudyArea, "questions": Question, "flashcards": Flashcard}
+
+class ContentCatalog:
+    def __init__(self, study_areas: Dict[str, StudyArea], questions: Dict[str, Question],
+                 flashcards: Dict[str, Flashcard], source: str, version: int = 0):
+        self.duplicates = find_near_duplicates(questions) if CONTENT_DEDUP_MODE in ("flag", "merge") else []
+        self.duplicates_removed = 0
+        if CONTENT_DEDUP_MODE == "merge" and self.duplicates:
+            dropped = {d["question_id"] for cluster in self.duplicates for d in cluster["duplicates"]}
+            questions = {qid: q for qid, q in questions.items() if qid not in dropped}
+            self.duplicates_removed = len(dropped)
+        self.study_areas = study_areas
+        self.questions = questions
+        self.flashcards = flashcards
+        self.source = source
+        self.version = version
+        self.loaded_at = datetime.now()
+        self.pools = QuestionPools()
+        self.pools.rebuild(questions)
+        self.answer_keys = compile_answer_keys(questions)
+        self.fragments = QuestionFragmentCache(questions)
+        self.fragments.warm()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "source": self.source,
+            "loaded_at": self.loaded_at,
+            "study_areas": len(self.study_areas),
+            "questions": len(self.questions),
+            "flashcards": len(self.flashcards),
+            "duplicate_clusters": len(self.duplicates),
+            "duplicates_removed": self.duplicates_removed,
+            "fragments": self.fragments.stats(),
+        }
+
+catalog = ContentCatalog({}, {}, {}, source="empty")
+builtin_content: Dict[str, Dict[str, Any]] = {section: {} for section in CONTENT_SECTIONS}
+
+def install_catalog(new_catalog: ContentCatalog):
+    """Publish a fully built snapshot"""
+    global catalog
+    new_catalog.version = catalog.version + 1
+    catalog = new_catalog
+
+def parse_content_section(section: str, items: List[dict]) -> Dict[str, Any]:
+    model = CONTENT_SECTIONS[section]
+    parsed = {}
+    for item in items:
+        obj = model(**item)
+        parsed[obj.id] = obj
+    return parsed
+
+def content_dir_signature() -> tuple:
+    """(file, mtime, size) for every section file present in CONTENT_DIR"""
+    signature = []
+    for section in CONTENT_SECTIONS:
+        path = os.path.join(CONTENT_DIR, f"{section}.json")
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            continue
+        signature.append((section, st.st_mtime_ns, st.st_size))
+    return tuple(signature)
+
+def build_catalog_from_dir() -> ContentCatalog:
+    """Parse CONTENT_DIR over the built-in content and build every index (runs off the event loop)"""
+    sections = dict(builtin_content)
+    loaded = []
+    for section in CONTENT_SECTIONS:
+        path = os.path.join(CONTENT_DIR, f"{section}.json")
+        if os.path.exists(path):
+            with open(path) as f:
+                sections[section] = parse_content_section(section, json.load(f))
+            loaded.append(section)
+    source = f"{CONTENT_DIR} ({', '.join(loaded)})" if loaded else "built-in"
+    return ContentCatalog(sections["study_areas"], sections["questions"], sections["flashcards"], source=source)
+
+def write_content_section(section: str, items: List[dict]):
+    os.makedirs(CONTENT_DIR, exist_ok=True)
+    path = os.path.join(CONTENT_DIR, f"{section}.json")
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(items, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+class ContentReloader:
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.signature: tuple = ()
+        self.reloads = 0
+        self.last_error: Optional[str] = None
+        self.last_reload_ms: Optional[float] = None
+
+    async def reload(self) -> ContentCatalog:
+        """Build a new snapshot in a worker thread and swap it in; the old one keeps serving meanwhile"""
+        async with self.lock:
+            signature = content_dir_signature()
+            started = time.perf_counter()
+            try:
+                new_catalog = await asyncio.get_running_loop().run_in_executor(None, build_catalog_from_dir)
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                self.signature = signature  # don't retry a broken file until it changes again
+                print(f"Content reload failed, keeping version {catalog.version}: {self.last_error}")
+                raise
+            install_catalog(new_catalog)
+            self.signature = signature
+            self.reloads += 1
+            self.last_error = None
+            self.last_reload_ms = round((time.perf_counter() - started) * 1000, 1)
+            print(f"Content catalog v{catalog.version} loaded from {catalog.source} in {self.last_reload_ms}ms")
+            return new_catalog
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "content_dir": CONTENT_DIR,
+            "poll_seconds": CONTENT_POLL_SECONDS,
+            "reloads": self.reloads,
+            "last_reload_ms": self.last_reload_ms,
+            "last_error": self.last_error,
+        }
+
+content_reloader = ContentReloader()
+
+async def content_watcher():
+    """Reload the catalog whenever a file in CONTENT_DIR changes"""
+    while True:
+        await asyncio.sleep(CONTENT_POLL_SECONDS)
+        if content_dir_signature() != content_reloader.signature:
+            try:
+                await content_reloader.reload()
+            except Exception:
+                pass  # already logged; keep serving the current snapshot
+
+class ContentUpload(BaseModel):
+    study_areas: Optional[List[dict]] = None
+    questions: Optional[List[dict]] = None
+    flashcards: Optional[List[dict]] = None
+
+# ===== COHORT ANALYTICS =====
+# Cohort dashboards are computed in the background: progress is copied into
+# plain NumPy arrays one partition of users at a time, each partition is
+# aggregated in a worker process, and the merged result is cached. Handlers
+# only ever read the cache (and trigger a refresh when it is stale).
+
+ALL_USERS_COHORT = "all"
+
+def compute_cohort_partition(user_ids: List[str], attempted: np.ndarray, correct: np.ndarray,
+                             session_users: np.ndarray, session_days: np.ndarray,
+                             session_scores: np.ndarray) -> Dict[str, Any]:
+    """Aggregate one partition of users (runs in a worker process)"""
+    n = len(user_ids)
+    total_attempted = attempted.sum(axis=1)
+    total_correct = correct.sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        accuracy = np.where(attempted > 0, correct / attempted, np.nan)
+        overall = np.where(total_attempted > 0, total_correct / total_attempted, np.nan)
+
+    # Per-user least-squares slope of session score over days, via grouped sums
+    x = (session_days - session_days.min()).astype(np.float64) if len(session_days) else session_days.astype(np.float64)
+    y = session_scores.astype(np.float64)
+    count = np.bincount(session_users, minlength=n).astype(np.float64)
+    sum_x = np.bincount(session_users, weights=x, minlength=n)
+    sum_y = np.bincount(session_users, weights=y, minlength=n)
+    sum_xy = np.bincount(session_users, weights=x * y, minlength=n)
+    sum_xx = np.bincount(session_users, weights=x * x, minlength=n)
+    denominator = count * sum_xx - sum_x ** 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = np.where((count >= 2) & (denominator > 0), (count * sum_xy - sum_x * sum_y) / denominator, np.nan)
+
+    low_accuracy = (total_attempted >= AT_RISK_MIN_ATTEMPTED) & (overall < AT_RISK_ACCURACY)
+    declining = slope < -1.0  # losing more than a point per day
+    at_risk = []
+    for i in np.flatnonzero(low_accuracy | declining):
+        reasons = []
+        if low_accuracy[i]:
+            reasons.append("low_accuracy")
+        if declining[i]:
+            reasons.append("declining_scores")
+        at_risk.append({
+            "user_id": user_ids[i],
+            "accuracy": round(float(overall[i]), 4),
+            "score_trend_per_day": None if np.isnan(slope[i]) else round(float(slope[i]), 3),
+            "reasons": reasons,
+        })
+
+    days, day_index = np.unique(session_days, return_inverse=True)
+    return {
+        "user_ids": user_ids,
+        "accuracy": accuracy,
+        "area_attempted": attempted.sum(axis=0),
+        "area_correct": correct.sum(axis=0),
+        "at_risk": at_risk,
+        "days": days,
+        "day_score_sums": np.bincount(day_index, weights=y, minlength=len(days)),
+        "day_counts": np.bincount(day_index, minlength=len(days)),
+    }
+
+def extract_cohort_partition(user_ids: List[str], areas: List[str]) -> tuple:
+    """Copy a partition's progress into arrays the worker processes can take"""
+    area_position = {area: i for i, area in enumerate(areas)}
+    attempted = np.zeros((len(user_ids), len(areas)), dtype=np.int64)
+    correct = np.zeros((len(user_ids), len(areas)), dtype=np.int64)
+    session_users, session_days, session_scores = [], [], []
+    for row, user_id in enumerate(user_ids):
+        for study_area_id, progress in user_progress_db.for_user(user_id).items():
+            column = area_position.get(study_area_id)
+            if column is not None:
+                attempted[row, column] = progress.questions_attempted
+                correct[row, column] = progress.questions_correct
+            for session in progress.quiz_sessions:
+                session_users.append(row)
+                session_days.append(datetime.fromisoformat(session["date"]).toordinal())
+                session_scores.append(session["score"])
+    return (user_ids, attempted, correct, np.array(session_users, dtype=np.int64),
+            np.array(session_days, dtype=np.int64), np.array(session_scores, dtype=np.float64))
+
+def merge_cohort_partitions(cohort_id: str, areas: List[str], partials: List[Dict[str, Any]]) -> Dict[str, Any]:
+    area_attempted = sum((p["area_attempted"] for p in partials), np.zeros(len(areas), dtype=np.int64))
+    area_correct = sum((p["area_correct"] for p in partials), np.zeros(len(areas), dtype=np.int64))
+    day_sums: Dict[int, float] = {}
+    day_counts: Dict[int, int] = {}
+    for partial in partials:
+        for day, total, count in zip(partial["days"], partial["day_score_sums"], partial["day_counts"]):
+            day_sums[int(day)] = day_sums.get(int(day), 0.0) + float(total)
+            day_counts[int(day)] = day_counts.get(int(day), 0) + int(count)
+
+    matrix = np.vstack([p["accuracy"] for p in partials]) if partials else np.zeros((0, len(areas)))
+    return {
+        "cohort_id": cohort_id,
+        "user_count": int(matrix.shape[0]),
+        "computed_at": datetime.now().isoformat(),
+        "areas": [
+            {
+                "study_area_id": area,
+                "questions_attempted": int(area_attempted[i]),
+                "questions_correct": int(area_correct[i]),
+                "accuracy": round(float(area_correct[i] / area_attempted[i]), 4) if area_attempted[i] else None,
+            }
+            for i, area in enumerate(areas)
+        ],
+        "accuracy_matrix": {
+            "user_ids": [user_id for p in partials for user_id in p["user_ids"]],
+            "study_area_ids": areas,
+            "values": [[None if np.isnan(v) else round(float(v), 4) for v in row] for row in matrix],
+        },
+        "at_risk": [student for p in partials for student in p["at_risk"]],
+        "trend": [
+            {
+                "date": datetime.fromordinal(day).date().isoformat(),
+                "mean_score": round(day_sums[day] / day_counts[day], 2),
+                "sessions": day_counts[day],
+            }
+            for day in sorted(day_sums)
+        ],
+    }
+
+class CohortAnalytics:
+    def __init__(self):
+        self.results: Dict[str, Dict[str, Any]] = {}
+        self.computed_at: Dict[str, float] = {}
+        self.refreshing: Dict[str, asyncio.Task] = {}
+        self.executor = None
+
+    def _executor(self):
+        if self.executor is None:
+            try:
+                # Workers must not be forked from a process running the Stripe and
+                # profiler threads; forkserver (or spawn) starts them from a clean one
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+                self.executor = ProcessPoolExecutor(max_workers=COHORT_WORKERS, mp_context=context)
+            except (OSError, NotImplementedError, ValueError):
+                # No multiprocessing support (e.g. some serverless sandboxes)
+                self.executor = ThreadPoolExecutor(max_workers=COHORT_WORKERS, thread_name_prefix="cohort")
+        return self.executor
+
+    def cohort_user_ids(self, cohort_id: str) -> List[str]:
+        if cohort_id == ALL_USERS_COHORT:
+            return list(user_progress_db.user_ids())
+        return list(cohorts_db[cohort_id].user_ids)
+
+    async def _refresh(self, cohort_id: str):
+        loop = asyncio.get_running_loop()
+        executor = self._executor()
+        try:
+            user_ids = self.cohort_user_ids(cohort_id)
+            areas = list(catalog.study_areas)
+            futures = []
+            for start in range(0, len(user_ids), COHORT_PARTITION_USERS):
+                partition = extract_cohort_partition(user_ids[start:start + COHORT_PARTITION_USERS], areas)
+                futures.append(loop.run_in_executor(executor, compute_cohort_partition, *partition))
+                await asyncio.sleep(0)  # let requests run between partitions
+            partials = await asyncio.gather(*futures)
+            self.results[cohort_id] = merge_cohort_partitions(cohort_id, areas, partials)
+            self.computed_at[cohort_id] = time.monotonic()
+        except BrokenProcessPool as e:
+            # A worker died (e.g. OOM-killed) and the pool refuses all further work;
+            # replace it so the next request's refresh can succeed
+            print(f"Cohort analytics workers died ({e}); restarting the pool")
+            if self.executor is executor:
+                self.executor = None
+                executor.shutdown(wait=False, cancel_futures=True)
+        except Exception as e:
+            print(f"Cohort analytics refresh failed for {cohort_id}: {e}")
+        finally:
+            self.refreshing.pop(cohort_id, None)
+
+    def request_refresh(self, cohort_id: str):
+        if cohort_id not in self.refreshing:
+            self.refreshing[cohort_id] = asyncio.create_task(self._refresh(cohort_id))
+
+    def get(self, cohort_id: str) -> Optional[Dict[str, Any]]:
+        """Cached result (possibly stale); schedules a refresh when missing or stale"""
+        computed_at = self.computed_at.get(cohort_id)
+        if computed_at is None or time.monotonic() - computed_at >= COHORT_REFRESH_SECONDS:
+            self.request_refresh(cohort_id)
+        return self.results.get(cohort_id)
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+cohort_analytics = CohortAnalytics()
+
+# ===== STREAMING EXPORTS =====
+# Exports walk the stores lazily and encode a bounded chunk of rows at a
+# time, so memory use depends on EXPORT_CHUNK_ROWS, not on export size. Rows
+# are produced on the event loop (the stores are not thread-safe) and the
+# loop is yielded between chunks.
+
+# Column name -> Parquet (pyarrow) type
+EXPORT_COLUMNS = {
+    "quiz_sessions": {
+        "user_id": "string", "study_area_id": "string", "date": "string", "score": "float64",
+        "questions_attempted": "int64", "questions_correct": "int64", "time_spent": "float64",
+    },
+    "flashcard_progress": {
+        "user_id": "string", "flashcard_id": "string", "ease_factor": "float64", "repetitions": "int64",
+        "interval_days": "float64", "next_review_date": "string", "status": "string",
+    },
+}
+
+class ExportFilters(BaseModel):
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
+    study_area_id: Optional[str] = None
+    cohort_id: Optional[str] = None
+
+def _export_user_ids(filters: ExportFilters) -> List[str]:
+    if filters.cohort_id:
+        return list(cohorts_db[filters.cohort_id].user_ids)
+    if filters.study_area_id:
+        return list(user_progress_db.for_area(filters.study_area_id))
+    return list(user_progress_db.user_ids())
+
+def iter_quiz_session_rows(filters: ExportFilters):
+    start = filters.start.isoformat() if filters.start else None
+    end = filters.end.isoformat() if filters.end else None
+    for user_id in _export_user_ids(filters):
+        for study_area_id, progress in list(user_progress_db.for_user(user_id).items()):
+            if filters.study_area_id and study_area_id != filters.study_area_id:
+                continue
+            for session in list(progress.quiz_sessions):
+                date = session["date"]
+                if (start and date < start) or (end and date >= end):
+                    continue
+                yield (user_id, study_area_id, date, session["score"], session["questions_attempted"],
+                       session["questions_correct"], session.get("time_spent"))
+
+def iter_flashcard_progress_rows(filters: ExportFilters):
+    store = flashcard_progress_db
+    user_ids = list(cohorts_db[filters.cohort_id].user_ids) if filters.cohort_id else list(store.user_index)
+    start = filters.start.timestamp() if filters.start else None
+    end = filters.end.timestamp() if filters.end else None
+    for user_id in user_ids:
+        rows = store.user_rows_of(user_id)
+        due = store.columns["due"][rows]
+        if start is not None:
+            rows = rows[due >= start]
+            due = store.columns["due"][rows]
+        if end is not None:
+            rows = rows[due < end]
+        for row in rows:
+            yield (user_id, store.card_names[store.columns["card"][row]], round(float(store.columns["ease"][row]), 4),
+                   int(store.columns["repetitions"][row]), float(store.columns["interval"][row]),
+                   datetime.fromtimestamp(int(store.columns["due"][row])).isoformat(),
+                   FLASHCARD_STATUSES[store.columns["status"][row]])
+
+EXPORT_SOURCES = {
+    "quiz_sessions": iter_quiz_session_rows,
+    "flashcard_progress": iter_flashcard_progress_rows,
+}
+
+class _DrainableBuffer(io.RawIOBase):
+    """Write-only sink whose contents are handed out and discarded chunk by chunk"""
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffer.extend(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self) -> bytes:
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+async def export_chunks(dataset: str, export_format: str, filters: ExportFilters):
+    """Yield encoded chunks (CSV or Parquet row groups) of a dataset"""
+    columns = list(EXPORT_COLUMNS[dataset])
+    rows = EXPORT_SOURCES[dataset](filters)
+
+    if export_format == "parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        schema = pa.schema([(name, getattr(pa, type_name)()) for name, type_name in EXPORT_COLUMNS[dataset].items()])
+        sink = _DrainableBuffer()
+        writer = pq.ParquetWriter(sink, schema)
+        while True:
+            chunk = list(itertools.islice(rows, EXPORT_CHUNK_ROWS))
+            if chunk:
+                writer.write_table(pa.Table.from_pylist([dict(zip(columns, row)) for row in chunk], schema=schema))
+                yield sink.drain()
+            if len(chunk) < EXPORT_CHUNK_ROWS:
+                break
+            await asyncio.sleep(0)
+        writer.close()
+        yield sink.drain()
+        return
+
+    text = io.StringIO()
+    out = csv.writer(text)
+    out.writerow(columns)
+    while True:
+        chunk = list(itertools.islice(rows, EXPORT_CHUNK_ROWS))
+        out.writerows(chunk)
+        yield text.getvalue().encode()
+        text.seek(0)
+        text.truncate()
+        if len(chunk) < EXPORT_CHUNK_ROWS:
+            break
+        await asyncio.sleep(0)
+
+export_jobs: Dict[str, Dict[str, Any]] = {}
+
+async def export_to_file(job_id: str, path: str, dataset: str, export_format: str, filters: ExportFilters):
+    loop = asyncio.get_running_loop()
+    job = export_jobs[job_id]
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            async for chunk in export_chunks(dataset, export_format, filters):
+                await loop.run_in_executor(None, f.write, chunk)
+                job["bytes_written"] += len(chunk)
+        job["status"] = "complete"
+    except Exception as e:
+        job["status"] = "failed"
+        job["error"] = str(e)
+
+# ===== TIMER WHEEL =====
+# Hierarchical timing wheel (as in the Linux kernel): four levels of
+# 256/64/64/64 slots, each slot a dict of pending timers. Scheduling and
+# cancelling are O(1); one asyncio task advances the wheel every tick, and
+# timers in coarser levels are cascaded down as their slot comes round.
+
+TIMER_LEVEL_BITS = (8, 6, 6, 6)
+
+class TimerWheel:
+    def __init__(self, tick_seconds: float):
+        self.tick_seconds = tick_seconds
+        self.shifts = [sum(TIMER_LEVEL_BITS[:level]) for level in range(len(TIMER_LEVEL_BITS))]
+        self.levels: List[List[Dict[Any, tuple]]] = [[{} for _ in range(1 << bits)] for bits in TIMER_LEVEL_BITS]
+        self.locations: Dict[Any, tuple] = {}  # key -> (level, slot)
+        self.current = 0  # ticks since start
+        self.started = time.monotonic()
+        self.fired = 0
+
+    def __len__(self):
+        return len(self.locations)
+
+    def schedule(self, key: Any, delay_seconds: float, callback: Callable[[], None]):
+        """Run callback after delay_seconds (rounded up to a tick); replaces any timer with the same key"""
+        self.cancel(key)
+        ticks = max(1, math.ceil(delay_seconds / self.tick_seconds))
+        self._place(key, self.current + ticks, callback)
+
+    def cancel(self, key: Any) -> bool:
+        location = self.locations.pop(key, None)
+        if location is None:
+            return False
+        level, slot = location
+        del self.levels[level][slot][key]
+        return True
+
+    def _place(self, key: Any, expiry: int, callback: Callable[[], None]):
+        delta = expiry - self.current
+        level = 0
+        while level < len(TIMER_LEVEL_BITS) - 1 and delta >= 1 << (self.shifts[level] + TIMER_LEVEL_BITS[level]):
+            level += 1
+        # Beyond the top level's span the timer parks in its farthest slot and is re-placed on cascade
+        expiry_slot = min(expiry, self.current + (1 << (self.shifts[level] + TIMER_LEVEL_BITS[level])) - 1)
+        slot = (expiry_slot >> self.shifts[level]) & ((1 << TIMER_LEVEL_BITS[level]) - 1)
+        self.levels[level][slot][key] = (expiry, callback)
+        self.locations[key] = (level, slot)
+
+    def _cascade(self, level: int):
+        slot = (self.current >> self.shifts[level]) & ((1 << TIMER_LEVEL_BITS[level]) - 1)
+        timers = self.levels[level][slot]
+        self.levels[level][slot] = {}
+        for key, (expiry, callback) in timers.items():
+            self._place(key, expiry, callback)
+
+    def advance(self):
+        """Move one tick forward and run the timers that expire on it"""
+        self.current += 1
+        # Cascade from the coarsest level whose slot boundary was crossed down to level 1
+        for level in range(len(TIMER_LEVEL_BITS) - 1, 0, -1):
+            if self.current & ((1 << self.shifts[level]) - 1) == 0:
+                self._cascade(level)
+        slot = self.current & ((1 << TIMER_LEVEL_BITS[0]) - 1)
+        due = self.levels[0][slot]
+        self.levels[0][slot] = {}
+        for key, (expiry, callback) in due.items():
+            if expiry > self.current:
+                self._place(key, expiry, callback)
+                continue
+            del self.locations[key]
+            self.fired += 1
+            try:
+                callback()
+            except Exception as e:
+                print(f"Timer {key!r} failed: {e}")
+
+    async def run(self):
+        """Drive the wheel from the monotonic clock, catching up on ticks missed while the loop was busy"""
+        while True:
+            next_tick = self.started + (self.current + 1) * self.tick_seconds
+            await asyncio.sleep(max(0.0, next_tick - time.monotonic()))
+            while time.monotonic() >= self.started + (self.current + 1) * self.tick_seconds:
+                self.advance()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "tick_seconds": self.tick_seconds,
+            "pending_timers": len(self.locations),
+            "timers_per_level": [sum(len(slot) for slot in level) for level in self.levels],
+            "fired": self.fired,
+            "lag_ticks": max(0, int((time.monotonic() - self.started) / self.tick_seconds) - self.current),
+        }
+
+timer_wheel = TimerWheel(TIMER_TICK_SECONDS)
+
+# ===== TIMED EXAMS =====
+# Timed quizzes get a server-side session with a deadline on the timer wheel.
+# Answers can be saved as the student goes; when time runs out (plus a short
+# grace period for in-flight submissions) the session is graded from whatever
+# was saved. Finished sessions keep their result for EXAM_RESULT_TTL_SECONDS.
+
+TIMED_QUIZ_TYPES = {"timed", "exam", "nclex", "nclex_simulation"}
+
+class ExamSession:
+    __slots__ = ("quiz_id", "user_id", "question_ids", "started_at", "deadline", "answers", "result")
+
+    def __init__(self, quiz_id: str, user_id: str, question_ids: List[str], time_limit: int):
+        self.quiz_id = quiz_id
+        self.user_id = user_id
+        self.question_ids = question_ids
+        self.started_at = time.time()
+        self.deadline = self.started_at + time_limit
+        self.answers: Dict[str, Dict[str, Any]] = {}
+        self.result: Optional[Dict[str, Any]] = None
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "quiz_id": self.quiz_id,
+            "status": "finished" if self.result else "in_progress",
+            "expires_at": datetime.fromtimestamp(self.deadline),
+            "seconds_remaining": max(0, round(self.deadline - time.time())) if not self.result else 0,
+            "answered": len(self.answers),
+            "total_questions": len(self.question_ids),
+            "result": self.result,
+        }
+
+exam_sessions: Dict[str, ExamSession] = {}
+
+def exam_time_limit(minutes: Optional[float], quiz_type: str, question_ids) -> Optional[int]:
+    """Seconds allowed: the requested limit in minutes (validated by the request model), else per-question limits for timed types"""
+    if minutes:
+        return max(1, int(minutes * 60))
+    if quiz_type in TIMED_QUIZ_TYPES and question_ids:
+        questions = catalog.questions
+        return sum(questions[qid].time_limit or DEFAULT_QUESTION_SECONDS for qid in question_ids)
+    return None
+
+def start_exam_session(quiz_id: str, user_id: str, question_ids: List[str], time_limit: int) -> ExamSession:
+    session = exam_sessions[quiz_id] = ExamSession(quiz_id, user_id, list(question_ids), time_limit)
+    timer_wheel.schedule(("exam", quiz_id), time_limit + EXAM_GRACE_SECONDS, lambda: expire_exam_session(quiz_id))
+    return session
+
+def save_exam_answers_to(session: ExamSession, answers: List[Dict[str, Any]]):
+    allowed = set(session.question_ids)
+    for answer in answers:
+        if answer.get("question_id") in allowed:
+            session.answers[answer["question_id"]] = answer
+
+def finish_exam_session(session: ExamSession, auto_submitted: bool) -> Dict[str, Any]:
+    """Grade every question on the form; unanswered ones count as wrong"""
+    timer_wheel.cancel(("exam", session.quiz_id))
+    answers = [session.answers.get(qid, {"question_id": qid}) for qid in session.question_ids]
+    time_spent = round(min(time.time(), session.deadline) - session.started_at)
+    session.result = {**grade_advanced_quiz(session.quiz_id, answers, time_spent, session.user_id), "auto_submitted": auto_submitted}
+    quiz_id = session.quiz_id
+    timer_wheel.schedule(("exam-result", quiz_id), EXAM_RESULT_TTL_SECONDS, lambda: exam_sessions.pop(quiz_id, None))
+    return session.result
+
+def expire_exam_session(quiz_id: str):
+    """Timer callback: grade whatever answers were saved"""
+    session = exam_sessions.get(quiz_id)
+    if session is not None and session.result is None:
+        finish_exam_session(session, auto_submitted=True)
+
+# ===== LIVE CLASSROOMS =====
+# An instructor pushes questions to a room of students over WebSockets.
+# Every outgoing message is serialized once and the same string is queued to
+# each member; a per-member sender task drains its bounded queue. Answers
+# update the room's histogram in O(1) and histogram broadcasts are coalesced
+# to one per LIVE_HISTOGRAM_INTERVAL_SECONDS. A member whose queue is full
+# simply misses histogram updates (the next one supersedes them), but one that
+# can't keep up with questions or results is disconnected.
+#
+# Only instructors (LIVE_INSTRUCTORS, or callers with the admin key) open rooms,
+# within per-instructor and global caps, and only they (by instructor key) or
+# an admin can read a room's stats. A room holds at most LIVE_MAX_ROOM_MEMBERS
+# students. It ends LIVE_ROOM_IDLE_SECONDS after its instructor leaves (or if
+# they never connect), and after LIVE_ROOM_TTL_SECONDS regardless.
+
+SLOW_CONSUMER_CLOSE_CODE = 4008
+ROOM_FULL_CLOSE_CODE = 4029
+
+class RoomMember:
+    __slots__ = ("member_id", "name", "websocket", "queue", "sender")
+
+    def __init__(self, member_id: str, name: str, websocket: WebSocket):
+        self.member_id = member_id
+        self.name = name
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=LIVE_SEND_QUEUE)
+        self.sender = asyncio.create_task(self._send_loop())
+
+    async def _send_loop(self):
+        try:
+            while True:
+                frame = await self.queue.get()
+                if frame is None:
+                    await self.websocket.close()
+                    break
+                await self.websocket.send_text(frame)
+        except Exception:
+            pass  # connection gone; the receive loop cleans up
+
+    def reply(self, message: Dict[str, Any]):
+        """Queue a message for this member only; dropped if the member is that far behind"""
+        try:
+            self.queue.put_nowait(json.dumps(message, separators=(",", ":")))
+        except asyncio.QueueFull:
+            pass
+
+    def stop(self):
+        self.sender.cancel()
+
+def response_key(response: Any) -> str:
+    """Histogram bucket for a response: the option ID, or the IDs joined in order"""
+    if isinstance(response, (list, tuple)):
+        return ",".join(str(option_id) for option_id in response)
+    return str(response)
+
+class ClassroomRoom:
+    def __init__(self, code: str, instructor_id: str):
+        self.code = code
+        self.instructor_id = instructor_id
+        self.instructor_key = secrets.token_urlsafe(16)
+        self.created_at = datetime.now()
+        self.members: Dict[str, RoomMember] = {}
+        self.instructor: Optional[RoomMember] = None
+        self.question_id: Optional[str] = None
+        self.question_number = 0
+        self.open = False
+        self.responses: Dict[str, Any] = {}
+        self.counts: Dict[str, int] = {}
+        self.dirty = False
+        self.frames_sent = 0
+        self.histograms_skipped = 0
+        self.slow_disconnects = 0
+        self.flusher: Optional[asyncio.Task] = None
+
+    def is_instructor_key(self, key: Optional[str]) -> bool:
+        return key is not None and hmac.compare_digest(key.encode(), self.instructor_key.encode())
+
+    def recipients(self) -> List[RoomMember]:
+        members = list(self.members.values())
+        return members + [self.instructor] if self.instructor else members
+
+    def broadcast(self, message: Dict[str, Any], critical: bool = True):
+        self.broadcast_frame(json.dumps(message, separators=(",", ":"), default=str), critical)
+
+    def broadcast_frame(self, frame: str, critical: bool = True):
+        for member in self.recipients():
+            try:
+                member.queue.put_nowait(frame)
+                self.frames_sent += 1
+            except asyncio.QueueFull:
+                if critical:
+                    self.drop_slow(member)
+                else:
+                    self.histograms_skipped += 1
+
+    def drop_slow(self, member: RoomMember):
+        self.slow_disconnects += 1
+        self.remove(member.member_id)
+        asyncio.create_task(member.websocket.close(code=SLOW_CONSUMER_CLOSE_CODE))
+
+    def remove(self, member_id: str):
+        member = self.members.pop(member_id, None)
+        if member is None and self.instructor and self.instructor.member_id == member_id:
+            member, self.instructor = self.instructor, None
+        if member is not None:
+            member.stop()
+            self.dirty = True
+
+    def histogram(self) -> Dict[str, Any]:
+        return {
+            "type": "histogram",
+            "question_number": self.question_number,
+            "counts": self.counts,
+            "answered": len(self.responses),
+            "members": len(self.members),
+        }
+
+    def push_question(self, question_id: str):
+        content = catalog
+        if question_id not in content.questions:
+            raise KeyError(question_id)
+        self.question_id = question_id
+        self.question_number += 1
+        self.open = True
+        self.responses = {}
+        self.counts = {}
+        fragment = content.fragments.fragment(question_id, "student").decode("utf-8")
+        # Splice the cached fragment instead of re-serializing the question
+        self.broadcast_frame('{"type":"question","question_number":%d,"question":%s}' % (self.question_number, fragment))
+
+    def answer(self, member_id: str, response: Any):
+        if not self.open or member_id not in self.members:
+            return
+        previous = self.responses.get(member_id)
+        if previous is not None:
+            old = response_key(previous)
+            self.counts[old] -= 1
+            if not self.counts[old]:
+                del self.counts[old]
+        self.responses[member_id] = response
+        new = response_key(response)
+        self.counts[new] = self.counts.get(new, 0) + 1
+        self.dirty = True
+
+    def close_question(self):
+        if self.question_id is None:
+            return
+        self.open = False
+        content = catalog
+        key = content.answer_keys.get(self.question_id)
+        question = content.questions.get(self.question_id)
+        correct = sum(1 for response in self.responses.values() if key and key.grade(response)[0] == key.max_points)
+        self.broadcast({
+            **self.histogram(),
+            "type": "results",
+            "question_id": self.question_id,
+            "correct_answer": key.correct_response(question) if key and question else None,
+            "explanation": question.explanation if question else None,
+            "correct": correct,
+        })
+        self.dirty = False
+
+    async def flush_histograms(self):
+        while True:
+            await asyncio.sleep(LIVE_HISTOGRAM_INTERVAL_SECONDS)
+            if self.dirty:
+                self.dirty = False
+                self.broadcast(self.histogram(), critical=False)
+
+    def shut_down(self):
+        self.broadcast({"type": "ended"})
+        for member in self.recipients():
+            try:
+                member.queue.put_nowait(None)  # sender closes the socket after draining
+            except asyncio.QueueFull:
+                self.drop_slow(member)
+        if self.flusher:
+            self.flusher.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "room_code": self.code,
+            "created_at": self.created_at,
+            "members": len(self.members),
+            "instructor_connected": self.instructor is not None,
+            "question_number": self.question_number,
+            "question_open": self.open,
+            "answered": len(self.responses),
+            "frames_sent": self.frames_sent,
+            "histograms_skipped": self.histograms_skipped,
+            "slow_disconnects": self.slow_disconnects,
+        }
+
+classrooms: Dict[str, ClassroomRoom] = {}
+
+def create_classroom(instructor_id: str) -> ClassroomRoom:
+    if len(classrooms) >= LIVE_MAX_ROOMS:
+        raise HTTPException(status_code=429, detail="Too many live classrooms are open; try again later")
+    if sum(1 for room in classrooms.values() if room.instructor_id == instructor_id) >= LIVE_MAX_ROOMS_PER_INSTRUCTOR:
+        raise HTTPException(status_code=429, detail="Close one of your live classrooms before opening another")
+    code = secrets.token_hex(3).upper()
+    while code in classrooms:
+        code = secrets.token_hex(3).upper()
+    room = classrooms[code] = ClassroomRoom(code, instructor_id)
+    room.flusher = asyncio.create_task(room.flush_histograms())
+    timer_wheel.schedule(("classroom", code), LIVE_ROOM_TTL_SECONDS, lambda: end_classroom(code))
+    schedule_idle_classroom(code)
+    return room
+
+def schedule_idle_classroom(code: str):
+    """End the room unless its instructor (re)connects within LIVE_ROOM_IDLE_SECONDS"""
+    timer_wheel.schedule(("classroom-idle", code), LIVE_ROOM_IDLE_SECONDS, lambda: end_classroom(code))
+
+def end_classroom(code: str):
+    room = classrooms.pop(code, None)
+    if room is not None:
+        timer_wheel.cancel(("classroom", code))
+        timer_wheel.cancel(("classroom-idle", code))
+        room.shut_down()
+
+# ===== SYNTHETIC DATA =====
+# Deterministic, seeded dataset for load tests and benchmarks: N users, M
+# questions and K flashcards spread over the study areas and NCLEX
+# categories, plus flashcard review and quiz histories. Activity per user is
+# lognormal, so a few heavy users account for much of the traffic while most
+# users are light. Histories are simulated column-wise in NumPy (one
+# vectorized SM-2 step per review round, item statistics from per-question
+# sums) and written straight into fresh stores instead of replaying events.
+
+SYNTHETIC_REVIEWS_PER_CARD = 8
+SYNTHETIC_WORDS = (
+    "patient", "nurse", "client", "assess", "administer", "monitor", "report", "priority",
+    "insulin", "heparin", "digoxin", "potassium", "sodium", "glucose", "oxygen", "airway",
+    "pain", "fever", "infection", "wound", "dressing", "catheter", "fluid", "intake",
+    "output", "edema", "pulse", "pressure", "respirations", "saturation", "sedation", "fall",
+    "risk", "safety", "isolation", "precautions", "discharge", "teaching", "medication", "dose",
+    "route", "allergy", "reaction", "bleeding", "shock", "sepsis", "stroke", "seizure",
+    "cardiac", "renal", "hepatic", "pediatric", "maternal", "newborn", "elderly", "anxiety",
+    "delirium", "consent", "delegate", "assistive", "personnel", "skin", "ulcer", "nutrition",
+)
+
+class SyntheticDatasetSpec(BaseModel):
+    users: int = 10000
+    questions: int = 5000
+    flashcards: int = 2000
+    reviews: int = 1000000
+    quizzes: int = 50000
+    questions_per_quiz: int = 10
+    days: int = 365
+    seed: int = 42
+
+def generate_synthetic_content(spec: SyntheticDatasetSpec, rng: np.random.Generator,
+                               study_areas: Dict[str, StudyArea]) -> Dict[str, List[dict]]:
+    """Question and flashcard sections (plain dicts, ready for CONTENT_DIR)"""
+    area_ids = list(study_areas)
+    categories = list(ExamBlueprint().category_weights)
+    m = spec.questions
+    area = rng.integers(0, len(area_ids), m)
+    category = rng.integers(0, len(categories), m)
+    difficulty = rng.integers(1, 6, m)
+    key = rng.integers(0, 4, m)
+    words = rng.integers(0, len(SYNTHETIC_WORDS), (m, 12))
+    questions = []
+    for i in range(m):
+        correct = "abcd"[key[i]]
+        questions.append({
+            "id": f"synthetic-q-{i:07d}",
+            "question_text": " ".join(SYNTHETIC_WORDS[w] for w in words[i]).capitalize() + "?",
+            "options": [{"id": option, "text": f"Option {option.upper()}", "is_correct": option == correct}
+                        for option in "abcd"],
+            "correct_answer_id": correct,
+            "explanation": "Synthetic question",
+            "difficulty_level": int(difficulty[i]),
+            "nclex_category": categories[category[i]],
+            "study_area_id": area_ids[area[i]],
+        })
+
+    card_area = rng.integers(0, len(area_ids), spec.flashcards)
+    card_words = rng.integers(0, len(SYNTHETIC_WORDS), (spec.flashcards, 8))
+    flashcards = [{
+        "id": f"synthetic-fc-{i:07d}",
+        "set_name": f"{study_areas[area_ids[card_area[i]]].name} Review",
+        "term": f"{SYNTHETIC_WORDS[card_words[i, 0]]} {SYNTHETIC_WORDS[card_words[i, 1]]} {i}",
+        "definition": " ".join(SYNTHETIC_WORDS[w] for w in card_words[i, 2:]).capitalize() + ".",
+    } for i in range(spec.flashcards)]
+    return {"questions": questions, "flashcards": flashcards}
+
+def simulate_synthetic_reviews(spec: SyntheticDatasetSpec, rng: np.random.Generator, weights: np.ndarray,
+                               ability: np.ndarray, start: float, now: float, active: np.ndarray) -> Dict[str, np.ndarray]:
+    """Flashcard progress columns (rows sorted by user, then card) for spec.reviews reviews"""
+    n, k = spec.users, spec.flashcards
+    per_user = rng.multinomial(spec.reviews, weights)
+    cards = np.minimum(-(-per_user // SYNTHETIC_REVIEWS_PER_CARD), k)
+    offsets = np.concatenate(([0], np.cumsum(cards)))
+    pair_user = np.repeat(np.arange(n, dtype=np.int32), cards)
+    position = np.arange(offsets[-1]) - offsets[pair_user]
+    # Each user studies a contiguous (wrapping) run of cards from a random start
+    pair_card = ((rng.integers(0, k, n)[pair_user] + position) % k).astype(np.int32)
+    per_card, extra = per_user // np.maximum(cards, 1), per_user % np.maximum(cards, 1)
+    pair_reviews = per_card[pair_user] + (position < extra[pair_user])
+
+    pairs = len(pair_user)
+    ease = np.full(pairs, 2.5)
+    interval = np.ones(pairs)
+    due = np.zeros(pairs)
+    # First review somewhere in the first half of the window; later reviews follow the schedule
+    t = start + rng.random(pairs) * (now - start) / 2
+    hard_rate = (0.35 / (1 + np.exp(ability)))[pair_user]
+    easy_rate = (0.3 / (1 + np.exp(-ability)))[pair_user]
+    rows = np.flatnonzero(pair_reviews > 0)
+    round_number = 0
+    while rows.size:
+        draw = rng.random(rows.size)
+        hard = draw < hard_rate[rows]
+        easy = draw > 1 - easy_rate[rows]
+        current_ease, current_interval = ease[rows], interval[rows]
+        next_interval = np.where(easy, np.maximum(current_interval * 2, 6),
+                                 np.where(hard, 1, np.maximum(current_interval * current_ease, 1)))
+        next_interval = np.minimum(next_interval, MAX_REVIEW_INTERVAL_DAYS)
+        ease[rows] = np.where(easy, np.minimum(current_ease + 0.15, 3.0),
+                              np.where(hard, np.maximum(current_ease - 0.15, 1.3), current_ease))
+        interval[rows] = next_interval
+        ts = t[rows]
+        due[rows] = ts + next_interval * 86400
+        active[pair_user[rows], ((ts - start) // 86400).astype(np.int64)] = True
+        t[rows] = np.minimum(ts + next_interval * 86400 * rng.uniform(0.8, 1.3, rows.size), now)
+        round_number += 1
+        rows = rows[pair_reviews[rows] > round_number]
+
+    order = np.lexsort((pair_card, pair_user))
+    return {
+        "user": pair_user[order],
+        "card": pair_card[order],
+        "ease": ease[order],
+        "interval": interval[order],
+        "repetitions": pair_reviews[order],
+        "due": due[order],
+        "status": np.ones(pairs, dtype=np.int8),
+    }
+
+def generate_synthetic_dataset(spec: SyntheticDatasetSpec, study_areas: Dict[str, StudyArea]) -> tuple:
+    """(content sections, progress state in snapshot_state() form); runs off the event loop"""
+    rng = np.random.default_rng(spec.seed)
+    content = generate_synthetic_content(spec, rng, study_areas)
+    questions = content["questions"]
+    area_ids = list(study_areas)
+    n, m, a, width = spec.users, spec.questions, len(area_ids), spec.questions_per_quiz
+    user_ids = [f"synthetic-user-{i:07d}" for i in range(n)]
+    now = float(int(time.time()) // 86400 * 86400)
+    start = now - spec.days * 86400
+
+    # Skewed activity: lognormal per-user weight shared by reviews and quizzes
+    weights = rng.lognormal(0.0, 1.5, n)
+    weights /= weights.sum()
+    ability = rng.normal(0.0, 1.0, n)
+    active = np.zeros((n, spec.days + 1), dtype=bool)
+
+    flashcards_db = FlashcardProgressStore()
+    flashcards_db.bulk_load(user_ids, [card["id"] for card in content["flashcards"]],
+                            simulate_synthetic_reviews(spec, rng, weights, ability, start, now, active))
+
+    # Quizzes: one study area each, items drawn from that area's questions
+    question_area = np.array([area_ids.index(q["study_area_id"]) for q in questions], dtype=np.int64)
+    difficulty = np.array([q["difficulty_level"] for q in questions], dtype=np.float64)
+    key = np.array(["abcd".index(q["correct_answer_id"]) for q in questions], dtype=np.int64)
+    by_area = np.argsort(question_area, kind="stable")
+    area_count = np.bincount(question_area, minlength=a)
+    area_start = np.concatenate(([0], np.cumsum(area_count)[:-1]))
+    q = spec.quizzes
+    quiz_ts = np.sort(start + rng.random(q) * (now - start))
+    quiz_user = rng.choice(n, q, p=weights)
+    quiz_area = rng.choice(np.flatnonzero(area_count), q)
+    items = by_area[area_start[quiz_area][:, None] +
+                    (rng.random((q, width)) * area_count[quiz_area][:, None]).astype(np.int64)]
+    area_skill = rng.normal(0.0, 0.5, (n, a))
+    logit = 1.2 + (ability[quiz_user] + area_skill[quiz_user, quiz_area])[:, None] - 0.6 * (difficulty[items] - 3)
+    correct = rng.random((q, width)) < 1 / (1 + np.exp(-logit))
+    selected = np.where(correct, key[items], (key[items] + rng.integers(1, 4, (q, width))) % 4)
+    seconds = rng.lognormal(math.log(40), 0.6, (q, width))
+    quiz_correct = correct.sum(axis=1)
+    active[quiz_user, ((quiz_ts - start) // 86400).astype(np.int64)] = True
+
+    # Item statistics from per-question sums (same state the online Welford updates reach)
+    flat = items.ravel()
+    x = correct.ravel().astype(np.float64)
+    y = ((quiz_correct[:, None] - correct) / max(width - 1, 1)).ravel()
+    t = seconds.ravel()
+    sums = {name: np.bincount(flat, weights=values, minlength=m).tolist()
+            for name, values in (("x", x), ("y", y), ("yy", y * y), ("xy", x * y), ("t", t), ("tt", t * t))}
+    responses = np.bincount(flat, minlength=m)
+    bins = len(TIME_HISTOGRAM_EDGES) + 1
+    histograms = np.bincount(flat * bins + np.searchsorted(TIME_HISTOGRAM_EDGES, t, side="right"),
+                             minlength=m * bins).reshape(m, bins)
+    option_counts = np.bincount(flat * 4 + selected.ravel(), minlength=m * 4).reshape(m, 4)
+    stats_db = {}
+    for i in np.flatnonzero(responses):
+        count = int(responses[i])
+        stats = stats_db[questions[i]["id"]] = ItemStats()
+        stats.responses = stats.timed = count
+        stats.correct = int(sums["x"][i])
+        stats.mean_x, stats.mean_y = sums["x"][i] / count, sums["y"][i] / count
+        stats.m2_x = sums["x"][i] - count * stats.mean_x ** 2
+        if width > 1:
+            stats.paired = count
+            stats.m2_y = max(sums["yy"][i] - count * stats.mean_y ** 2, 0.0)
+            stats.c_xy = sums["xy"][i] - count * stats.mean_x * stats.mean_y
+        stats.mean_time = sums["t"][i] / count
+        stats.m2_time = max(sums["tt"][i] - count * stats.mean_time ** 2, 0.0)
+        stats.option_counts = {"abcd"[o]: int(c) for o, c in enumerate(option_counts[i]) if c}
+        stats.time_histogram = histograms[i].tolist()
+
+    # Score distributions per area
+    scores = np.round(quiz_correct / width * 1000).astype(np.int64)
+    score_counts = np.bincount(quiz_area * SCORE_BUCKETS + scores, minlength=a * SCORE_BUCKETS).reshape(a, SCORE_BUCKETS)
+    distributions = {}
+    for col, area_id in enumerate(area_ids):
+        if score_counts[col].any():
+            distribution = distributions[area_id] = ScoreDistribution()
+            for bucket in np.flatnonzero(score_counts[col]):
+                distribution.add(bucket / 10, int(score_counts[col, bucket]))
+
+    # Quiz progress: one record per (user, area) with its sessions in time order
+    progress_db = ProgressIndex()
+    order = np.lexsort((quiz_ts, quiz_area, quiz_user))
+    group_keys = quiz_user[order] * a + quiz_area[order]
+    bounds = np.flatnonzero(np.diff(group_keys)) + 1
+    quiz_seconds = seconds.sum(axis=1).round(1).tolist()
+    quiz_scores = (quiz_correct / width * 100).tolist()
+    for group in np.split(order, bounds):
+        first = group[0]
+        sessions = [{
+            "date": datetime.fromtimestamp(quiz_ts[i]).isoformat(),
+            "score": quiz_scores[i],
+            "questions_attempted": width,
+            "questions_correct": int(quiz_correct[i]),
+            "time_spent": quiz_seconds[i],
+        } for i in group.tolist()]
+        progress_db.put(UserProgress.model_construct(
+            id=f"synthetic-progress-{first}", user_id=user_ids[quiz_user[first]],
+            study_area_id=area_ids[quiz_area[first]],
+            questions_attempted=width * len(group), questions_correct=int(quiz_correct[group].sum()),
+            quiz_sessions=sessions, last_activity=datetime.fromtimestamp(quiz_ts[group[-1]]),
+        ))
+
+    # Mastery: users x areas counts and each user's last outcome per question
+    mastery = MasteryMatrix()
+    mastery.user_rows = {user_id: row for row, user_id in enumerate(user_ids)}
+    mastery.area_cols = {area_id: col for col, area_id in enumerate(area_ids)}
+    cells = (np.repeat(quiz_user, width) * a + question_area[flat])
+    mastery.attempts = np.bincount(cells, minlength=n * a).reshape(n, a).astype(np.float32)
+    mastery.correct = np.bincount(cells, weights=x, minlength=n * a).reshape(n, a).astype(np.float32)
+    pair_keys = np.repeat(quiz_user, width).astype(np.int64) * m + flat
+    last = len(pair_keys) - 1 - np.unique(pair_keys[::-1], return_index=True)[1]
+    last_users = pair_keys[last] // m
+    user_bounds = np.flatnonzero(np.diff(last_users)) + 1
+    for group in np.split(last, user_bounds):
+        if group.size:
+            mastery.outcomes[user_ids[pair_keys[group[0]] // m]] = dict(
+                zip([questions[i]["id"] for i in flat[group].tolist()], x[group].astype(np.int64).tolist()))
+    mastery.dirty = set(user_ids)
+
+    # Readiness: per-category abilities estimated from the same answers
+    categories = list(ExamBlueprint().category_weights)
+    question_category = np.array([categories.index(q["nclex_category"]) for q in questions], dtype=np.int64)
+    cells = np.repeat(quiz_user, width) * len(categories) + question_category[flat]
+    shape = (n, len(categories))
+    readiness = ReadinessModel()
+    readiness.load_counts(
+        user_ids, categories,
+        np.bincount(cells, minlength=n * len(categories)).reshape(shape),
+        np.bincount(cells, weights=x, minlength=n * len(categories)).reshape(shape),
+        np.bincount(cells, weights=(difficulty[flat] - 3) * 0.75, minlength=n * len(categories)).reshape(shape),
+    )
+
+    # Activity calendar: one little-endian bitmap per user from the active-day matrix
+    calendar = ActivityCalendar()
+    first_day = date.fromtimestamp(start).toordinal()
+    packed = np.packbits(active, axis=1, bitorder="little")
+    first_active = active.argmax(axis=1)
+    for row in np.flatnonzero(active.any(axis=1)):
+        offset = int(first_active[row])
+        calendar.base_day[user_ids[row]] = first_day + offset
+        calendar.bits[user_ids[row]] = int.from_bytes(packed[row].tobytes(), "little") >> offset
+
+    created_at = datetime.fromtimestamp(start)
+    users = {user_id: User.model_construct(id=user_id, email=f"{user_id}@example.com", created_at=created_at)
+             for user_id in user_ids}
+    state = {
+        "users_db": users,
+        "user_progress_db": progress_db,
+        "flashcard_progress_db": flashcards_db,
+        "score_distributions": distributions,
+        "item_stats": stats_db,
+        "activity_calendar": calendar,
+        "mastery_matrix": mastery,
+        "readiness_model": readiness,
+    }
+    return content, state
+
+# ===== MEMORY ACCOUNTING =====
+# Approximate per-store memory usage, sampled every MEMORY_SAMPLE_SECONDS
+# into a bounded history so growth trends are visible. Column stores and
+# NumPy matrices report their buffer sizes exactly; dict-like stores are
+# estimated from the deep size of MEMORY_SAMPLE_ENTRIES random entries times
+# the entry count, so a sample costs milliseconds even with millions of
+# rows. Stores (or "process" for RSS) above their soft limit print a warning
+# once per crossing. tracemalloc is off unless started from the admin API
+# because it slows every allocation down.
+
+MEMORY_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+def parse_memory_limits(spec: str) -> Dict[str, int]:
+    """'user_progress_db=512M,process=2G' -> {name: bytes}"""
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, value = item.partition("=")
+        value = value.strip().upper().rstrip("B")
+        unit = value[-1] if value and value[-1] in MEMORY_UNITS else ""
+        limits[name.strip()] = int(float(value[:len(value) - len(unit)]) * MEMORY_UNITS[unit])
+    return limits
+
+_ATOMIC_TYPES = (str, bytes, int, float, bool, type(None), datetime, date)
+
+def deep_sizeof(obj: Any, seen: Optional[set] = None) -> int:
+    """Bytes reachable from obj (containers, instance dicts and slots); shared objects count once"""
+    seen = set() if seen is None else seen
+    size = 0
+    stack = [obj]
+    while stack:
+        current = stack.pop()
+        if id(current) in seen or isinstance(current, type) or callable(current) and not isinstance(current, BaseModel):
+            continue
+        seen.add(id(current))
+        size += sys.getsizeof(current)  # includes the data buffer of arrays that own it
+        if isinstance(current, _ATOMIC_TYPES) or isinstance(current, np.ndarray):
+            continue
+        if isinstance(current, dict):
+            stack.extend(current.keys())
+            stack.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset, deque)):
+            stack.extend(current)
+        instance_dict = getattr(current, "__dict__", None)
+        if isinstance(instance_dict, dict):
+            stack.append(instance_dict)
+        for cls in type(current).__mro__:
+            for slot in cls.__dict__.get("__slots__", ()):
+                value = getattr(current, slot, None)
+                if value is not None and slot != "__dict__":
+                    stack.append(value)
+    return size
+
+def sampled_size(items: Dict[Any, Any]) -> int:
+    """Container overhead plus the mean deep size of sampled entries times the entry count"""
+    count = len(items)
+    if count == 0:
+        return sys.getsizeof(items)
+    keys = list(items) if count > MEMORY_SAMPLE_ENTRIES else items.keys()
+    sample = random.sample(keys, MEMORY_SAMPLE_ENTRIES) if count > MEMORY_SAMPLE_ENTRIES else list(keys)
+    seen: set = set()  # shared across the sample so objects common to all entries count once
+    sampled = sum(deep_sizeof(key, seen) + deep_sizeof(items[key], seen) for key in sample)
+    return sys.getsizeof(items) + int(sampled / len(sample) * count)
+
+def progress_index_size(index: ProgressIndex) -> int:
+    users = list(index.by_user)
+    sample = random.sample(users, min(len(users), MEMORY_SAMPLE_ENTRIES))
+    records = [progress for user_id in sample for progress in index.by_user[user_id].values()]
+    seen: set = set()
+    per_record = sum(deep_sizeof(progress, seen) for progress in records) / len(records) if records else 0
+    user_dicts = sum(sys.getsizeof(areas) for areas in index.by_user.values())
+    area_dicts = sum(sys.getsizeof(area_users) for area_users in index.by_area.values())
+    return sys.getsizeof(index.by_user) + sys.getsizeof(index.by_area) + user_dicts + area_dicts + \
+        int(per_record * len(index))
+
+def flashcard_store_size(store: FlashcardProgressStore) -> int:
+    names = dict(enumerate(store.user_names))
+    cards = dict(enumerate(store.card_names))
+    return store.nbytes() + sampled_size(store.user_index) + sampled_size(store.card_index) + \
+        sampled_size(names) + sampled_size(cards) + \
+        (len(store.user_cards) + len(store.user_rows)) * sys.getsizeof(np.empty(0)) + 8 * len(store.free_rows)
+
+def mastery_matrix_size(matrix: MasteryMatrix) -> int:
+    return matrix.attempts.nbytes + matrix.correct.nbytes + sampled_size(matrix.user_rows) + sampled_size(matrix.outcomes)
+
+def readiness_model_size(model: ReadinessModel) -> int:
+    return model.theta.nbytes + model.answered.nbytes + model.information.nbytes + sampled_size(model.user_rows) + \
+        sampled_size(model.item_difficulty) + sampled_size(model.item_answers)
+
+def activity_calendar_size(calendar: ActivityCalendar) -> int:
+    return sampled_size(calendar.base_day) + sampled_size(calendar.bits)
+
+def memory_stores() -> Dict[str, tuple]:
+    """name -> (entry count, approximate bytes callable)"""
+    content = catalog
+    return {
+        "users_db": (len(users_db), lambda: sampled_size(users_db)),
+        "questions": (len(content.questions), lambda: sampled_size(content.questions)),
+        "question_fragments": (sum(len(cache) for cache in content.fragments.fragments.values()),
+                               lambda: sum(sampled_size(cache) for cache in content.fragments.fragments.values())),
+        "flashcards": (len(content.flashcards), lambda: sampled_size(content.flashcards)),
+        "user_progress_db": (len(user_progress_db), lambda: progress_index_size(user_progress_db)),
+        "flashcard_progress_db": (len(flashcard_progress_db), lambda: flashcard_store_size(flashcard_progress_db)),
+        "subscriptions_db": (len(subscriptions_db), lambda: sampled_size(subscriptions_db)),
+        "cohorts_db": (len(cohorts_db), lambda: sampled_size(cohorts_db)),
+        "score_distributions": (len(score_distributions), lambda: sampled_size(score_distributions)),
+        "item_stats": (len(item_stats), lambda: sampled_size(item_stats)),
+        "activity_calendar": (len(activity_calendar.bits), lambda: activity_calendar_size(activity_calendar)),
+        "mastery_matrix": (len(mastery_matrix.user_rows), lambda: mastery_matrix_size(mastery_matrix)),
+        "readiness_model": (len(readiness_model.user_rows), lambda: readiness_model_size(readiness_model)),
+        "exam_sessions": (len(exam_sessions), lambda: sampled_size(exam_sessions)),
+    }
+
+def process_rss_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+class MemoryAccountant:
+    def __init__(self):
+        self.limits = parse_memory_limits(MEMORY_SOFT_LIMITS)
+        self.history: deque = deque(maxlen=MEMORY_HISTORY_SIZE)
+        self.over_limit: set = set()
+        self.warnings = 0
+        self.tracemalloc_baseline = None
+
+    def measure(self) -> Dict[str, Any]:
+        """Measure every store now (runs on the event loop so no store changes mid-walk)"""
+        started = time.perf_counter()
+        stores = {name: {"entries": entries, "bytes": size()} for name, (entries, size) in memory_stores().items()}
+        rss = process_rss_bytes()
+        report = {
+            "ts": time.time(),
+            "process_rss_bytes": rss,
+            "stores_bytes": sum(store["bytes"] for store in stores.values()),
+            "stores": stores,
+            "measure_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+        self._check_limits(report)
+        return report
+
+    def _check_limits(self, report: Dict[str, Any]):
+        sizes = {name: store["bytes"] for name, store in report["stores"].items()}
+        sizes["process"] = report["process_rss_bytes"] or 0
+        for name, limit in self.limits.items():
+            size = sizes.get(name, 0)
+            if size > limit and name not in self.over_limit:
+                self.over_limit.add(name)
+                self.warnings += 1
+                print(f"Memory warning: {name} is {size / 1024 ** 2:.1f} MiB, over its soft limit of {limit / 1024 ** 2:.1f} MiB")
+            elif size <= limit and name in self.over_limit:
+                self.over_limit.discard(name)
+                print(f"Memory: {name} back under its soft limit ({size / 1024 ** 2:.1f} MiB)")
+
+    def sample(self) -> Dict[str, Any]:
+        report = self.measure()
+        self.history.append({
+            "ts": report["ts"],
+            "process_rss_bytes": report["process_rss_bytes"],
+            "stores": {name: store["bytes"] for name, store in report["stores"].items()},
+        })
+        return report
+
+    def start_tracing(self, frames: int):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self.tracemalloc_baseline = tracemalloc.take_snapshot()
+
+    def stop_tracing(self):
+        tracemalloc.stop()
+        self.tracemalloc_baseline = None
+
+    def top_allocations(self, limit: int, group_by: str) -> Dict[str, Any]:
+        """Largest allocation sites now and their growth since tracing started (run off the event loop)"""
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        ])
+        current, peak = tracemalloc.get_traced_memory()
+
+        def site(stat) -> Dict[str, Any]:
+            return {
+                "trace": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+                "bytes": stat.size,
+                "count": stat.count,
+            }
+
+        top = [site(stat) for stat in snapshot.statistics(group_by)[:limit]]
+        growth = []
+        if self.tracemalloc_baseline is not None:
+            for stat in snapshot.compare_to(self.tracemalloc_baseline, group_by)[:limit]:
+                growth.append({**site(stat), "bytes_diff": stat.size_diff, "count_diff": stat.count_diff})
+        return {"traced_bytes": current, "traced_peak_bytes": peak, "top": top, "growth_since_start": growth}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sample_seconds": MEMORY_SAMPLE_SECONDS,
+            "history_size": len(self.history),
+            "limits_bytes": self.limits,
+            "over_limit": sorted(self.over_limit),
+            "warnings": self.warnings,
+            "tracemalloc": tracemalloc.is_tracing(),
+        }
+
+memory_accountant = MemoryAccountant()
+
+async def memory_sampler():
+    """Record a memory sample periodically (and warn on soft limits)"""
+    while True:
+        await asyncio.sleep(MEMORY_SAMPLE_SECONDS)
+        try:
+            memory_accountant.sample()
+        except Exception as e:
+            print(f"Memory sample failed: {e}")
+
+class TracemallocConfig(BaseModel):
+    frames: int = 10
+
+# ===== REQUEST COALESCING =====
+# Expensive aggregate reads (flashcard sets, item analysis, cohort analytics
+# and readiness) are single-flighted: the first request for a key starts one
+# computation as its own task and identical requests arriving meanwhile await
+# that task instead of recomputing. The result is encoded to JSON once and
+# kept for COALESCE_TTL_SECONDS, so a class opening the same dashboard in the
+# same second costs a single computation. Keys carry the catalog version (or
+# the cohort result's timestamp) so a content swap is never served stale
+# beyond the micro-cache window.
+
+class SingleFlight:
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.in_flight: Dict[tuple, asyncio.Task] = {}
+        self.cache: Dict[tuple, tuple] = {}  # key -> (expires_at, value, compute seconds)
+        self.routes: Dict[str, Dict[str, float]] = {}
+
+    def _route_stats(self, key: tuple) -> Dict[str, float]:
+        stats = self.routes.get(key[0])
+        if stats is None:
+            stats = self.routes[key[0]] = {"computations": 0, "coalesced": 0, "cache_hits": 0,
+                                           "compute_seconds": 0.0, "saved_seconds": 0.0}
+        return stats
+
+    async def run(self, key: tuple, compute: Callable[[], Any]) -> Any:
+        """Result of compute() for key, shared with concurrent and very recent identical calls"""
+        stats = self._route_stats(key)
+        entry = self.cache.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                stats["cache_hits"] += 1
+                stats["saved_seconds"] += entry[2]
+                return entry[1]
+            del self.cache[key]
+        task = self.in_flight.get(key)
+        if task is None:
+            # A task of its own, so a disconnecting first caller doesn't cancel it for the others
+            task = self.in_flight[key] = asyncio.ensure_future(self._compute(key, compute))
+            stats["computations"] += 1
+            leader = True
+        else:
+            stats["coalesced"] += 1
+            leader = False
+        value, seconds = await asyncio.shield(task)
+        if not leader:
+            stats["saved_seconds"] += seconds
+        return value
+
+    async def _compute(self, key: tuple, compute: Callable[[], Any]) -> tuple:
+        started = time.perf_counter()
+        try:
+            value = await compute()
+        finally:
+            self.in_flight.pop(key, None)
+        seconds = time.perf_counter() - started
+        self._route_stats(key)["compute_seconds"] += seconds
+        if self.ttl > 0:
+            now = time.monotonic()
+            if len(self.cache) >= COALESCE_MAX_ENTRIES:
+                self.cache = {k: entry for k, entry in self.cache.items() if entry[0] > now}
+            self.cache[key] = (now + self.ttl, value, seconds)
+        return value, seconds
+
+    def stats(self) -> Dict[str, Any]:
+        requests = sum(s["computations"] + s["coalesced"] + s["cache_hits"] for s in self.routes.values())
+        computations = sum(s["computations"] for s in self.routes.values())
+        return {
+            "ttl_seconds": self.ttl,
+            "requests": requests,
+            "computations": computations,
+            "computations_saved": requests - computations,
+            "saved_seconds": round(sum(s["saved_seconds"] for s in self.routes.values()), 3),
+            "in_flight": len(self.in_flight),
+            "cached": len(self.cache),
+            "routes": {route: {**s, "compute_seconds": round(s["compute_seconds"], 3),
+                               "saved_seconds": round(s["saved_seconds"], 3)} for route, s in self.routes.items()},
+        }
+
+single_flight = SingleFlight(COALESCE_TTL_SECONDS)
+
+async def coalesced_json(key: tuple, build: Callable[[], Any], offload: bool = False) -> Response:
+    """Single-flighted JSON response; offload runs build (which must only read immutable data) in a thread"""
+    async def compute() -> bytes:
+        if offload:
+            return await asyncio.get_running_loop().run_in_executor(None, lambda: json_bytes(build()))
+        return json_bytes(build())
+    return Response(content=await single_flight.run(key, compute), media_type="application/json")
+
+# CORS middleware (registered last so it wraps every middleware above,
+# including rejections from admission control)
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=CORS_ORIGINS,
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+# ===== API ENDPOINTS =====
+
+@app.get("/")
+async def root():
+    return {"message": "NursePrep Pro API - Database Free Version", "status": "running"}
+
+# Study Areas Endpoints
+@app.get("/api/study-areas")
+async def get_study_areas():
+    return {"study_areas": list(catalog.study_areas.values())}
+
+# Served as pre-rendered JSON fragments, so the schema is documented through
+# responses= rather than response_model (which would never validate anything)
+@app.get("/api/study-areas/{area_id}/questions", response_class=Response,
+         responses={200: {"model": List[Question]}})
+async def get_questions_by_area(area_id: str, request: Request) -> Response:
+    """Get questions for a specific study area"""
+    check_entitlement(get_current_user_id(request), "basic_quizzes", area_id)
+    content = catalog
+    return Response(content=content.fragments.render_list(content.pools.by_area.get(area_id, ())),
+                    media_type="application/json")
+
+# Flashcards Endpoints
+@app.get("/api/flashcards", response_model=List[Flashcard])
+async def get_flashcards():
+    return list(catalog.flashcards.values())
+
+def build_flashcard_sets(flashcards: Dict[str, Flashcard]) -> Dict[str, Any]:
+    sets = {}
+    for flashcard in flashcards.values():
+        if flashcard.set_name not in sets:
+            sets[flashcard.set_name] = []
+        sets[flashcard.set_name].append(flashcard.dict())
+    
+    # Convert to array format that frontend expects
+    formatted_sets = []
+    for set_name, cards in sets.items():
+        formatted_sets.append({
+            "id": set_name.lower().replace(" ", "_"),
+            "name": set_name,
+            "description": f"Master essential {set_name.lower()} terms and definitions",
+            "card_count": len(cards),
+            "color": "#3b82f6",  # Blue color for all sets
+            "spaced_repetition_enabled": True,
+            "cards": cards
+        })
+    
+    return {"flashcard_sets": formatted_sets}
+
+@app.get("/api/flashcard-sets")
+async def get_flashcard_sets():
+    """Get flashcard sets (frontend expects this endpoint)"""
+    content = catalog
+    return await coalesced_json(("flashcard-sets", content.version),
+                                lambda: build_flashcard_sets(content.flashcards), offload=True)
+
+@app.get("/api/flashcards/sets") 
+async def get_flashcard_sets_alt():
+    """Alternative endpoint for flashcard sets"""
+    return await get_flashcard_sets()
+
+# User and Progress Endpoints (Simplified for demo)
+@app.post("/api/submit-quiz")
+async def submit_quiz(submission: QuizSubmission, request: Request):
+    """Submit quiz results (stored in memory)"""
+    user_id = get_current_user_id(request)
+    check_entitlement(user_id, "basic_quizzes", submission.study_area_id)
+    
+    # Calculate score (partial credit counts toward it)
+    total_questions = len(submission.answers)
+    grading = grade_answers(catalog, [answer.payload() for answer in submission.answers], submission.time_spent)
+    correct_answers, points, max_points = grading["correct"], grading["points"], grading["max_points"]
+    score_percentage = (points / max_points) * 100 if max_points > 0 else 0
+    
+    # Log, then store progress in memory
+    event = {
+        "user_id": user_id,
+        "study_area_id": submission.study_area_id,
+        "graded": grading["graded"],
+        "total_questions": total_questions,
+        "time_spent": submission.time_spent,
+        "points": points,
+        "max_points": max_points
+    }
+    now = time.time()
+    event_log.append(EVENT_QUIZ_SUBMITTED, event, now)
+    percentile = apply_quiz_submission(event, now)
+    
+    return {
+        "score": score_percentage,
+        "correct_answers": correct_answers,
+        "total_questions": total_questions,
+        "points": points,
+        "max_points": max_points,
+        "percentile": percentile,
+        "message": f"Great job! You scored {score_percentage:.1f}%"
+    }
+
+@app.get("/api/rankings/{study_area_id}")
+async def get_score_ranking(study_area_id: str, request: Request, score: Optional[FiniteFloat] = None, top: int = 10):
+    """Percentile and rank of a score (default: the user's latest) among all test-takers in an area"""
+    distribution = score_distributions.get(study_area_id)
+    if distribution is None or distribution.total == 0:
+        raise HTTPException(status_code=404, detail="No scores recorded for this study area yet")
+
+    if score is None:
+        progress = user_progress_db.get(get_current_user_id(request), study_area_id)
+        if progress is None or not progress.quiz_sessions:
+            raise HTTPException(status_code=404, detail="No quiz sessions for this study area")
+        score = progress.quiz_sessions[-1]["score"]
+
+    return {
+        "study_area_id": study_area_id,
+        "score": score,
+        "percentile": round(distribution.percentile(score), 1),
+        "rank": distribution.rank(score),
+        "total_submissions": distribution.total,
+        "top_scores": distribution.top(max(0, min(top, 100)))
+    }
+
+@app.post("/api/review-flashcard")
+async def review_flashcard(review: FlashcardReview, request: Request):
+    """Submit flashcard review (simplified spaced repetition)"""
+    user_id = get_current_user_id(request)
+    check_entitlement(user_id, "spaced_repetition")
+    event = {
+        "user_id": user_id,
+        "flashcard_id": review.flashcard_id,
+        "difficulty": review.difficulty
+    }
+    now = time.time()
+    event_log.append(EVENT_FLASHCARD_REVIEWED, event, now)
+    interval_days = apply_flashcard_review(event, now)
+    
+    return {
+        "message": "Flashcard reviewed",
+        "next_review_in_days": int(interval_days) if interval_days.is_integer() else interval_days
+    }
+
+@app.get("/api/flashcards/due")
+async def get_due_flashcards(request: Request, before: Optional[datetime] = None):
+    """IDs of the user's reviewed cards that are due before a time (default: now)"""
+    user_id = get_current_user_id(request)
+    check_entitlement(user_id, "spaced_repetition")
+    card_ids = flashcard_progress_db.due_before(user_id, before or datetime.now())
+    return {"due_count": len(card_ids), "flashcard_ids": card_ids}
+
+@app.get("/api/progress")
+async def get_user_progress(request: Request):
+    """All of the current user's quiz and flashcard progress"""
+    user_id = get_current_user_id(request)
+    return {
+        "study_areas": list(user_progress_db.for_user(user_id).values()),
+        "flashcards": flashcard_progress_db.for_user(user_id)
+    }
+
+@app.delete("/api/progress")
+async def delete_user_progress(request: Request):
+    """Delete all of the current user's progress"""
+    event = {"user_id": get_current_user_id(request)}
+    now = time.time()
+    event_log.append(EVENT_PROGRESS_DELETED, event, now)
+    return apply_progress_deletion(event, now)
+
+# Analytics Endpoints
+@app.get("/api/analytics")
+async def get_analytics(request: Request):
+    """Get user analytics (demo data)"""
+    check_entitlement(get_current_user_id(request), "advanced_analytics")
+    return {
+        "total_quizzes": 15,
+        "quiz_average": 78.3,
+        "cards_studied": 16,
+        "card_mastery": 75.0,
+        "recent_sessions": [
+            {"date": "2025-01-20", "score": 85.0, "questions": 8},
+            {"date": "2025-01-19", "score": 72.0, "questions": 6},
+            {"date": "2025-01-18", "score": 78.0, "questions": 10},
+            {"date": "2025-01-17", "score": 81.0, "questions": 7},
+            {"date": "2025-01-16", "score": 74.0, "questions": 9}
+        ]
+    }
+
+@app.get("/api/stats")
+async def get_stats(request: Request):
+    """Get user stats (demo data apart from the study streak)"""
+    return {
+        "total_quizzes": 15,
+        "average_score": 78.3,
+        "total_questions": 45,
+        "correct_answers": 35,
+        "study_streak": activity_calendar.current_streak(get_current_user_id(request)),
+        "last_activity": datetime.now().isoformat()
+    }
+
+@app.get("/api/flashcards/stats") 
+async def get_flashcard_stats(request: Request):
+    """Get flashcard statistics (demo data apart from the study streak)"""
+    return {
+        "cards_studied": 16,
+        "cards_mastered": 12,
+        "cards_learning": 3,
+        "cards_new": 1,
+        "study_streak": activity_calendar.current_streak(get_current_user_id(request)),
+        "total_reviews": 28,
+        "mastery_percentage": 75.0
+    }
+
+@app.get("/api/recommendations")
+async def get_recommendations(request: Request):
+    """What to study next: weakest areas and questions to practice (refreshed in the background)"""
+    user_id = get_current_user_id(request)
+    check_entitlement(user_id, "advanced_analytics")
+    return study_recommender.lookup(user_id)
+
+@app.get("/api/readiness")
+async def get_readiness(request: Request):
+    """Estimated NCLEX pass probability with per-category abilities for the current user"""
+    user_id = get_current_user_id(request)
+    check_entitlement(user_id, "advanced_analytics")
+    return readiness_model.readiness(user_id)
+
+@app.get("/api/activity-calendar")
+async def get_activity_calendar(request: Request, days: int = 365):
+    """Study streaks and a per-day activity heatmap for the current user"""
+    user_id = get_current_user_id(request)
+    return {
+        "current_streak": activity_calendar.current_streak(user_id),
+        "longest_streak": activity_calendar.longest_streak(user_id),
+        "heatmap": activity_calendar.heatmap(user_id, max(1, min(days, 3660)))
+    }
+
+def _trial_days_remaining(entitlement: Entitlement) -> Optional[int]:
+    if entitlement.status != "trialing" or entitlement.trial_end_date is None:
+        return None
+    return max(0, (entitlement.trial_end_date - datetime.now()).days)
+
+@app.get("/api/subscription/status")
+async def get_detailed_subscription_status(request: Request):
+    """Get detailed subscription status"""
+    entitlement = entitlement_cache.get(get_current_user_id(request))
+    return {
+        "tier": entitlement.tier,
+        "status": "active" if entitlement.tier == "free" else entitlement.status,
+        "trial_days_remaining": _trial_days_remaining(entitlement),
+        "can_upgrade": entitlement.tier == "free",
+        "features": TIER_FEATURE_DESCRIPTIONS.get(entitlement.tier, TIER_FEATURE_DESCRIPTIONS["premium"]),
+        "billing_cycle": None,
+        "next_billing_date": entitlement.period_end.isoformat() if entitlement.period_end else None
+    }
+
+@app.get("/api/packages")
+async def get_packages():
+    """Get available packages/plans"""
+    packages = [
+        {
+            "id": "monthly",
+            "name": "Monthly Premium", 
+            "price": 9.99,
+            "interval": "month",
+            "features": ["All study areas", "Unlimited quizzes", "Advanced analytics"]
+        },
+        {
+            "id": "annual",
+            "name": "Annual Premium",
+            "price": 79.99, 
+            "interval": "year",
+            "features": ["All study areas", "Unlimited quizzes", "Advanced analytics", "Save 33%"]
+        }
+    ]
+    return {"packages": packages}
+
+# Subscription/Payment Endpoints
+@app.get("/api/subscription-plans", response_model=List[SubscriptionPlan])
+async def get_subscription_plans():
+    """Get available subscription plans"""
+    plans = [
+        {
+            "id": "trial",
+            "name": "7-Day Free Trial",
+            "description": "Full access for 7 days",
+            "price": 0.00,
+            "interval": "trial",
+            "features": ["All study areas", "Unlimited quizzes", "Flashcards", "Progress tracking"]
+        },
+        {
+            "id": "monthly", 
+            "name": "Monthly Plan",
+            "description": "Month-to-month flexibility",
+            "price": 9.99,
+            "interval": "month",
+            "features": ["All study areas", "Unlimited quizzes", "Flashcards", "Progress tracking", "Advanced analytics"]
+        },
+        {
+            "id": "annual",
+            "name": "Annual Plan", 
+            "description": "Best value - save 33%",
+            "price": 79.99,
+            "interval": "year",
+            "features": ["All study areas", "Unlimited quizzes", "Flashcards", "Progress tracking", "Advanced analytics", "Priority support"]
+        },
+        {
+            "id": "lifetime",
+            "name": "Lifetime Access",
+            "description": "One-time payment, lifetime access",
             "price": 199.99,
             "interval": "lifetime", 
             "features": ["All study areas", "Unlimited quizzes", "Flashcards", "Progress tracking", "Advanced analytics", "Priority support", "Future updates"]
@@ -775,13 +5421,14 @@ async def get_subscription_plans():
     return [SubscriptionPlan(**plan) for plan in plans]
 
 @app.get("/api/subscription-status")
-async def get_subscription_status():
-    """Get current subscription status (demo)"""
+async def get_subscription_status(request: Request):
+    """Get current subscription status"""
+    entitlement = entitlement_cache.get(get_current_user_id(request))
     return {
-        "tier": "free",
-        "status": "active",
-        "trial_days_remaining": None,
-        "can_upgrade": True
+        "tier": entitlement.tier,
+        "status": "active" if entitlement.tier == "free" else entitlement.status,
+        "trial_days_remaining": _trial_days_remaining(entitlement),
+        "can_upgrade": entitlement.tier == "free"
     }
 
 if STRIPE_API_KEY:
@@ -789,8 +5436,6 @@ if STRIPE_API_KEY:
     async def create_checkout_session(request: CheckoutSessionRequest):
         """Create Stripe checkout session"""
         try:
-            stripe_client = StripeCheckout(api_key=STRIPE_API_KEY)
-            
             # Map plan IDs to Stripe price IDs (you'll need to create these in Stripe)
             price_mapping = {
                 "monthly": "price_monthly_9_99",  # Replace with actual Stripe price ID
@@ -808,9 +5453,11 @@ if STRIPE_API_KEY:
                 customer_email=request.customer_email
             )
             
-            session = stripe_client.create_checkout_session(checkout_request)
+            session = await call_stripe("create_checkout_session", checkout_request)
             return session
             
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Failed to create checkout session: {str(e)}")
     
@@ -830,103 +5477,557 @@ if STRIPE_API_KEY:
 
     @app.post("/api/webhooks/stripe")
     async def stripe_webhook(request: Request):
-        """Handle Stripe webhooks (simplified)"""
+        """Queue a Stripe webhook event and acknowledge it once it is durable"""
+        if not STRIPE_WEBHOOK_SECRET:
+            # Unsigned events would let anyone grant themselves a subscription
+            raise HTTPException(status_code=503, detail="Stripe webhooks are not configured")
+        body = await request.body()
+        if not verify_stripe_signature(body, request.headers.get("Stripe-Signature"), STRIPE_WEBHOOK_SECRET):
+            raise HTTPException(status_code=400, detail="Invalid webhook signature")
         try:
-            body = await request.body()
-            # In production, verify webhook signature
-            # For now, just log that webhook was received
-            print("Stripe webhook received")
-            return {"status": "success"}
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=str(e))
+            event = json.loads(body)
+            event_id = event["id"]
+        except (ValueError, KeyError, TypeError):
+            raise HTTPException(status_code=400, detail="Invalid webhook payload")
+
+        record = {"id": event_id, "type": event.get("type"), "data": event.get("data"), "received_at": time.time()}
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, webhook_queue.append, record)
+        except OSError as e:
+            # Not acknowledged, so Stripe will retry delivery
+            raise HTTPException(status_code=500, detail=f"Failed to queue webhook: {e}")
+        webhook_queue.wakeup.set()
+        return {"status": "success"}
+
+# Cohort Endpoints
+@app.post("/api/cohorts")
+async def save_cohort(cohort: Cohort, request: Request):
+    """Create or replace a cohort of students"""
+    require_admin(request)
+    now = time.time()
+    event_log.append(EVENT_COHORT_SAVED, cohort.dict(), now)
+    return apply_cohort_saved(cohort.dict(), now)
+
+@app.get("/api/cohorts")
+async def list_cohorts(request: Request):
+    require_admin(request)
+    return {"cohorts": [{"id": c.id, "name": c.name, "user_count": len(c.user_ids)} for c in cohorts_db.values()]}
+
+@app.get("/api/cohorts/{cohort_id}/analytics")
+async def get_cohort_analytics(cohort_id: str, request: Request):
+    """Cached cohort dashboard ('all' covers every user); computed in the background"""
+    require_admin(request)
+    if cohort_id != ALL_USERS_COHORT and cohort_id not in cohorts_db:
+        raise HTTPException(status_code=404, detail="Cohort not found")
+    result = cohort_analytics.get(cohort_id)
+    if result is None:
+        return JSONResponse(status_code=202, content={"status": "computing", "retry_after_seconds": 2},
+                            headers={"Retry-After": "2"})
+    # The result is cached already; coalescing shares its JSON encoding
+    return await coalesced_json(("cohort-analytics", cohort_id, cohort_analytics.computed_at.get(cohort_id)),
+                                lambda: result, offload=True)
+
+@app.get("/api/cohorts/{cohort_id}/readiness")
+async def get_cohort_readiness(cohort_id: str, request: Request):
+    """Pass probabilities for every member of a cohort ('all' covers every user), scored in one batch"""
+    require_admin(request)
+    if cohort_id == ALL_USERS_COHORT:
+        user_ids = list(readiness_model.user_rows)
+    elif cohort_id in cohorts_db:
+        user_ids = cohorts_db[cohort_id].user_ids
+    else:
+        raise HTTPException(status_code=404, detail="Cohort not found")
+    return await coalesced_json(("cohort-readiness", cohort_id),
+                                lambda: {"cohort_id": cohort_id, **readiness_model.score_users(user_ids)})
+
+# Export Endpoints
+@app.get("/api/exports/{dataset}")
+async def export_dataset(dataset: str, request: Request, format: str = "csv", destination: str = "response",
+                         start: Optional[datetime] = None, end: Optional[datetime] = None,
+                         study_area_id: Optional[str] = None, cohort_id: Optional[str] = None):
+    """Stream quiz sessions or flashcard progress as CSV/Parquet, or write them to a local file"""
+    require_admin(request)
+    if dataset not in EXPORT_SOURCES:
+        raise HTTPException(status_code=404, detail=f"Unknown dataset, expected one of {list(EXPORT_SOURCES)}")
+    if format not in ("csv", "parquet"):
+        raise HTTPException(status_code=400, detail="Format must be csv or parquet")
+    if format == "parquet":
+        try:
+            import pyarrow.parquet  # noqa: F401
+        except ImportError:
+            raise HTTPException(status_code=400, detail="Parquet export is unavailable on this server (pyarrow is not installed); use format=csv")
+    if cohort_id and cohort_id not in cohorts_db:
+        raise HTTPException(status_code=404, detail="Cohort not found")
+
+    filters = ExportFilters(start=start, end=end, study_area_id=study_area_id, cohort_id=cohort_id)
+    filename = f"{dataset}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{format}"
+
+    if destination == "file":
+        job_id = str(uuid.uuid4())
+        path = os.path.join(EXPORT_DIR, filename)
+        export_jobs[job_id] = {"job_id": job_id, "path": path, "status": "running", "bytes_written": 0}
+        asyncio.create_task(export_to_file(job_id, path, dataset, format, filters))
+        return JSONResponse(status_code=202, content=export_jobs[job_id])
+
+    media_type = "text/csv" if format == "csv" else "application/vnd.apache.parquet"
+    return StreamingResponse(
+        export_chunks(dataset, format, filters),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+@app.get("/api/exports/jobs/{job_id}")
+async def get_export_job(job_id: str, request: Request):
+    require_admin(request)
+    if job_id not in export_jobs:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    return export_jobs[job_id]
+
+# Live Classroom Endpoints
+@app.post("/api/classrooms")
+async def create_live_classroom(request: Request):
+    """Open a live quiz room (instructors only); the instructor key is only returned here"""
+    user_id = get_current_user_id(request)
+    if user_id not in LIVE_INSTRUCTORS:
+        require_admin(request)
+    room = create_classroom(user_id)
+    return {"room_code": room.code, "instructor_key": room.instructor_key,
+            "websocket_path": f"/ws/classrooms/{room.code}"}
+
+@app.get("/api/classrooms/{room_code}")
+async def get_live_classroom(room_code: str, request: Request):
+    """Room stats, for its instructor (X-Instructor-Key header) or an admin"""
+    room = classrooms.get(room_code)
+    if room is None or not room.is_instructor_key(request.headers.get("X-Instructor-Key")):
+        require_admin(request)
+    if room is None:
+        raise HTTPException(status_code=404, detail="Classroom not found")
+    return {**room.stats(), "histogram": room.histogram()}
+
+@app.websocket("/ws/classrooms/{room_code}")
+async def classroom_socket(websocket: WebSocket, room_code: str, name: str = "Student", instructor_key: Optional[str] = None):
+    """Students send {"type": "answer", "selected_answer": ...}; the instructor sends
+    {"type": "push_question", "question_id": ...}, {"type": "close_question"} or {"type": "end"}"""
+    room = classrooms.get(room_code)
+    if room is None:
+        await websocket.close(code=4004)
+        return
+    is_instructor = room.is_instructor_key(instructor_key)
+    if instructor_key is not None and not is_instructor:
+        await websocket.close(code=4003)
+        return
+    if not is_instructor and len(room.members) >= LIVE_MAX_ROOM_MEMBERS:
+        await websocket.close(code=ROOM_FULL_CLOSE_CODE)
+        return
+    await websocket.accept()
+    member = RoomMember(str(uuid.uuid4()), name, websocket)
+    if is_instructor:
+        if room.instructor:
+            room.remove(room.instructor.member_id)
+        room.instructor = member
+        timer_wheel.cancel(("classroom-idle", room_code))
+    else:
+        room.members[member.member_id] = member
+        room.dirty = True
+    member.reply({**room.histogram(), "type": "joined", "member_id": member.member_id})
+    try:
+        while True:
+            message = await websocket.receive_json()
+            if not isinstance(message, dict):
+                member.reply({"type": "error", "detail": "Messages must be JSON objects"})
+                continue
+            kind = message.get("type")
+            if not is_instructor:
+                if kind == "answer":
+                    room.answer(member.member_id, submitted_response(message))
+            elif kind == "push_question":
+                try:
+                    room.push_question(message.get("question_id"))
+                except (KeyError, TypeError):
+                    member.reply({"type": "error", "detail": "Question not found"})
+            elif kind == "close_question":
+                room.close_question()
+            elif kind == "end":
+                end_classroom(room_code)
+                break
+    except (WebSocketDisconnect, ValueError):
+        pass
+    finally:
+        room.remove(member.member_id)
+        if is_instructor and room.instructor is None and classrooms.get(room_code) is room:
+            schedule_idle_classroom(room_code)
+
+# Admin Endpoints
+@app.get("/api/admin/admission")
+async def get_admission_stats(request: Request):
+    """Admission control counters for monitoring"""
+    require_admin(request)
+    return admission_controller.stats()
+
+@app.get("/api/admin/stripe")
+async def get_stripe_client_stats(request: Request):
+    """Stripe circuit breaker state"""
+    require_admin(request)
+    return {"circuit_breaker": stripe_breaker.stats(), "timeout_seconds": STRIPE_TIMEOUT_SECONDS}
+
+@app.get("/api/admin/webhooks")
+async def get_webhook_queue_stats(request: Request):
+    """Stripe webhook queue backlog and lag"""
+    require_admin(request)
+    return webhook_queue.stats()
+
+@app.get("/api/admin/entitlements")
+async def get_entitlement_stats(request: Request):
+    """Entitlement cache and gating counters"""
+    require_admin(request)
+    return entitlement_cache.stats()
+
+# Item Analysis Endpoints
+@app.get("/api/items/analysis")
+async def get_item_analysis(request: Request, flagged_only: bool = False):
+    """Item statistics for every question that has been answered"""
+    require_admin(request)
+    content = catalog
+
+    def build():
+        items = []
+        for question_id, stats in item_stats.items():
+            summary = stats.summary(content.questions.get(question_id))
+            if flagged_only and not summary["flags"]:
+                continue
+            items.append({"question_id": question_id, **summary})
+        items.sort(key=lambda item: (not item["flags"], item["question_id"]))
+        return {"items": items, "min_responses_for_flags": ITEM_MIN_RESPONSES}
+
+    return await coalesced_json(("item-analysis", content.version, flagged_only), build)
+
+@app.get("/api/items/{question_id}/analysis")
+async def get_question_item_analysis(question_id: str, request: Request):
+    """Item statistics for one question"""
+    require_admin(request)
+    stats = item_stats.get(question_id)
+    if stats is None:
+        raise HTTPException(status_code=404, detail="No responses recorded for this question")
+    return {"question_id": question_id, **stats.summary(catalog.questions.get(question_id))}
+
+@app.get("/api/admin/question-cache")
+async def get_question_cache_stats(request: Request):
+    """Pre-rendered question fragment cache status"""
+    require_admin(request)
+    return {"content_version": catalog.version, **catalog.fragments.stats()}
+
+@app.get("/api/admin/classrooms")
+async def get_classroom_stats(request: Request):
+    """Live classroom rooms and their fan-out counters"""
+    require_admin(request)
+    return {"rooms": [room.stats() for room in classrooms.values()]}
+
+@app.get("/api/admin/recommendations")
+async def get_recommender_stats(request: Request):
+    require_admin(request)
+    return study_recommender.stats()
+
+@app.post("/api/admin/recommendations/refresh")
+async def refresh_recommendations(request: Request, full: bool = False):
+    """Recompute recommendations now (all users with full=true, otherwise those with new results)"""
+    require_admin(request)
+    refreshed = await study_recommender.refresh(full)
+    return {"refreshed_users": refreshed, **study_recommender.stats()}
+
+@app.get("/api/admin/exam-timers")
+async def get_exam_timer_stats(request: Request):
+    """Timer wheel and timed exam session counts"""
+    require_admin(request)
+    active = sum(1 for session in exam_sessions.values() if session.result is None)
+    return {**timer_wheel.stats(), "active_exams": active, "finished_exams": len(exam_sessions) - active}
+
+@app.get("/api/admin/content")
+async def get_content_status(request: Request):
+    """Current catalog snapshot and reload status"""
+    require_admin(request)
+    return {**catalog.stats(), "reloader": content_reloader.stats()}
+
+@app.post("/api/admin/content")
+async def upload_content(upload: ContentUpload, request: Request):
+    """Replace one or more content sections; the new catalog is swapped in once fully built"""
+    require_admin(request)
+    sections = {section: items for section, items in upload.dict().items() if items is not None}
+    if not sections:
+        raise HTTPException(status_code=400, detail="Upload at least one of: " + ", ".join(CONTENT_SECTIONS))
+    loop = asyncio.get_running_loop()
+    for section, items in sections.items():
+        try:
+            await loop.run_in_executor(None, parse_content_section, section, items)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid {section}: {e}")
+    for section, items in sections.items():
+        await loop.run_in_executor(None, write_content_section, section, items)
+    await content_reloader.reload()
+    return catalog.stats()
+
+@app.get("/api/admin/content/duplicates")
+async def get_duplicate_report(request: Request):
+    """Near-duplicate question clusters found when the current catalog was built"""
+    require_admin(request)
+    content = catalog
+    return {
+        "mode": CONTENT_DEDUP_MODE,
+        "threshold": DEDUP_THRESHOLD,
+        "clusters": content.duplicates,
+        "duplicates_removed": content.duplicates_removed,
+    }
+
+@app.post("/api/admin/content/reload")
+async def reload_content(request: Request):
+    """Rebuild the catalog from CONTENT_DIR now"""
+    require_admin(request)
+    try:
+        await content_reloader.reload()
+    except Exception:
+        raise HTTPException(status_code=500, detail=f"Content reload failed: {content_reloader.last_error}")
+    return catalog.stats()
+
+@app.get("/api/admin/event-log")
+async def get_event_log_stats(request: Request):
+    """Event log, snapshot and recovery status"""
+    require_admin(request)
+    return event_log.stats()
+
+@app.post("/api/admin/event-log/snapshot")
+async def take_event_log_snapshot(request: Request):
+    """Take a snapshot now and drop the log segments it covers"""
+    require_admin(request)
+    writer = event_log.snapshot()
+    if writer is not None:
+        await asyncio.get_running_loop().run_in_executor(None, writer)
+    return event_log.stats()
+
+@app.post("/api/admin/synthetic-data")
+async def generate_synthetic_data(spec: SyntheticDatasetSpec, request: Request):
+    """Replace questions, flashcards and all progress with a seeded synthetic dataset (load testing)"""
+    require_admin(request)
+    if min(spec.users, spec.questions, spec.flashcards, spec.questions_per_quiz, spec.days) < 1 \
+            or min(spec.reviews, spec.quizzes) < 0:
+        raise HTTPException(status_code=400, detail="Counts must be positive (reviews and quizzes may be 0)")
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    content, state = await loop.run_in_executor(None, generate_synthetic_dataset, spec, catalog.study_areas)
+    generate_seconds = time.perf_counter() - started
+
+    # Content goes through CONTENT_DIR so it survives restarts; progress is then
+    # persisted by a snapshot, since none of it went through the event log
+    for section, items in content.items():
+        await loop.run_in_executor(None, write_content_section, section, items)
+    await content_reloader.reload()
+    state["users_db"] = {**users_db, **state["users_db"]}
+    restore_state(state)
+    writer = event_log.snapshot(force=True)
+    if writer is not None:
+        await loop.run_in_executor(None, writer)
+    print(f"Synthetic dataset (seed {spec.seed}) loaded in {time.perf_counter() - started:.1f}s")
+    return {
+        "seed": spec.seed,
+        "users": spec.users,
+        "questions": len(catalog.questions),
+        "flashcards": len(catalog.flashcards),
+        "reviews": spec.reviews,
+        "quizzes": spec.quizzes,
+        "flashcard_progress_rows": len(flashcard_progress_db),
+        "quiz_progress_records": len(user_progress_db),
+        "generate_seconds": round(generate_seconds, 2),
+        "total_seconds": round(time.perf_counter() - started, 2),
+    }
+
+@app.get("/api/admin/coalescing")
+async def get_coalescing_stats(request: Request):
+    """Requests served by a shared or micro-cached computation, and the compute time saved"""
+    require_admin(request)
+    return single_flight.stats()
+
+# Memory Endpoints
+@app.get("/api/admin/memory")
+async def get_memory_report(request: Request):
+    """Approximate size and entry count of every in-memory store, measured now"""
+    require_admin(request)
+    return {**memory_accountant.measure(), **memory_accountant.stats()}
+
+@app.get("/api/admin/memory/history")
+async def get_memory_history(request: Request, limit: int = 120):
+    """Most recent periodic samples, oldest first"""
+    require_admin(request)
+    history = list(memory_accountant.history)
+    return {"sample_seconds": MEMORY_SAMPLE_SECONDS, "samples": history[-limit:] if limit > 0 else []}
+
+@app.post("/api/admin/memory/tracemalloc")
+async def start_tracemalloc(config: TracemallocConfig, request: Request):
+    """Start tracing allocations; growth is reported relative to this moment"""
+    require_admin(request)
+    await asyncio.get_running_loop().run_in_executor(None, memory_accountant.start_tracing, max(1, config.frames))
+    return memory_accountant.stats()
+
+@app.delete("/api/admin/memory/tracemalloc")
+async def stop_tracemalloc(request: Request):
+    require_admin(request)
+    memory_accountant.stop_tracing()
+    return memory_accountant.stats()
+
+@app.get("/api/admin/memory/allocations")
+async def get_top_allocations(request: Request, limit: int = 25, group_by: str = "lineno"):
+    """Top allocation sites from tracemalloc (start it first); group_by is lineno, filename or traceback"""
+    require_admin(request)
+    if not tracemalloc.is_tracing():
+        raise HTTPException(status_code=409, detail="tracemalloc is not running; POST /api/admin/memory/tracemalloc first")
+    if group_by not in ("lineno", "filename", "traceback"):
+        raise HTTPException(status_code=400, detail="group_by must be lineno, filename or traceback")
+    return await asyncio.get_running_loop().run_in_executor(
+        None, memory_accountant.top_allocations, max(1, limit), group_by)
+
+# Profiler Endpoints
+@app.get("/api/admin/profiler")
+async def get_profiler_status(request: Request):
+    require_admin(request)
+    return profiler.stats()
+
+@app.post("/api/admin/profiler")
+async def configure_profiler(config: ProfilerConfig, request: Request):
+    """Change the sampling rate, route filter (regex; empty clears it) or interval"""
+    require_admin(request)
+    try:
+        profiler.configure(config.sample_rate, config.route_pattern, config.interval_ms)
+    except re.error as e:
+        raise HTTPException(status_code=400, detail=f"Invalid route pattern: {e}")
+    return profiler.stats()
+
+@app.get("/api/admin/profiler/flamegraph", response_class=PlainTextResponse)
+async def get_profiler_flamegraph(request: Request):
+    """Aggregated stacks in collapsed format (flamegraph.pl, speedscope)"""
+    require_admin(request)
+    return profiler.collapsed()
+
+@app.post("/api/admin/profiler/dump")
+async def dump_profiler(request: Request, reset: bool = False):
+    """Write the aggregated stacks to PROFILER_DUMP_DIR"""
+    require_admin(request)
+    path = await asyncio.get_running_loop().run_in_executor(None, profiler.dump)
+    stats = profiler.stats()
+    if reset:
+        profiler.reset()
+    return {"path": path, **stats}
+
+@app.delete("/api/admin/profiler")
+async def reset_profiler(request: Request):
+    require_admin(request)
+    profiler.reset()
+    return profiler.stats()
 
 # Quiz Endpoints
 @app.post("/api/quiz/start-advanced")
-async def start_advanced_quiz(request: dict):
+async def start_advanced_quiz(request: AdvancedQuizRequest, http_request: Request):
     """Start an advanced quiz session"""
-    study_area = request.get("study_area")
-    quiz_type = request.get("quiz_type", "practice")
-    settings = request.get("settings", {})
+    study_area = request.study_area
+    quiz_type = request.quiz_type
+    settings = request.settings.dict(exclude_unset=True)
+    check_entitlement(get_current_user_id(http_request), "advanced_quizzes", study_area)
     
     # Create quiz session
     quiz_id = str(uuid.uuid4())
+    content = catalog
     
-    # Get questions for the specific study area
-    quiz_questions = []
-    for question in questions_db.values():
-        if hasattr(question, 'study_area_id') and question.study_area_id == study_area:
-            quiz_questions.append(question)
+    if quiz_type in ("exam", "nclex", "nclex_simulation") or request.settings.blueprint is not None:
+        # Blueprint-driven form: NCLEX client-needs weights unless overridden
+        blueprint = request.settings.blueprint or ExamBlueprint()
+        if "study_area_id" not in blueprint.model_fields_set:
+            blueprint.study_area_id = study_area
+        question_ids, seed = assemble_exam_form(blueprint, content.pools)
+        settings = {**settings, "blueprint": {**blueprint.dict(), "seed": seed}}
+    else:
+        # Get questions for the specific study area
+        question_ids = content.pools.by_area.get(study_area, ())
     
-    return {
-        "quiz_id": quiz_id,
-        "questions": [q.dict() for q in quiz_questions],
-        "settings": settings,
-        "total_questions": len(quiz_questions)
-    }
+    time_limit = exam_time_limit(request.time_limit or request.settings.time_limit, quiz_type, question_ids)
+    expires_at = None
+    if time_limit:
+        session = start_exam_session(quiz_id, get_current_user_id(http_request), question_ids, time_limit)
+        expires_at = datetime.fromtimestamp(session.deadline).isoformat()
+    
+    # Splice the cached question fragments into the response body; a server-graded
+    # timed exam gets them without answer keys or explanations
+    projection = "student" if time_limit else "full"
+    body = b"".join((
+        b'{"quiz_id":', json_bytes(quiz_id),
+        b',"questions":', content.fragments.render_list(question_ids, projection),
+        b',"settings":', json_bytes(settings),
+        b',"total_questions":', json_bytes(len(question_ids)),
+        b',"time_limit":', json_bytes(time_limit),
+        b',"expires_at":', json_bytes(expires_at),
+        b"}",
+    ))
+    return Response(content=body, media_type="application/json")
+
+@app.post("/api/quiz/{quiz_id}/answers")
+async def save_exam_answers(quiz_id: str, submission: Union[ExamAnswerBatch, QuizAnswer], request: Request):
+    """Save answers to a timed exam as they are given (a batch or a single answer), so an auto-submit can grade them"""
+    check_entitlement(get_current_user_id(request), "advanced_quizzes")
+    session = exam_sessions.get(quiz_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="No timed exam session with this ID")
+    if session.result is not None or time.time() > session.deadline + EXAM_GRACE_SECONDS:
+        raise HTTPException(status_code=409, detail="Time is up for this exam")
+    answers = submission.answers if isinstance(submission, ExamAnswerBatch) else [submission]
+    save_exam_answers_to(session, [answer.payload() for answer in answers])
+    return session.status()
+
+@app.get("/api/quiz/{quiz_id}/session")
+async def get_exam_session(quiz_id: str):
+    """Time remaining, or the result once the exam has been submitted"""
+    session = exam_sessions.get(quiz_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="No timed exam session with this ID")
+    return session.status()
 
 @app.post("/api/quiz/{quiz_id}/submit-advanced")
-async def submit_advanced_quiz(quiz_id: str, submission: dict):
+async def submit_advanced_quiz(quiz_id: str, submission: AdvancedQuizSubmission, request: Request):
     """Submit advanced quiz results"""
-    answers = submission.get("answers", [])
-    time_spent = submission.get("time_spent", 0)
-    
-    # Calculate results
-    correct_count = 0
-    total_questions = len(answers)
-    
-    for answer in answers:
-        question_id = answer.get("question_id")
-        selected_answer = answer.get("selected_answer")
-        
-        if question_id in questions_db:
-            question = questions_db[question_id]
-            if selected_answer == question.correct_answer_id:
-                correct_count += 1
-    
-    score_percentage = (correct_count / total_questions * 100) if total_questions > 0 else 0
-    
-    return {
-        "quiz_id": quiz_id,
-        "score": score_percentage,
-        "correct_answers": correct_count,
-        "total_questions": total_questions,
-        "time_spent": time_spent,
-        "passed": score_percentage >= 75,
-        "detailed_results": [
-            {
-                "question_id": ans.get("question_id"),
-                "correct": ans.get("selected_answer") == questions_db.get(ans.get("question_id"), {}).correct_answer_id if ans.get("question_id") in questions_db else False,
-                "selected_answer": ans.get("selected_answer"),
-                "correct_answer": questions_db.get(ans.get("question_id"), {}).correct_answer_id if ans.get("question_id") in questions_db else None
-            }
-            for ans in answers
-        ]
-    }
+    check_entitlement(get_current_user_id(request), "advanced_quizzes")
+    answers = [answer.payload() for answer in submission.answers]
+    session = exam_sessions.get(quiz_id)
+    if session is not None:
+        # Timed exam: the server's clock decides, and a finished exam keeps its first result
+        if session.result is not None:
+            return session.result
+        save_exam_answers_to(session, answers)
+        return finish_exam_session(session, auto_submitted=False)
+    return grade_advanced_quiz(quiz_id, answers, finite_seconds(submission.time_spent), get_current_user_id(request))
 
 # Flashcard Study Endpoints  
 @app.post("/api/flashcards/study")
-async def start_flashcard_study(request: dict = None):
+async def start_flashcard_study(http_request: Request, request: dict = None):
     """Start flashcard study session"""
     session_id = str(uuid.uuid4())
+    user_id = get_current_user_id(http_request)
+    check_entitlement(user_id, "spaced_repetition")
+    studied = len(flashcard_progress_db.user_rows_of(user_id))
     
     return {
         "session_id": session_id,
-        "total_cards": len(flashcards_db),
-        "cards_due": 2  # Demo data
+        "total_cards": len(catalog.flashcards),
+        # Reviewed cards that are due plus cards never studied
+        "cards_due": len(flashcard_progress_db.due_before(user_id, datetime.now())) + max(0, len(catalog.flashcards) - studied)
     }
 
 @app.post("/api/flashcards/study/{session_id}/review")
-async def review_flashcard_basic(session_id: str, request: dict):
+async def review_flashcard_basic(session_id: str, request: dict, http_request: Request):
     """Basic flashcard review"""
+    check_entitlement(get_current_user_id(http_request), "spaced_repetition")
     return {"status": "recorded", "next_card": True}
 
 @app.post("/api/flashcards/study/{session_id}/review-spaced")
-async def review_flashcard_spaced(session_id: str, request: dict):
+async def review_flashcard_spaced(session_id: str, request: dict, http_request: Request):
     """Spaced repetition flashcard review"""
     return await review_flashcard(FlashcardReview(
         flashcard_id=request.get("card_id"),
         difficulty="good" if request.get("quality", 3) >= 3 else "hard"
-    ))
+    ), http_request)
 
 # Startup event
 @app.on_event("startup")
@@ -934,8 +6035,26 @@ async def startup_event():
     print("NursePrep Pro API starting up...")
     initialize_sample_data()
     print("Sample data initialized")
+    if content_dir_signature():
+        try:
+            await content_reloader.reload()
+        except Exception:
+            pass  # keep the built-in content
+    asyncio.create_task(content_watcher())
+    asyncio.create_task(timer_wheel.run())
+    asyncio.create_task(recommendation_refresher())
+    asyncio.create_task(memory_sampler())
+    event_log.recover()
+    asyncio.create_task(event_log_maintenance())
+    asyncio.create_task(webhook_worker())
     print("🚀 Ready for your custom database integration!")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    stripe_executor.shutdown(wait=False)
+    cohort_analytics.shutdown()
+    event_log.fsync()
+
 # Vercel handler
 app = app
 
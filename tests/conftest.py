@@ -0,0 +1,22 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Configuration is read when server.py is imported, so set it up first
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="nurseprep-tests-"))
+os.environ.setdefault("STRIPE_API_KEY", "sk_test_dummy")
+os.environ.setdefault("ADMISSION_READ_BURST", "100000")
+os.environ.setdefault("ADMISSION_WRITE_BURST", "100000")
+os.environ.setdefault("ALLOW_UNAUTHENTICATED_ADMIN", "true")  # tests that check the key set one
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+import server  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+    with TestClient(server.app) as test_client:
+        yield test_client
@@ -0,0 +1,55 @@
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+import server
+
+TODAY = date(2026, 3, 31)
+
+
+def noon(day: date) -> float:
+    return datetime(day.year, day.month, day.day, 12).timestamp()
+
+
+def calendar_with(days_ago, user_id="streaker"):
+    calendar = server.ActivityCalendar()
+    for offset in days_ago:
+        calendar.mark(user_id, noon(TODAY - timedelta(days=offset)))
+    return calendar
+
+
+def test_current_streak_ends_today_or_yesterday():
+    assert calendar_with([0, 1, 2, 4]).current_streak("streaker", TODAY) == 3
+    assert calendar_with([1, 2, 3, 4, 9]).current_streak("streaker", TODAY) == 4  # today not studied yet
+    assert calendar_with([2, 3]).current_streak("streaker", TODAY) == 0
+    assert calendar_with([0]).current_streak("streaker", TODAY - timedelta(days=1)) == 0  # before the first day
+    assert server.ActivityCalendar().current_streak("nobody", TODAY) == 0
+
+
+def test_longest_streak_and_out_of_order_marks():
+    calendar = calendar_with([30, 10, 11, 29, 12, 28, 13, 14, 27, 40, 0])  # earlier days extend the bitmap downwards
+    assert calendar.longest_streak("streaker") == 5
+    assert calendar.current_streak("streaker", TODAY) == 1
+    assert calendar.heatmap("streaker", days=15, today=TODAY)["active_days"] == 6
+
+
+def test_heatmap_window():
+    heatmap = calendar_with([0, 2, 400]).heatmap("streaker", days=7, today=TODAY)
+    assert heatmap["start_date"] == "2026-03-25" and heatmap["end_date"] == "2026-03-31"
+    assert heatmap["days"] == "0000101"
+
+
+def test_mark_many_matches_mark():
+    rng = np.random.default_rng(5)
+    users = [f"user-{n}" for n in rng.integers(0, 20, 3000)]
+    timestamps = noon(TODAY) - rng.integers(0, 200 * 86400, 3000).astype(np.float64)
+    one_by_one = server.ActivityCalendar()
+    for user_id, ts in zip(users, timestamps.tolist()):
+        one_by_one.mark(user_id, ts)
+    batched = server.ActivityCalendar()
+    batched.mark("user-0", noon(TODAY))  # merges into an existing bitmap
+    one_by_one.mark("user-0", noon(TODAY))
+    batched.mark_many(users[:1500], timestamps[:1500])
+    batched.mark_many(users[1500:], timestamps[1500:])
+    assert batched.base_day == one_by_one.base_day
+    assert batched.bits == one_by_one.bits
@@ -0,0 +1,33 @@
+import pytest
+
+import server
+
+ADMIN_REQUESTS = [
+    ("post", "/api/admin/synthetic-data", {"json": {"users": 1}}),
+    ("post", "/api/admin/content", {"json": {}}),
+    ("get", "/api/exports/flashcard_progress", {}),
+    ("post", "/api/classrooms", {"headers": {"X-User-Id": "anyone"}}),
+    ("get", "/api/admin/webhooks", {}),
+]
+
+
+@pytest.mark.parametrize("method, path, kwargs", ADMIN_REQUESTS)
+def test_admin_endpoints_are_closed_without_a_configured_key(client, monkeypatch, method, path, kwargs):
+    monkeypatch.setattr(server, "ADMIN_API_KEY", None)
+    monkeypatch.setattr(server, "ALLOW_UNAUTHENTICATED_ADMIN", False)
+    response = getattr(client, method)(path, **kwargs)
+    assert response.status_code == 403
+    assert "ADMIN_API_KEY" in response.json()["detail"]
+
+
+def test_admin_key_is_required_when_configured(client, monkeypatch):
+    monkeypatch.setattr(server, "ADMIN_API_KEY", "admin-secret")
+    assert client.get("/api/admin/webhooks").status_code == 403
+    assert client.get("/api/admin/webhooks", headers={"X-Admin-Key": "wrong"}).status_code == 403
+    assert client.get("/api/admin/webhooks", headers={"X-Admin-Key": "admin-secret"}).status_code == 200
+
+
+def test_development_flag_opens_admin_endpoints(client, monkeypatch):
+    monkeypatch.setattr(server, "ADMIN_API_KEY", None)
+    monkeypatch.setattr(server, "ALLOW_UNAUTHENTICATED_ADMIN", True)
+    assert client.get("/api/admin/webhooks").status_code == 200
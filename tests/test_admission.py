@@ -0,0 +1,31 @@
+from types import SimpleNamespace
+
+import server
+
+
+def make_request(host, headers=None):
+    return SimpleNamespace(client=SimpleNamespace(host=host), headers=headers or {})
+
+
+def test_client_key_ignores_user_supplied_identity(monkeypatch):
+    monkeypatch.setattr(server, "TRUSTED_PROXIES", set())
+    headers = {"X-User-Id": "someone-else", "X-Forwarded-For": "203.0.113.9"}
+    assert server.get_client_key(make_request("198.51.100.7", headers)) == "ip:198.51.100.7"
+
+
+def test_forwarded_for_honoured_only_behind_trusted_proxy(monkeypatch):
+    monkeypatch.setattr(server, "TRUSTED_PROXIES", {"10.0.0.1", "10.0.0.2"})
+    # A client-forged first entry is skipped: the rightmost untrusted address wins
+    headers = {"X-Forwarded-For": "1.2.3.4, 203.0.113.9, 10.0.0.2"}
+    assert server.get_client_key(make_request("10.0.0.1", headers)) == "ip:203.0.113.9"
+    assert server.get_client_key(make_request("10.0.0.1")) == "ip:10.0.0.1"
+
+
+def test_rotating_headers_does_not_reset_the_budget(monkeypatch):
+    monkeypatch.setattr(server, "TRUSTED_PROXIES", set())
+    controller = server.AdmissionController()
+    rejected = 0
+    for i in range(int(server.ADMISSION_WRITE_BURST) + 5):
+        request = make_request("198.51.100.8", {"X-User-Id": f"user-{i}", "X-Forwarded-For": f"203.0.113.{i % 250}"})
+        rejected += controller.check(server.get_client_key(request), is_write=True) is not None
+    assert rejected == 5
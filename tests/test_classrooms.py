@@ -0,0 +1,98 @@
+import asyncio
+import time
+
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+import server
+
+
+def open_room(client, user_id, **headers):
+    return client.post("/api/classrooms", headers={"X-User-Id": user_id, **headers})
+
+
+def test_students_cannot_open_rooms(client, monkeypatch):
+    monkeypatch.setattr(server, "ADMIN_API_KEY", "admin-secret")
+    monkeypatch.setattr(server, "LIVE_INSTRUCTORS", {"instructor-1"})
+    assert open_room(client, "student-1").status_code == 403
+    assert open_room(client, "instructor-1").status_code == 200
+    assert open_room(client, "staff-1", **{"X-Admin-Key": "admin-secret"}).status_code == 200
+
+
+def test_rooms_are_capped_per_instructor_and_globally(client, monkeypatch):
+    monkeypatch.setattr(server, "LIVE_MAX_ROOMS_PER_INSTRUCTOR", 2)
+    assert open_room(client, "busy-instructor").status_code == 200
+    assert open_room(client, "busy-instructor").status_code == 200
+    assert open_room(client, "busy-instructor").status_code == 429
+
+    monkeypatch.setattr(server, "LIVE_MAX_ROOMS", len(server.classrooms))
+    assert open_room(client, "another-instructor").status_code == 429
+
+
+def test_room_is_scheduled_to_end_while_its_instructor_is_away(client):
+    room = open_room(client, "idle-instructor").json()
+    code, key = room["room_code"], room["instructor_key"]
+    idle_timer = ("classroom-idle", code)
+    assert idle_timer in server.timer_wheel.locations  # never joined yet
+
+    with client.websocket_connect(f"/ws/classrooms/{code}?instructor_key={key}") as socket:
+        assert socket.receive_json()["type"] == "joined"
+        assert idle_timer not in server.timer_wheel.locations
+    deadline = time.monotonic() + 2
+    while idle_timer not in server.timer_wheel.locations and time.monotonic() < deadline:
+        time.sleep(0.01)  # the server handles the disconnect on its own loop
+    assert idle_timer in server.timer_wheel.locations
+
+    client.portal.call(server.end_classroom, code)  # what the idle timer runs
+    assert idle_timer not in server.timer_wheel.locations
+    assert client.get(f"/api/classrooms/{code}").status_code == 404
+
+
+def test_malformed_frames_get_an_error_reply(client):
+    room = open_room(client, "frame-instructor").json()
+    code, key = room["room_code"], room["instructor_key"]
+    with client.websocket_connect(f"/ws/classrooms/{code}?instructor_key={key}") as instructor:
+        assert instructor.receive_json()["type"] == "joined"
+        for frame in ([1, 2], "push_question", 7, {"type": "push_question", "question_id": ["a"]}):
+            instructor.send_json(frame)
+            assert instructor.receive_json()["type"] == "error"
+        instructor.send_json({"type": "end"})
+    assert code not in server.classrooms
+
+
+def test_reply_to_a_member_that_is_far_behind_is_dropped(client):
+    class StalledSocket:
+        async def send_text(self, frame):
+            await asyncio.Event().wait()
+
+    async def scenario():
+        member = server.RoomMember("stalled", "Student", StalledSocket())
+        for n in range(server.LIVE_SEND_QUEUE + 2):
+            member.reply({"type": "error", "n": n})  # must not raise QueueFull
+        member.stop()
+
+    client.portal.call(scenario)
+
+
+def test_room_stats_need_the_instructor_key_or_admin(client, monkeypatch):
+    room = open_room(client, "stats-instructor").json()
+    code, key = room["room_code"], room["instructor_key"]
+    monkeypatch.setattr(server, "ADMIN_API_KEY", "admin-secret")
+    assert client.get(f"/api/classrooms/{code}").status_code == 403
+    assert client.get(f"/api/classrooms/{code}", headers={"X-Instructor-Key": "guess"}).status_code == 403
+    assert client.get("/api/classrooms/NOROOM", headers={"X-Instructor-Key": key}).status_code == 403
+    assert client.get(f"/api/classrooms/{code}", headers={"X-Instructor-Key": key}).status_code == 200
+    assert client.get(f"/api/classrooms/{code}", headers={"X-Admin-Key": "admin-secret"}).status_code == 200
+    client.portal.call(server.end_classroom, code)
+
+
+def test_room_member_limit(client, monkeypatch):
+    monkeypatch.setattr(server, "LIVE_MAX_ROOM_MEMBERS", 1)
+    code = open_room(client, "full-instructor").json()["room_code"]
+    with client.websocket_connect(f"/ws/classrooms/{code}") as student:
+        assert student.receive_json()["type"] == "joined"
+        with pytest.raises(WebSocketDisconnect) as closed:
+            with client.websocket_connect(f"/ws/classrooms/{code}") as late:
+                late.receive_json()
+        assert closed.value.code == server.ROOM_FULL_CLOSE_CODE
+    client.portal.call(server.end_classroom, code)
@@ -0,0 +1,29 @@
+from concurrent.futures.process import BrokenProcessPool
+
+import server
+
+
+class DeadPool:
+    """A process pool whose worker was killed"""
+    shut_down = False
+
+    def submit(self, *args, **kwargs):
+        raise BrokenProcessPool("A child process terminated abruptly")
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shut_down = True
+
+
+def test_broken_pool_is_replaced(client, monkeypatch):
+    client.post("/api/submit-quiz", json={"study_area_id": "fundamentals", "answers": []},
+                headers={"X-User-Id": "cohort-user"})
+    dead = DeadPool()
+    monkeypatch.setattr(server.cohort_analytics, "executor", dead)
+    client.portal.call(server.cohort_analytics._refresh, server.ALL_USERS_COHORT)
+    assert dead.shut_down and server.cohort_analytics.executor is None
+    assert server.ALL_USERS_COHORT not in server.cohort_analytics.computed_at
+
+    # The next refresh starts a fresh pool and succeeds
+    client.portal.call(server.cohort_analytics._refresh, server.ALL_USERS_COHORT)
+    assert server.ALL_USERS_COHORT in server.cohort_analytics.computed_at
+    assert server.cohort_analytics.executor._mp_context.get_start_method() in ("forkserver", "spawn")
@@ -0,0 +1,65 @@
+import pytest
+
+import server
+
+
+def test_cache_is_bounded_lru():
+    cache = server.EntitlementCache(ttl=300, max_entries=3)
+    for user_id in ("a", "b", "c"):
+        cache.get(user_id)
+    cache.get("a")  # refresh "a" so "b" is now least recently used
+    cache.get("d")
+    assert list(cache.entries) == ["c", "a", "d"]
+    assert cache.evictions == 1
+
+
+def test_rotating_user_ids_cannot_grow_the_cache():
+    cache = server.EntitlementCache(ttl=300, max_entries=100)
+    for i in range(10000):
+        cache.get(f"rotating-{i}")
+    assert len(cache.entries) == 100
+
+
+def test_expired_entry_is_rebuilt():
+    cache = server.EntitlementCache(ttl=0, max_entries=10)
+    cache.get("u")
+    cache.get("u")
+    assert cache.misses == 2 and cache.hits == 0 and len(cache.entries) == 1
+
+
+PREMIUM_REQUESTS = [
+    ("post", "/api/review-flashcard", {"json": {"flashcard_id": "card-1", "difficulty": "good"}}),
+    ("post", "/api/flashcards/study/session-1/review-spaced", {"json": {"card_id": "card-1", "quality": 4}}),
+    ("post", "/api/flashcards/study", {"json": {}}),
+    ("get", "/api/flashcards/due", {}),
+    ("get", "/api/analytics", {}),
+    ("get", "/api/readiness", {}),
+    ("get", "/api/recommendations", {}),
+    ("post", "/api/quiz/untimed-quiz/submit-advanced", {"json": {"answers": []}}),
+    ("get", "/api/study-areas/medical-surgical/questions", {}),
+]
+
+
+@pytest.fixture
+def gating(monkeypatch):
+    monkeypatch.setattr(server, "PREMIUM_GATING_ENABLED", True)
+    server.users_db["gated-premium"] = server.User(id="gated-premium", email="premium@example.com",
+                                                   subscription_tier="premium", subscription_status="active")
+    server.entitlement_cache.invalidate(["gated-free", "gated-premium"])
+    yield
+    server.users_db.pop("gated-premium", None)
+    server.entitlement_cache.invalidate(["gated-premium"])
+
+
+@pytest.mark.parametrize("method, path, kwargs", PREMIUM_REQUESTS)
+def test_every_route_to_a_premium_feature_is_gated(client, gating, method, path, kwargs):
+    denied = getattr(client, method)(path, headers={"X-User-Id": "gated-free"}, **kwargs)
+    assert denied.status_code == 403
+    allowed = getattr(client, method)(path, headers={"X-User-Id": "gated-premium"}, **kwargs)
+    assert allowed.status_code == 200
+
+
+def test_free_features_stay_open(client, gating):
+    headers = {"X-User-Id": "gated-free"}
+    assert client.get("/api/study-areas/fundamentals/questions", headers=headers).status_code == 200
+    assert client.get("/api/flashcards", headers=headers).status_code == 200
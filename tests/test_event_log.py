@@ -0,0 +1,139 @@
+import os
+import time
+
+import numpy as np
+import pytest
+
+import server
+
+
+def fresh_log(tmp_path):
+    return server.EventLog(str(tmp_path / "events"), segment_bytes=1 << 20)
+
+
+def recover_into_fresh_process(tmp_path):
+    """Wipe the in-memory stores and recover them from disk, as a restart would"""
+    for store in server.snapshot_state().values():
+        store.clear()
+    log = fresh_log(tmp_path)
+    log.recover()
+    return log
+
+
+def test_empty_flashcard_store_snapshot_round_trip(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "event_log", fresh_log(tmp_path))
+    server.flashcard_progress_db.clear()
+    writer = server.event_log.snapshot(force=True)
+    writer()
+
+    recover_into_fresh_process(tmp_path)
+    started = time.monotonic()
+    interval = server.flashcard_progress_db.review("empty-store-user", "card-1", "good", time.time())
+    assert time.monotonic() - started < 1
+    assert interval == 2.5
+    assert server.flashcard_progress_db.get("empty-store-user", "card-1").repetitions == 1
+
+
+def test_snapshot_round_trip_without_pickle(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "event_log", fresh_log(tmp_path))
+    server.flashcard_progress_db.clear()
+    now = time.time()
+    server.apply_flashcard_review({"user_id": "round-trip-user", "flashcard_id": "card-1", "difficulty": "good"}, now)
+    server.apply_flashcard_review({"user_id": "round-trip-user", "flashcard_id": "card-2", "difficulty": "hard"}, now)
+    server.event_log.seq += 1
+    server.event_log.snapshot()()
+    before = server.flashcard_progress_db.get("round-trip-user", "card-1")
+
+    snapshot, = (tmp_path / "events").glob("snapshot-*.npz")
+    with np.load(snapshot, allow_pickle=False) as archive:
+        assert "__meta__" in archive.files
+
+    recover_into_fresh_process(tmp_path)
+    after = server.flashcard_progress_db.get("round-trip-user", "card-1")
+    assert (after.interval_days, after.repetitions, after.next_review_date) == (
+        before.interval_days, before.repetitions, before.next_review_date)
+    assert server.flashcard_progress_db.get("round-trip-user", "card-2").ease_factor < 2.5
+    assert server.activity_calendar.bits.get("round-trip-user")
+
+
+def test_legacy_pickle_snapshots_are_never_loaded(tmp_path):
+    events = tmp_path / "events"
+    events.mkdir(mode=0o700)
+    (events / "snapshot-0000000000000009.pkl").write_bytes(b"not a snapshot")
+    log = recover_into_fresh_process(tmp_path)
+    assert log.snapshot_seq == 0
+
+
+def test_recover_refuses_a_writable_log_directory(tmp_path):
+    events = tmp_path / "events"
+    events.mkdir()
+    os.chmod(events, 0o777)
+    with pytest.raises(RuntimeError):
+        fresh_log(tmp_path).recover()
+
+
+def review_state(user_ids):
+    store, calendar = server.flashcard_progress_db, server.activity_calendar
+    return (
+        {(p.user_id, p.flashcard_id): (p.ease_factor, p.interval_days, p.repetitions, p.next_review_date)
+         for user_id in user_ids for p in store.for_user(user_id)},
+        {user_id: (calendar.base_day.get(user_id), calendar.bits.get(user_id)) for user_id in user_ids},
+    )
+
+
+def test_batched_replay_matches_live_reviews(tmp_path, monkeypatch):
+    log = fresh_log(tmp_path)
+    monkeypatch.setattr(server, "event_log", log)
+    server.flashcard_progress_db.clear()
+    server.activity_calendar.clear()
+    user_ids = [f"replay-user-{i}" for i in range(50)]
+    start = time.time() - 40 * 86400
+    for i in range(3000):
+        if i == 1500:
+            deletion = {"user_id": user_ids[3]}
+            server.apply_progress_deletion(deletion, start)
+            log.append(server.EVENT_PROGRESS_DELETED, deletion, start)
+        review = {"user_id": user_ids[i % 50], "flashcard_id": f"card-{i % 7}",
+                  "difficulty": ("easy", "good", "hard", "good")[i % 4]}
+        ts = start + i * 1000.0
+        server.apply_flashcard_review(review, ts)
+        log.append(server.EVENT_FLASHCARD_REVIEWED, review, ts)
+    live = review_state(user_ids)
+
+    recovered = recover_into_fresh_process(tmp_path)
+    assert recovered.replayed_events == 3001
+    assert recovered.replay_errors == 0
+    assert review_state(user_ids) == live
+
+
+def test_replay_truncates_a_corrupt_tail(tmp_path, monkeypatch):
+    log = fresh_log(tmp_path)
+    monkeypatch.setattr(server, "event_log", log)
+    for i in range(10):
+        log.append(server.EVENT_FLASHCARD_REVIEWED,
+                   {"user_id": "torn-user", "flashcard_id": f"card-{i}", "difficulty": "good"}, time.time())
+    segment, = (tmp_path / "events").glob("events-*.log")
+    data = bytearray(segment.read_bytes())
+    data[-3] ^= 0xFF  # flip a byte in the last payload
+    segment.write_bytes(bytes(data))
+
+    recovered = recover_into_fresh_process(tmp_path)
+    assert recovered.replayed_events == 9
+    assert recovered.seq == 9
+    assert len(server.flashcard_progress_db.for_user("torn-user")) == 9
+    assert segment.stat().st_size < len(data)
+
+
+def test_review_replay_throughput(tmp_path, monkeypatch):
+    log = fresh_log(tmp_path)
+    monkeypatch.setattr(server, "event_log", log)
+    events = 200_000
+    start = time.time() - 30 * 86400
+    for i in range(events):
+        log.append(server.EVENT_FLASHCARD_REVIEWED, {"user_id": f"bench-user-{i % 5000}",
+                   "flashcard_id": f"card-{i % 300}", "difficulty": ("easy", "good", "hard")[i % 3]}, start + i * 10.0)
+
+    recovered = recover_into_fresh_process(tmp_path)
+    assert recovered.replayed_events == events
+    # About 180k reviews/s on a laptop-class core; the floor leaves room for slow CI
+    assert events / recovered.replay_seconds > 50_000
@@ -0,0 +1,64 @@
+from collections import Counter
+
+import server
+
+CATEGORIES = list(server.ExamBlueprint().category_weights)
+
+
+def make_pools(per_level=40, levels=(1, 2, 3), sizes=None):
+    """QuestionPools over the NCLEX categories; question IDs encode their stratum"""
+    pools = server.QuestionPools()
+    for index, category in enumerate(CATEGORIES):
+        count = (sizes or {}).get(category, per_level)
+        strata = {level: tuple(f"{index}:{level}:{n}" for n in range(count)) for level in levels}
+        pools.strata[(server.ALL_AREAS, category)] = strata
+    return pools
+
+
+def category_counts(question_ids):
+    return Counter(CATEGORIES[int(qid.split(":")[0])] for qid in question_ids)
+
+
+def test_apportion_uses_largest_remainders():
+    assert server.apportion(10, {"a": 0.5, "b": 0.3, "c": 0.2}) == {"a": 5, "b": 3, "c": 2}
+    assert server.apportion(7, {"a": 1, "b": 1, "c": 1}) == {"a": 3, "b": 2, "c": 2}
+    assert server.apportion(5, {"a": 0, "b": -1}) == {"a": 0, "b": 0}
+
+
+def test_form_follows_category_weights():
+    question_ids, _ = server.assemble_exam_form(server.ExamBlueprint(total_questions=50, seed=1), make_pools())
+    assert len(question_ids) == len(set(question_ids)) == 50
+    assert category_counts(question_ids) == {
+        "Safe and Effective Care Environment": 14,
+        "Health Promotion and Maintenance": 5,
+        "Psychosocial Integrity": 4,
+        "Physiological Integrity": 27,
+    }
+
+
+def test_difficulty_mix_is_applied_within_a_category():
+    blueprint = server.ExamBlueprint(total_questions=20, category_weights={CATEGORIES[0]: 1.0},
+                                     difficulty_mix={1: 0.5, 3: 0.5}, seed=2)
+    question_ids, _ = server.assemble_exam_form(blueprint, make_pools())
+    assert Counter(int(qid.split(":")[1]) for qid in question_ids) == {1: 10, 3: 10}
+
+
+def test_same_seed_reproduces_the_form():
+    pools = make_pools()
+    first, seed = server.assemble_exam_form(server.ExamBlueprint(total_questions=30), pools)
+    again, _ = server.assemble_exam_form(server.ExamBlueprint(total_questions=30, seed=seed), pools)
+    assert first == again
+
+
+def test_short_category_is_backfilled_from_the_others():
+    pools = make_pools(sizes={"Physiological Integrity": 2})
+    question_ids, _ = server.assemble_exam_form(server.ExamBlueprint(total_questions=60, seed=3), pools)
+    assert len(question_ids) == len(set(question_ids)) == 60
+    assert category_counts(question_ids)["Physiological Integrity"] == 6  # all of it (2 per level)
+
+
+def test_malformed_blueprint_is_a_client_error(client):
+    response = client.post("/api/quiz/start-advanced",
+                           json={"quiz_type": "exam", "settings": {"blueprint": {"total_questions": "lots"}}})
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"][-1] == "total_questions"
@@ -0,0 +1,23 @@
+import io
+import sys
+import time
+
+import pyarrow.parquet as pq
+
+import server
+
+
+def test_parquet_export_streams_a_readable_file(client):
+    server.apply_flashcard_review({"user_id": "export-user", "flashcard_id": "card-1", "difficulty": "good"}, time.time())
+    response = client.get("/api/exports/flashcard_progress", params={"format": "parquet"})
+    assert response.status_code == 200
+    table = pq.read_table(io.BytesIO(response.content))
+    assert "export-user" in table.column("user_id").to_pylist()
+
+
+def test_parquet_without_pyarrow_is_a_clear_client_error(client, monkeypatch):
+    monkeypatch.setitem(sys.modules, "pyarrow.parquet", None)  # makes the import fail
+    response = client.get("/api/exports/flashcard_progress", params={"format": "parquet"})
+    assert response.status_code == 400
+    assert "format=csv" in response.json()["detail"]
+    assert client.get("/api/exports/flashcard_progress", params={"format": "csv"}).status_code == 200
@@ -0,0 +1,71 @@
+from types import SimpleNamespace
+
+import pytest
+
+import server
+
+
+def question(question_type, correct, option_count=5, **fields):
+    options = [server.QuestionOption(id=letter, text=f"Option {letter}", is_correct=letter in correct)
+               for letter in "abcdefgh"[:option_count]]
+    return server.Question(question_text="?", question_type=question_type, options=options, **fields)
+
+
+def test_single_answer():
+    key = server.AnswerKey(question("multiple_choice", "c", correct_answer_id="c"))
+    assert key.grade("c") == (1, 1)
+    assert key.grade(["c"]) == (1, 1)
+    assert key.grade("a") == (0, 1)
+    assert key.grade(None) == (0, 1)
+    assert key.grade(["c", "a"]) == (0, 1)
+    assert key.correct_response(question("multiple_choice", "c")) == "c"
+
+
+@pytest.mark.parametrize("response, expected", [
+    (["a", "c", "d"], (3, 3)),
+    (["d", "a", "c"], (3, 3)),  # order doesn't matter
+    (["a", "c"], (2, 3)),
+    (["a", "c", "b"], (1, 3)),  # +2 -1
+    (["b", "e"], (0, 3)),  # floored at 0
+    (["a", "a", "c"], (0, 3)),  # repeated IDs
+    (["a", "z"], (0, 3)),  # unknown IDs
+])
+def test_select_all_that_apply_plus_minus(response, expected):
+    key = server.AnswerKey(question("sata", "acd"))
+    assert key.grade(response) == expected
+
+
+def test_select_all_that_apply_dichotomous():
+    key = server.AnswerKey(question("select_all", "acd", scoring="dichotomous"))
+    assert key.grade(["c", "d", "a"]) == (1, 1)
+    assert key.grade(["a", "c"]) == (0, 1)
+
+
+def test_ordered_response():
+    item = question("ordered_response", "", option_count=4, correct_answer_ids=["c", "a", "d", "b"])
+    assert server.AnswerKey(item).grade(["c", "a", "d", "b"]) == (1, 1)
+    assert server.AnswerKey(item).grade(["c", "a", "b", "d"]) == (0, 1)
+
+    item.scoring = "position"
+    key = server.AnswerKey(item)
+    assert key.grade(["c", "a", "b", "d"]) == (2, 4)
+    assert key.grade(["c", "a"]) == (2, 4)
+    assert key.correct_response(item) == ["c", "a", "d", "b"]
+
+
+def test_scoring_rule_that_does_not_fit_the_item_falls_back_to_all_or_nothing():
+    key = server.AnswerKey(question("multiple_choice", "b", scoring="plus_minus"))
+    assert key.scoring == "dichotomous" and key.max_points == 1
+
+
+def test_unkeyed_item_earns_nothing():
+    assert server.AnswerKey(question("sata", "")).grade(["a"]) == (0, 1)
+
+
+def test_unkeyed_item_is_not_counted_correct():
+    questions = {"keyed": question("sata", "ab"), "unkeyed": question("sata", "")}
+    content = SimpleNamespace(questions=questions, answer_keys=server.compile_answer_keys(questions))
+    grading = server.grade_answers(content, [{"question_id": "keyed", "selected_option_ids": ["a", "b"]},
+                                             {"question_id": "unkeyed", "selected_option_ids": []}], None)
+    assert [result["correct"] for result in grading["results"]] == [True, False]
+    assert (grading["correct"], grading["points"], grading["max_points"]) == (1, 2, 3)
@@ -0,0 +1,54 @@
+import math
+
+import pytest
+
+import server
+
+
+def first_question():
+    question = next(iter(server.catalog.questions.values()))
+    return question.id, server.catalog.answer_keys[question.id].correct_response(question)
+
+
+@pytest.mark.parametrize("time_spent", ["abc", "nan", "inf", -5, True, [1], {"s": 1}])
+def test_invalid_answer_times_are_ignored(client, time_spent):
+    question_id, response = first_question()
+    before = server.item_stats.get(question_id)
+    responses, timed = (before.responses, before.timed) if before else (0, 0)
+    seq = server.event_log.seq
+
+    body = {"study_area_id": "fundamentals",
+            "answers": [{"question_id": question_id, "selected_answer": response, "time_spent": time_spent}]}
+    assert client.post("/api/submit-quiz", json=body).status_code == 200
+    stats = server.item_stats[question_id]
+    assert (stats.responses, stats.timed) == (responses + 1, timed)
+    assert server.event_log.seq == seq + 1
+
+    response_body = client.post("/api/quiz/untimed-quiz/submit-advanced",
+                                json={"answers": body["answers"], "time_spent": "abc"})
+    assert response_body.status_code == 200
+
+
+def test_valid_answer_time_is_recorded(client):
+    question_id, response = first_question()
+    body = {"study_area_id": "fundamentals",
+            "answers": [{"question_id": question_id, "selected_answer": response, "time_spent": "12.5"}]}
+    before = server.item_stats[question_id].timed if question_id in server.item_stats else 0
+    assert client.post("/api/submit-quiz", json=body).status_code == 200
+    assert server.item_stats[question_id].timed == before + 1
+
+
+def test_finite_seconds():
+    assert server.finite_seconds(3) == 3.0
+    assert server.finite_seconds("4.5") == 4.5
+    assert server.finite_seconds(0) == 0.0
+    for value in (None, "abc", -1, math.nan, math.inf, True, [2]):
+        assert server.finite_seconds(value) is None
+    assert server.answer_seconds({"time_spent": "x"}, 60, 4) == 15.0
+    assert server.answer_seconds({}, "abc", 4) is None
+
+
+def test_replaying_a_bad_time_from_an_old_log_does_not_fail():
+    stats = server.ItemStats()
+    stats.update("a", True, None, "abc")
+    assert (stats.responses, stats.timed) == (1, 0)
@@ -0,0 +1,59 @@
+import random
+
+import numpy as np
+
+import server
+
+WORDS = ("patient nurse client priority assess dose insulin heart rate pain fluid sodium potassium airway "
+         "oxygen wound infection fever breathing position bed report family teaching medication order").split()
+
+
+def make_question(question_id, text, options):
+    return server.Question(id=question_id, question_text=text,
+                           options=[server.QuestionOption(id=f"{question_id}-{n}", text=option)
+                                    for n, option in enumerate(options)])
+
+
+def random_question(rng, question_id):
+    return make_question(question_id, " ".join(rng.choices(WORDS, k=25)),
+                         [" ".join(rng.choices(WORDS, k=5)) for _ in range(4)])
+
+
+def test_signature_ignores_ids_and_option_order():
+    original = make_question("q1", "Which client should the nurse assess first?", ["A", "B", "C", "D"])
+    copy = make_question("q2", "Which client should the nurse assess first?", ["D", "C", "B", "A"])
+    first, second = server.minhash_signatures([server.question_shingles(original), server.question_shingles(copy)])
+    assert (first == second).all()
+
+
+def test_signature_agreement_estimates_jaccard_similarity():
+    rng = np.random.default_rng(1)
+    shared = rng.integers(0, 2 ** 32, 300).tolist()
+    a = shared + rng.integers(0, 2 ** 32, 100).tolist()
+    b = shared + rng.integers(0, 2 ** 32, 100).tolist()
+    signatures = server.minhash_signatures([a, b])
+    assert abs((signatures[0] == signatures[1]).mean() - 300 / 500) < 0.15
+
+
+def test_near_duplicates_are_clustered_under_the_first_question():
+    rng = random.Random(3)
+    bank = {f"q{n}": random_question(rng, f"q{n}") for n in range(300)}
+    base = bank["q10"]
+    # A re-import with fresh IDs and a one-word edit, placed after the original
+    reworded = base.question_text.split()
+    reworded[12] = "caregiver"
+    bank["copy-a"] = make_question("copy-a", base.question_text, [o.text for o in reversed(base.options)])
+    bank["copy-b"] = make_question("copy-b", " ".join(reworded), [o.text for o in base.options])
+
+    clusters = server.find_near_duplicates(bank)
+    assert len(clusters) == 1
+    assert clusters[0]["kept"] == "q10"
+    duplicates = {d["question_id"]: d["similarity"] for d in clusters[0]["duplicates"]}
+    assert duplicates.keys() == {"copy-a", "copy-b"}
+    assert duplicates["copy-a"] == 1.0 and duplicates["copy-b"] >= server.DEDUP_THRESHOLD
+
+
+def test_small_banks():
+    assert server.find_near_duplicates({}) == []
+    only = make_question("only", "A single question", ["yes", "no"])
+    assert server.find_near_duplicates({"only": only}) == []
@@ -0,0 +1,20 @@
+import json
+
+import server
+
+
+def test_area_questions_are_the_rendered_question_list(client):
+    response = client.get("/api/study-areas/fundamentals/questions")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/json"
+    questions = json.loads(response.content)
+    assert questions
+    assert [q["id"] for q in questions] == list(server.catalog.pools.by_area["fundamentals"])
+    assert all(server.Question(**q) for q in questions)
+
+
+def test_area_questions_schema_is_documented(client):
+    operation = client.get("/openapi.json").json()["paths"]["/api/study-areas/{area_id}/questions"]["get"]
+    schema = operation["responses"]["200"]["content"]["application/json"]["schema"]
+    assert schema["type"] == "array"
+    assert schema["items"] == {"$ref": "#/components/schemas/Question"}
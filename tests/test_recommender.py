@@ -0,0 +1,47 @@
+import asyncio
+
+import numpy as np
+
+import server
+
+
+def two_cohorts(users_per_cohort=200):
+    """Cohort A is strong in area 0 and weak in area 1; cohort B the reverse. Both are middling in area 2"""
+    attempts = np.full((2 * users_per_cohort + 1, 3), 20, dtype=np.float32)
+    correct = np.zeros_like(attempts)
+    correct[:users_per_cohort] = (18, 4, 10)
+    correct[users_per_cohort:2 * users_per_cohort] = (4, 18, 10)
+    # The target has not answered area 1 and looks like cohort A elsewhere
+    attempts[-1] = (20, 0, 20)
+    correct[-1] = (18, 0, 10)
+    return attempts, correct
+
+
+def test_sampled_neighbours_predict_unseen_area():
+    attempts, correct = two_cohorts()
+    target = np.array([len(attempts) - 1])
+    estimates, prior = server.predict_area_mastery(attempts, correct, target, neighbors=10, candidates=50)
+    assert estimates.shape == (1, 3)
+    assert estimates[0, 1] < prior[1] < estimates[0, 0]
+
+
+def test_candidate_pool_bounds_the_similarity_matrix(monkeypatch):
+    attempts, correct = two_cohorts(users_per_cohort=2000)
+    shapes = []
+    real_partition = np.partition
+    monkeypatch.setattr(np, "partition", lambda a, *args, **kwargs: shapes.append(a.shape) or real_partition(a, *args, **kwargs))
+    server.predict_area_mastery(attempts, correct, np.arange(len(attempts)), neighbors=10, candidates=100)
+    assert shapes and all(shape[1] == 100 for shape in shapes)
+
+
+def test_refresh_processes_at_most_max_batch(monkeypatch):
+    monkeypatch.setattr(server, "RECOMMENDER_MAX_BATCH", 3)
+    recommender = server.StudyRecommender(server.MasteryMatrix())
+    for i in range(5):
+        recommender.matrix.record(f"batch-user-{i}", "fundamentals", [(f"q{i}", "a", i % 2 == 0, None)])
+
+    assert asyncio.run(recommender.refresh()) == 3
+    assert len(recommender.matrix.dirty) == 2
+    assert asyncio.run(recommender.refresh()) == 2
+    assert not recommender.matrix.dirty
+    assert len(recommender.results) == 5
@@ -0,0 +1,56 @@
+import random
+
+import pytest
+
+import server
+
+
+def test_percentile_and_rank_match_a_sorted_list():
+    rng = random.Random(7)
+    scores = [round(rng.uniform(0, 100), 1) for _ in range(2000)] + [0.0, 100.0, 100.0]
+    distribution = server.ScoreDistribution()
+    for score in scores:
+        distribution.add(score)
+
+    for probe in [0.0, 0.1, 12.3, 50.0, 77.7, 99.9, 100.0]:
+        below = sum(score < probe for score in scores)
+        above = sum(score > probe for score in scores)
+        assert distribution.percentile(probe) == pytest.approx(below / len(scores) * 100)
+        assert distribution.rank(probe) == above + 1
+
+
+def test_top_groups_the_best_scores_by_bucket():
+    distribution = server.ScoreDistribution()
+    for score in [40.0, 90.0, 90.0, 100.0, 75.5, 90.04]:  # 90.04 rounds into the 90.0 bucket
+        distribution.add(score)
+    assert distribution.top(1) == [{"score": 100.0, "count": 1}]
+    assert distribution.top(3) == [{"score": 100.0, "count": 1}, {"score": 90.0, "count": 3}]
+    assert [entry["score"] for entry in distribution.top(10)] == [100.0, 90.0, 75.5, 40.0]
+
+
+def test_empty_distribution():
+    distribution = server.ScoreDistribution()
+    assert distribution.percentile(50) == 0.0
+    assert distribution.rank(50) == 1
+    assert distribution.top(5) == []
+
+
+def test_record_score_returns_the_percentile_before_adding():
+    area = "fenwick-test-area"
+    assert server.record_score(area, 60) == 0.0
+    assert server.record_score(area, 80) == 100.0
+    assert server.record_score(area, 70) == 50.0
+    assert server.score_distributions[area].total == 3
+
+
+@pytest.mark.parametrize("score", ["nan", "inf", "-inf", "abc"])
+def test_ranking_rejects_non_finite_scores(client, score):
+    server.record_score("ranking-area", 50)
+    assert client.get("/api/rankings/ranking-area", params={"score": score}).status_code == 422
+
+
+def test_ranking_clamps_out_of_range_scores(client):
+    server.record_score("ranking-area", 50)
+    high = client.get("/api/rankings/ranking-area", params={"score": 1e6}).json()
+    assert high["rank"] == 1
+    assert client.get("/api/rankings/ranking-area", params={"score": -1e6}).json()["percentile"] == 0.0
@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+
+import server
+
+
+def counting_compute(calls, result="value", delay=0.05):
+    async def compute():
+        calls.append(result)
+        await asyncio.sleep(delay)
+        return result
+    return compute
+
+
+def test_concurrent_identical_calls_share_one_computation():
+    flight = server.SingleFlight(ttl=0)
+    calls = []
+
+    async def scenario():
+        return await asyncio.gather(*(flight.run(("route", 1), counting_compute(calls)) for _ in range(20)),
+                                    flight.run(("route", 2), counting_compute(calls, "other")))
+
+    results = asyncio.run(scenario())
+    assert results == ["value"] * 20 + ["other"]
+    assert calls == ["value", "other"]
+    stats = flight.stats()
+    assert (stats["requests"], stats["computations"], stats["computations_saved"]) == (21, 2, 19)
+    assert stats["routes"]["route"]["coalesced"] == 19
+    assert not flight.in_flight and not flight.cache  # ttl 0 keeps nothing
+
+
+def test_results_are_cached_for_the_ttl(monkeypatch):
+    flight = server.SingleFlight(ttl=5)
+    calls = []
+    clock = [1000.0]
+    monkeypatch.setattr(server.time, "monotonic", lambda: clock[0])
+
+    async def scenario():
+        await flight.run(("route",), counting_compute(calls, delay=0))
+        await flight.run(("route",), counting_compute(calls, delay=0))
+        clock[0] += 6
+        await flight.run(("route",), counting_compute(calls, delay=0))
+
+    asyncio.run(scenario())
+    assert len(calls) == 2
+    assert flight.stats()["routes"]["route"]["cache_hits"] == 1
+
+
+def test_failures_reach_every_waiter_and_are_not_cached():
+    flight = server.SingleFlight(ttl=5)
+    attempts = []
+
+    async def failing():
+        attempts.append(1)
+        await asyncio.sleep(0.01)
+        raise RuntimeError("boom")
+
+    async def scenario():
+        results = await asyncio.gather(*(flight.run(("route",), failing) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results)
+        with pytest.raises(RuntimeError):
+            await flight.run(("route",), failing)
+
+    asyncio.run(scenario())
+    assert len(attempts) == 2
+    assert not flight.cache and not flight.in_flight
+
+
+def test_cancelled_leader_does_not_cancel_the_others():
+    flight = server.SingleFlight(ttl=0)
+    calls = []
+
+    async def scenario():
+        leader = asyncio.ensure_future(flight.run(("route",), counting_compute(calls)))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.run(("route",), counting_compute(calls)))
+        await asyncio.sleep(0)
+        leader.cancel()
+        return await follower
+
+    assert asyncio.run(scenario()) == "value"
+    assert calls == ["value"]
+
+
+def test_endpoint_reports_coalescing(client):
+    def flashcard_set_requests():
+        route = client.get("/api/admin/coalescing").json()["routes"].get("flashcard-sets", {})
+        return route.get("computations", 0) + route.get("coalesced", 0) + route.get("cache_hits", 0)
+
+    before = flashcard_set_requests()
+    first = client.get("/api/flashcard-sets")
+    assert first.status_code == 200
+    assert client.get("/api/flashcard-sets").content == first.content
+    assert flashcard_set_requests() == before + 2
@@ -0,0 +1,186 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException
+
+import server
+
+
+class StripeError(Exception):
+    """Shaped like stripe's errors, which carry the HTTP status"""
+
+    def __init__(self, message, http_status=None):
+        super().__init__(message)
+        self.http_status = http_status
+
+
+class APIConnectionError(StripeError):
+    pass
+
+
+class FakeStripe:
+    """Stand-in for StripeCheckout: each call pops the next scripted behaviour"""
+
+    def __init__(self):
+        self.script = []
+        self.calls = 0
+
+    async def get_checkout_status(self, session_id):
+        self.calls += 1
+        behaviour = self.script.pop(0) if self.script else "ok"
+        if behaviour == "fail":
+            raise StripeError("stripe is down", http_status=503)
+        if behaviour == "unreachable":
+            raise APIConnectionError("connection reset")
+        if behaviour == "reject":
+            raise StripeError("No such price: 'price_typo'", http_status=400)
+        if behaviour == "bug":
+            raise KeyError("url")
+        if behaviour == "hang":
+            await asyncio.sleep(3600)
+        return {"session_id": session_id}
+
+
+@pytest.fixture
+def fake_stripe(monkeypatch):
+    fake = FakeStripe()
+    monkeypatch.setattr(server, "_stripe_client", fake)
+    monkeypatch.setattr(server, "stripe_breaker", server.CircuitBreaker(failure_threshold=2, reset_timeout=0.05))
+    monkeypatch.setattr(server, "STRIPE_TIMEOUT_SECONDS", 0.2)
+    return fake
+
+
+def call():
+    return server.call_stripe("get_checkout_status", "cs_test")
+
+
+def test_opens_after_consecutive_failures_and_rejects(fake_stripe):
+    async def scenario():
+        fake_stripe.script = ["fail", "fail"]
+        for _ in range(2):
+            with pytest.raises(StripeError):
+                await call()
+        assert server.stripe_breaker.state == "open"
+        with pytest.raises(HTTPException) as rejected:
+            await call()
+        assert rejected.value.status_code == 503
+        assert fake_stripe.calls == 2  # rejected without calling Stripe
+
+    asyncio.run(scenario())
+
+
+def test_half_open_trial_success_closes(fake_stripe):
+    async def scenario():
+        fake_stripe.script = ["fail", "fail"]
+        for _ in range(2):
+            with pytest.raises(StripeError):
+                await call()
+        await asyncio.sleep(0.06)
+        assert server.stripe_breaker.state == "half_open"
+        assert await call() == {"session_id": "cs_test"}
+        assert server.stripe_breaker.state == "closed"
+
+    asyncio.run(scenario())
+
+
+def test_half_open_trial_failure_reopens(fake_stripe):
+    async def scenario():
+        fake_stripe.script = ["fail", "fail", "fail"]
+        for _ in range(2):
+            with pytest.raises(StripeError):
+                await call()
+        await asyncio.sleep(0.06)
+        with pytest.raises(StripeError):
+            await call()
+        assert server.stripe_breaker.state == "open"
+
+    asyncio.run(scenario())
+
+
+def test_only_one_trial_while_half_open(fake_stripe):
+    breaker = server.stripe_breaker
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.opened_at = time.monotonic() - 1
+    assert breaker.allow() is True
+    assert breaker.allow() is False
+
+
+def test_timeout_counts_as_failure(fake_stripe):
+    async def scenario():
+        fake_stripe.script = ["hang"]
+        with pytest.raises(HTTPException) as timed_out:
+            await call()
+        assert timed_out.value.status_code == 504
+        assert server.stripe_breaker.failures == 1
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_trial_releases_half_open_slot(fake_stripe):
+    async def scenario():
+        fake_stripe.script = ["fail", "fail", "hang"]
+        for _ in range(2):
+            with pytest.raises(StripeError):
+                await call()
+        await asyncio.sleep(0.06)
+        trial = asyncio.ensure_future(call())
+        await asyncio.sleep(0.01)
+        trial.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+        assert server.stripe_breaker.trial_in_progress is False
+        # The next caller gets the trial, and success closes the breaker
+        assert await call() == {"session_id": "cs_test"}
+        assert server.stripe_breaker.state == "closed"
+
+    asyncio.run(scenario())
+
+
+def test_connection_errors_count_as_failures(fake_stripe):
+    async def scenario():
+        fake_stripe.script = ["unreachable", "unreachable"]
+        for _ in range(2):
+            with pytest.raises(APIConnectionError):
+                await call()
+        assert server.stripe_breaker.state == "open"
+
+    asyncio.run(scenario())
+
+
+def test_client_errors_do_not_open_the_breaker(fake_stripe):
+    async def scenario():
+        fake_stripe.script = ["reject"] * 5 + ["bug"] * 5
+        for _ in range(5):
+            with pytest.raises(StripeError):
+                await call()
+        for _ in range(5):
+            with pytest.raises(KeyError):
+                await call()
+        assert server.stripe_breaker.state == "closed"
+        assert server.stripe_breaker.total_failures == 0
+
+    asyncio.run(scenario())
+
+
+def test_client_error_on_the_half_open_trial_closes_the_breaker(fake_stripe):
+    async def scenario():
+        fake_stripe.script = ["fail", "fail", "reject"]
+        for _ in range(2):
+            with pytest.raises(StripeError):
+                await call()
+        await asyncio.sleep(0.06)
+        with pytest.raises(StripeError):
+            await call()
+        assert server.stripe_breaker.state == "closed"
+
+    asyncio.run(scenario())
+
+
+def test_stripe_client_leaves_global_settings_alone(monkeypatch):
+    monkeypatch.setattr(server, "_stripe_client", None)
+    stripe = pytest.importorskip("stripe")
+    before = getattr(stripe, "default_http_client", None)
+    server.get_stripe_client()
+    assert getattr(stripe, "default_http_client", None) is before
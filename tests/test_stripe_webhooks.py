@@ -0,0 +1,134 @@
+import hashlib
+import hmac
+import json
+import os
+import time
+
+import server
+
+SECRET = "whsec_test"
+
+
+def checkout_event(event_id, user_id, tier="lifetime"):
+    return {"id": event_id, "type": "checkout.session.completed",
+            "data": {"object": {"id": f"cs_{event_id}", "metadata": {"user_id": user_id, "tier": tier}}}}
+
+
+def signed_headers(body: bytes, secret=SECRET):
+    timestamp = int(time.time())
+    signature = hmac.new(secret.encode(), f"{timestamp}.".encode() + body, hashlib.sha256).hexdigest()
+    return {"Stripe-Signature": f"t={timestamp},v1={signature}", "Content-Type": "application/json"}
+
+
+def tier_of(client, user_id):
+    return client.get("/api/subscription/status", headers={"X-User-Id": user_id}).json()["tier"]
+
+
+def wait_for_tier(client, user_id, tier):
+    deadline = time.monotonic() + 5
+    while tier_of(client, user_id) != tier and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return tier_of(client, user_id)
+
+
+def test_webhooks_are_refused_without_a_signing_secret(client, monkeypatch):
+    monkeypatch.setattr(server, "STRIPE_WEBHOOK_SECRET", None)
+    response = client.post("/api/webhooks/stripe", json=checkout_event("evt_unsigned", "unsigned-user"))
+    assert response.status_code == 503
+    assert tier_of(client, "unsigned-user") == "free"
+
+
+def test_only_signed_webhooks_are_applied(client, monkeypatch):
+    monkeypatch.setattr(server, "STRIPE_WEBHOOK_SECRET", SECRET)
+    body = json.dumps(checkout_event("evt_signed", "signed-user")).encode()
+    assert client.post("/api/webhooks/stripe", content=body).status_code == 400
+    assert client.post("/api/webhooks/stripe", content=body, headers=signed_headers(body, "whsec_other")).status_code == 400
+    assert client.post("/api/webhooks/stripe", content=body, headers=signed_headers(body)).status_code == 200
+    assert wait_for_tier(client, "signed-user", "lifetime") == "lifetime"
+
+
+def queued(event_id, user_id, received_at=None, **fields):
+    return {**checkout_event(event_id, user_id, **fields), "received_at": received_at or time.time()}
+
+
+def test_failed_event_is_not_logged_and_is_retried(client, monkeypatch):
+    real_apply = server.apply_stripe_event
+    failures = ["once"]
+
+    def flaky_apply(event):
+        if failures:
+            failures.pop()
+            raise RuntimeError("store unavailable")
+        return real_apply(event)
+
+    def scenario():
+        # Runs on the app loop, so the webhook worker can't retry in between
+        seq = server.event_log.seq
+        server.apply_stripe_event_batch([(queued("evt_flaky", "flaky-user"), server.webhook_queue.read_offset)])
+        assert "evt_flaky" in server.webhook_queue.dead_letters
+        assert "evt_flaky" not in server.webhook_queue.processed_ids
+        assert server.event_log.seq == seq  # only applied events are logged
+
+        assert server.retry_dead_letters() == set()  # still backing off
+        server.webhook_queue.dead_letters["evt_flaky"][3] = 0
+        assert server.retry_dead_letters() == {"flaky-user"}
+        assert "evt_flaky" not in server.webhook_queue.dead_letters
+        assert "evt_flaky" in server.webhook_queue.processed_ids
+        assert server.event_log.seq == seq + 1
+
+    monkeypatch.setattr(server, "apply_stripe_event", flaky_apply)
+    client.portal.call(scenario)
+
+
+def test_compaction_drops_covered_lines_but_keeps_dead_letters(tmp_path):
+    queue = server.WebhookQueue(str(tmp_path / "webhooks.jsonl"))
+    for n in range(4):
+        queue.append(queued(f"evt_{n}", "compact-user"))
+    batch = queue.read_batch(10)
+    queue.read_offset = batch[-1][1]
+    queue.dead_letters["evt_0"] = [batch[0][0], batch[0][1], 1, 0.0]
+    queue.processed_ids = {"evt_1": time.time(), "evt_ancient": time.time() - server.WEBHOOK_DEDUP_SECONDS - 1}
+
+    queue.compact(batch[2][1])  # a snapshot covers events 0-2
+    with open(queue.path) as f:
+        assert [json.loads(line)["id"] for line in f] == ["evt_0", "evt_3"]
+    assert queue.read_offset == (tmp_path / "webhooks.jsonl").stat().st_size
+    assert queue.dead_letters["evt_0"][1] == 0
+    assert list(queue.processed_ids) == ["evt_1"]
+
+    queue.read_offset = 0
+    assert [event["id"] for event, _ in queue.read_batch(10)] == ["evt_0", "evt_3"]  # a restart retries evt_0
+
+
+def test_users_are_resolved_by_customer_and_email():
+    event = {"id": "evt_lookup", "type": "checkout.session.completed",
+             "data": {"object": {"id": "cs_lookup", "customer": "cus_lookup", "customer_email": "lookup@example.com"}}}
+    user_id = server.apply_stripe_event(event)
+    assert server._resolve_user(None, None, "cus_lookup").id == user_id
+    assert server._resolve_user(None, "lookup@example.com", None).id == user_id
+
+    server.user_lookup.clear()
+    server.rebuild_user_lookup()
+    assert server._resolve_user(None, None, "cus_lookup").id == user_id
+
+
+def test_snapshot_lets_the_worker_compact_the_queue(client, monkeypatch):
+    monkeypatch.setattr(server, "STRIPE_WEBHOOK_SECRET", SECRET)
+    for n in range(3):
+        body = json.dumps(checkout_event(f"evt_compact_{n}", "compacting-user", tier="premium")).encode()
+        assert client.post("/api/webhooks/stripe", content=body, headers=signed_headers(body)).status_code == 200
+    assert wait_for_tier(client, "compacting-user", "premium") == "premium"
+    deadline = time.monotonic() + 5
+    while server.webhook_queue.stats()["backlog_events"] and time.monotonic() < deadline:
+        time.sleep(0.02)
+
+    compactions = server.webhook_queue.compactions
+    client.post("/api/admin/event-log/snapshot")
+    client.portal.call(server.webhook_queue.wakeup.set)
+    deadline = time.monotonic() + 5
+    while server.webhook_queue.compactions == compactions and time.monotonic() < deadline:
+        time.sleep(0.02)
+    with open(server.webhook_queue.path) as f:
+        remaining = [json.loads(line)["id"] for line in f]
+    assert not any(event_id.startswith("evt_compact_") for event_id in remaining)
+    assert server.webhook_queue.read_offset == os.path.getsize(server.webhook_queue.path)
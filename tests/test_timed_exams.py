@@ -0,0 +1,92 @@
+import pytest
+
+import server
+
+
+def run_wheel(wheel, ticks):
+    for _ in range(ticks):
+        wheel.advance()
+
+
+def test_timers_fire_on_their_tick_across_levels():
+    wheel = server.TimerWheel(tick_seconds=1)
+    fired = {}
+    delays = [1, 5, 255, 256, 300, 16383, 16384, 70000]
+    for delay in delays:
+        wheel.schedule(delay, delay, lambda delay=delay: fired.setdefault(delay, wheel.current))
+    run_wheel(wheel, max(delays) + 10)
+    assert fired == {delay: delay for delay in delays}
+    assert len(wheel) == 0 and wheel.fired == len(delays)
+
+
+def test_cancel_and_reschedule():
+    wheel = server.TimerWheel(tick_seconds=1)
+    fired = []
+    wheel.schedule("cancelled", 10, lambda: fired.append("cancelled"))
+    wheel.schedule("moved", 10, lambda: fired.append("moved-early"))
+    wheel.schedule("moved", 600, lambda: fired.append("moved"))
+    assert wheel.cancel("cancelled") and not wheel.cancel("cancelled")
+    run_wheel(wheel, 599)
+    assert fired == []
+    wheel.advance()
+    assert fired == ["moved"]
+
+
+def test_failing_callback_does_not_stop_the_wheel():
+    wheel = server.TimerWheel(tick_seconds=1)
+    fired = []
+    wheel.schedule("broken", 3, lambda: 1 / 0)
+    wheel.schedule("fine", 3, lambda: fired.append("fine"))
+    run_wheel(wheel, 3)
+    assert fired == ["fine"]
+
+
+@pytest.mark.parametrize("time_limit", ["soon", -5, 0, 10_000])
+def test_invalid_time_limit_is_rejected(client, time_limit):
+    response = client.post("/api/quiz/start-advanced", json={"study_area": "fundamentals", "time_limit": time_limit})
+    assert response.status_code == 422
+    response = client.post("/api/quiz/start-advanced",
+                           json={"study_area": "fundamentals", "settings": {"time_limit": time_limit}})
+    assert response.status_code == 422
+
+
+def test_time_limit_starts_a_timed_session(client):
+    response = client.post("/api/quiz/start-advanced", json={"study_area": "fundamentals", "time_limit": 30})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["time_limit"] == 1800
+    assert ("exam", body["quiz_id"]) in server.timer_wheel.locations
+
+
+def start_timed_exam(client):
+    response = client.post("/api/quiz/start-advanced", json={"study_area": "fundamentals", "time_limit": 30})
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_timed_exam_questions_carry_no_answer_keys(client):
+    questions = start_timed_exam(client)["questions"]
+    assert questions
+    for question in questions:
+        assert not {"correct_answer_id", "correct_answer_ids", "explanation", "scoring"} & question.keys()
+        assert all(set(option) == {"id", "text"} for option in question["options"])
+
+
+@pytest.mark.parametrize("body", [{"answers": [1, 2]}, {"answers": "abc"}, {"answers": [{"selected_answer": "a"}]},
+                                  {"answers": [{"question_id": ["q"]}]}, [1, 2]])
+def test_malformed_answers_are_rejected(client, body):
+    quiz_id = start_timed_exam(client)["quiz_id"]
+    assert client.post(f"/api/quiz/{quiz_id}/answers", json=body).status_code == 422
+    assert client.post(f"/api/quiz/{quiz_id}/submit-advanced", json=body).status_code == 422
+    assert client.post("/api/quiz/untimed-quiz/submit-advanced", json=body).status_code == 422
+
+
+def test_answers_are_saved_singly_or_in_batches(client):
+    exam = start_timed_exam(client)
+    first, second = exam["questions"][:2]
+    quiz_id = exam["quiz_id"]
+    single = {"question_id": first["id"], "selected_option_id": first["options"][0]["id"]}
+    assert client.post(f"/api/quiz/{quiz_id}/answers", json=single).status_code == 200
+    batch = {"answers": [{"question_id": second["id"], "selected_answer": second["options"][0]["id"]}]}
+    assert client.post(f"/api/quiz/{quiz_id}/answers", json=batch).status_code == 200
+    assert set(server.exam_sessions[quiz_id].answers) == {first["id"], second["id"]}